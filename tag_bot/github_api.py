@@ -1,11 +1,15 @@
 import random
 import string
 
-import jmespath
 from loguru import logger
-from requests import put
 
-from .http_requests import get_request, patch_request, post_request
+from .http_requests import (
+    get_paginated_request,
+    get_request,
+    patch_request,
+    post_request,
+    put_request,
+)
 
 
 class GitHubAPI:
@@ -18,6 +22,95 @@ class GitHubAPI:
         )
         self.fork_exists = False
 
+    def _get_push_api_url(self):
+        """Get the API URL of the repository that branches and commits are pushed
+        to. This is the user's fork if one exists, otherwise the parent repository.
+
+        Returns:
+            str: The API URL of the repository
+        """
+        if self.fork_exists and (self.inputs.push_to_users_fork is not None):
+            return self.fork_api_url
+
+        return self.api_url
+
+    def _set_fork_api_url(self):
+        """Set the API URL of the fork in the user's account"""
+        self.fork_api_url = "/".join(
+            [
+                "https://api.github.com",
+                "repos",
+                self.inputs.push_to_users_fork,
+                self.inputs.repository.split("/")[-1],
+            ]
+        )
+
+    def _describe_update(self, key):
+        """Describe the bump of an image in the body of the Pull Request. An image
+        used with several tag filters is described once per filter.
+
+        Args:
+            key (tuple): The key of the image being bumped
+
+        Returns:
+            str: A Markdown list item naming the image, every out of date tag it
+                is pinned to, and the tag it is bumped to
+        """
+        image, _ = key
+        image_tags = self.inputs.image_tags[key]
+        latest = image_tags["latest"]
+        outdated = [
+            tag for tag in dict.fromkeys(image_tags["paths"].values()) if tag != latest
+        ]
+        return f"- `{image}`: `{'`, `'.join(outdated)}` -> `{latest}`"
+
+    def _build_pull_request(self):
+        """Build the payload describing the Pull Request to create or update
+
+        Returns:
+            dict: The Pull Request payload
+        """
+        pr = {
+            "title": "Bumping Docker image tags in JupyterHub config",
+            "body": (
+                "This Pull Request is bumping the Docker tags for the following images to the listed versions.\n\n"
+                + "\n".join(
+                    [self._describe_update(key) for key in self.inputs.images_to_update]
+                )
+            ),
+            "base": self.inputs.base_branch,
+        }
+
+        if self.pr_exists:
+            pr["state"] = "open"
+        elif self.fork_exists and (self.inputs.push_to_users_fork is not None):
+            pr["head"] = ":".join(
+                [self.inputs.push_to_users_fork, self.inputs.head_branch]
+            )
+        else:
+            pr["head"] = self.inputs.head_branch
+
+        return pr
+
+    def _set_existing_pull_request(self, match):
+        """Record whether a relevant Pull Request is already open
+
+        Args:
+            match (dict): The Pull Request opened from the head branch, or None
+        """
+        if match is None:
+            logger.info(
+                "No relevant Pull Requests found. A new Pull Request will be opened."
+            )
+            random_id = "".join(random.sample(string.ascii_letters, 4))
+            self.inputs.head_branch = "/".join([self.inputs.head_branch, random_id])
+            self.pr_exists = False
+        else:
+            logger.info("Pull Request found!")
+            self.inputs.head_branch = match["head"]["label"].split(":")[-1]
+            self.pr_number = match["number"]
+            self.pr_exists = True
+
     def _assign_labels(self, pr_url):
         """Assign labels to an open Pull Request. The labels must already exist in
         the repository.
@@ -29,8 +122,12 @@ class GitHubAPI:
         logger.info("Assigning labels to Pull Request: {}", pr_url)
         logger.info("Assigning labels: {}", self.inputs.labels)
         url = "/".join([pr_url, "labels"])
+        # Adding labels that are already present is a no-op, so it is safe to retry
         post_request(
-            url, headers=self.inputs.headers, json={"labels": self.inputs.labels}
+            url,
+            headers=self.inputs.headers,
+            json={"labels": self.inputs.labels},
+            retry=True,
         )
 
     def _assign_reviewers(self, pr_url):
@@ -51,11 +148,7 @@ class GitHubAPI:
             body["team_reviewers"] = self.inputs.team_reviewers
 
         url = "/".join([pr_url, "requested_reviewers"])
-        post_request(
-            url,
-            headers=self.inputs.headers,
-            json=body,
-        )
+        post_request(url, headers=self.inputs.headers, json=body, retry=True)
 
     def check_fork_exists(self):
         """
@@ -63,12 +156,12 @@ class GitHubAPI:
         self.inputs.headers) has a fork of the parent repository or not
         """
         url = "/".join([self.api_url, "forks"])
-        resp = get_request(url, headers=self.inputs.headers, output="json")
-
-        forks = jmespath.search("[*].full_name", resp)
+        forks = get_paginated_request(
+            url, headers=self.inputs.headers, params={"per_page": 100}
+        )
 
         for fork in forks:
-            self.fork_exists = self.inputs.push_to_users_fork in fork
+            self.fork_exists = self.inputs.push_to_users_fork in fork["full_name"]
             if self.fork_exists:
                 break
 
@@ -82,10 +175,7 @@ class GitHubAPI:
         """
         logger.info("Committing changes to file: {}", self.inputs.config_path)
 
-        if self.fork_exists and (self.inputs.push_to_users_fork is not None):
-            url = "/".join([self.fork_api_url, "contents", self.inputs.config_path])
-        else:
-            url = "/".join([self.api_url, "contents", self.inputs.config_path])
+        url = "/".join([self._get_push_api_url(), "contents", self.inputs.config_path])
 
         body = {
             "message": commit_msg,
@@ -93,7 +183,9 @@ class GitHubAPI:
             "sha": self.inputs.sha,
             "branch": self.inputs.head_branch,
         }
-        put(url, json=body, headers=self.inputs.headers)
+        # If a retried commit conflicts with the file's SHA, the first attempt
+        # has already updated the file
+        put_request(url, headers=self.inputs.headers, json=body, conflict_ok=True)
 
     def create_fork(self):
         """
@@ -101,16 +193,10 @@ class GitHubAPI:
         fork is determined by the owner of GITHUB_TOKEN stored in self.inputs.headers.
         """
         url = "/".join([self.api_url, "forks"])
-        post_request(url, headers=self.inputs.headers)
+        # GitHub returns the existing fork if one has already been created
+        post_request(url, headers=self.inputs.headers, retry=True)
 
-        self.fork_api_url = "/".join(
-            [
-                "https://api.github.com",
-                "repos",
-                self.inputs.push_to_users_fork,
-                self.inputs.repository.split("/")[-1],
-            ]
-        )
+        self._set_fork_api_url()
 
     def create_ref(self, ref, sha):
         """Create a new git reference (specifically, a branch) with GitHub's git database
@@ -123,39 +209,25 @@ class GitHubAPI:
         """
         logger.info("Creating new branch: {}", ref)
 
-        if self.fork_exists and (self.inputs.push_to_users_fork is not None):
-            url = "/".join([self.fork_api_url, "git", "refs"])
-        else:
-            url = "/".join([self.api_url, "git", "refs"])
+        url = "/".join([self._get_push_api_url(), "git", "refs"])
 
         body = {
             "ref": f"refs/heads/{ref}",
             "sha": sha,
         }
-        post_request(url, headers=self.inputs.headers, json=body)
+        post_request(
+            url, headers=self.inputs.headers, json=body, retry=True, conflict_ok=True
+        )
 
     def create_update_pull_request(self):
         """Create or update a Pull Request via the GitHub API"""
         url = "/".join([self.api_url, "pulls"])
-        pr = {
-            "title": "Bumping Docker image tags in JupyterHub config",
-            "body": (
-                "This Pull Request is bumping the Docker tags for the following images to the listed versions.\n\n"
-                + "\n".join(
-                    [
-                        f"- `{image}`: `{self.inputs.image_tags[image]['current']}` -> `{self.inputs.image_tags[image]['latest']}`"
-                        for image in self.inputs.images_to_update
-                    ]
-                )
-            ),
-            "base": self.inputs.base_branch,
-        }
+        pr = self._build_pull_request()
 
         if self.pr_exists:
             logger.info("Updating Pull Request...")
 
             url = "/".join([url, str(self.pr_number)])
-            pr["state"] = "open"
             resp = patch_request(
                 url, headers=self.inputs.headers, json=pr, return_json=True
             )
@@ -164,13 +236,6 @@ class GitHubAPI:
         else:
             logger.info("Creating Pull Request...")
 
-            if self.fork_exists and (self.inputs.push_to_users_fork is not None):
-                pr["head"] = ":".join(
-                    [self.inputs.push_to_users_fork, self.inputs.head_branch]
-                )
-            else:
-                pr["head"] = self.inputs.head_branch
-
             resp = post_request(
                 url, headers=self.inputs.headers, json=pr, return_json=True
             )
@@ -188,33 +253,19 @@ class GitHubAPI:
         logger.info("Finding Pull Requests previously opened...")
 
         url = "/".join([self.api_url, "pulls"])
-        params = {"state": "open", "sort": "created", "direction": "desc"}
-        resp = get_request(
-            url, headers=self.inputs.headers, params=params, output="json"
-        )
+        params = {
+            "state": "open",
+            "sort": "created",
+            "direction": "desc",
+            "per_page": 100,
+        }
+        pulls = get_paginated_request(url, headers=self.inputs.headers, params=params)
 
-        matches = jmespath.search("[*].head.label", resp)
-        indx, match = next(
-            (
-                (indx, match)
-                for (indx, match) in enumerate(matches)
-                if self.inputs.head_branch in match
-            ),
-            (None, None),
+        match = next(
+            (pr for pr in pulls if self.inputs.head_branch in pr["head"]["label"]),
+            None,
         )
-
-        if (indx is None) and (match is None):
-            logger.info(
-                "No relevant Pull Requests found. A new Pull Request will be opened."
-            )
-            random_id = "".join(random.sample(string.ascii_letters, 4))
-            self.inputs.head_branch = "/".join([self.inputs.head_branch, random_id])
-            self.pr_exists = False
-        else:
-            logger.info("Pull Request found!")
-            self.inputs.head_branch = match.split(":")[-1]
-            self.pr_number = resp[indx]["number"]
-            self.pr_exists = True
+        self._set_existing_pull_request(match)
 
     def get_ref(self, ref):
         """Get a git reference (specifically, a HEAD ref) using GitHub's git
@@ -228,10 +279,7 @@ class GitHubAPI:
         """
         logger.info("Pulling info for ref: {}", ref)
 
-        if self.fork_exists and (self.inputs.push_to_users_fork is not None):
-            url = "/".join([self.fork_api_url, "git", "ref", "heads", ref])
-        else:
-            url = "/".join([self.api_url, "git", "ref", "heads", ref])
+        url = "/".join([self._get_push_api_url(), "git", "ref", "heads", ref])
 
         return get_request(url, headers=self.inputs.headers, output="json")
 
@@ -242,4 +290,4 @@ class GitHubAPI:
         """
         url = "/".join([self.fork_api_url, "merge-upstream"])
         body = {"branch": self.inputs.base_branch}
-        post_request(url, headers=self.inputs.headers, json=body)
+        post_request(url, headers=self.inputs.headers, json=body, retry=True)
@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Headers describing the encoding of the body on the wire, which no longer apply
+# once the decoded body has been cached
+TRANSFER_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def _strip_transfer_headers(headers):
+    return {k: v for k, v in headers.items() if k.lower() not in TRANSFER_HEADERS}
+
+
+def load_entry(path):
+    """Read a JSON cache entry from disk
+
+    Args:
+        path (str): The path of the entry
+
+    Returns:
+        dict: The entry, or None if there is no readable entry
+    """
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def write_entry(path, entry):
+    """Write a JSON cache entry to disk. The entry is written to a temporary file
+    first so that a reader never sees a partially written entry.
+
+    Args:
+        path (str): The path of the entry
+        entry (dict): The entry to write
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as fp:
+        json.dump(entry, fp)
+    os.replace(tmp_path, path)
+
+
+class HttpCache:
+    """
+    Persist the validators (ETag/Last-Modified) and bodies of GET responses on
+    disk so that unchanged resources can be revalidated with a conditional
+    request and replayed from the cache when the server answers 304 Not Modified
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _get_key(self, url, params, headers):
+        """Generate the cache key for a request. Credentials and content
+        negotiation headers are part of the key since they change the response.
+
+        Args:
+            url (str): The URL the request is sent to
+            params (dict): The parameters sent with the request
+            headers (dict): The headers sent with the request
+
+        Returns:
+            str: A hex digest identifying the request
+        """
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        headers = CaseInsensitiveDict(headers)
+        key = json.dumps(
+            [full_url, headers.get("Authorization"), headers.get("Accept")]
+        )
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def load(self, url, params, headers):
+        """Load the cached response for a request, if there is one
+
+        Args:
+            url (str): The URL the request is sent to
+            params (dict): The parameters sent with the request
+            headers (dict): The headers sent with the request
+
+        Returns:
+            dict: The cache entry, or None if the request has not been cached
+        """
+        return load_entry(self._get_path(self._get_key(url, params, headers)))
+
+    def store(self, url, params, headers, resp):
+        """Store a successful response in the cache if the server provided
+        validators that allow it to be revalidated later
+
+        Args:
+            url (str): The URL the request was sent to
+            params (dict): The parameters sent with the request
+            headers (dict): The headers sent with the request
+            resp (requests.Response): The response to store
+        """
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if etag is None and last_modified is None:
+            return
+
+        entry = {
+            "url": resp.url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "encoding": resp.encoding,
+            "headers": _strip_transfer_headers(resp.headers),
+            "content": base64.b64encode(resp.content).decode("utf-8"),
+        }
+        write_entry(self._get_path(self._get_key(url, params, headers)), entry)
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Build the headers that make a request conditional on the cached entry
+
+        Args:
+            entry (dict): The cache entry
+
+        Returns:
+            dict: The If-None-Match and/or If-Modified-Since headers
+        """
+        headers = {}
+        if entry["etag"] is not None:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"] is not None:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        return headers
+
+    @staticmethod
+    def replay(entry, resp):
+        """Rebuild a full response from a cache entry after the server confirmed
+        the resource has not been modified
+
+        Args:
+            entry (dict): The cache entry
+            resp (requests.Response): The 304 Not Modified response
+
+        Returns:
+            requests.Response: A 200 OK response carrying the cached body
+        """
+        cached = requests.Response()
+        cached.status_code = 200
+        cached.reason = "OK"
+        cached.url = entry["url"]
+        cached.encoding = entry["encoding"]
+        cached.headers = CaseInsensitiveDict(entry["headers"])
+        # Prefer any refreshed headers, such as rate limit information
+        cached.headers.update(_strip_transfer_headers(resp.headers))
+        cached._content = base64.b64decode(entry["content"])
+        cached.request = resp.request
+        cached.elapsed = resp.elapsed
+        cached.from_cache = True
+
+        return cached
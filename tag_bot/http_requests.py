@@ -1,4 +1,415 @@
+import random
+import threading
+import time
+from urllib.parse import urljoin
+
 import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+from .http_cache import HttpCache
+from .rate_limiter import MAX_RATE_LIMIT_RETRIES, RateLimiter
+
+# Number of per-host connection pools to cache, and the number of keep-alive
+# connections to hold open in each pool
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+# Requests that can safely be sent more than once are retried when they fail
+# with one of these transient errors
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "PATCH", "DELETE"}
+RETRY_STATUS_CODES = {502, 503, 504}
+MAX_RETRIES = 3
+
+# Retries back off exponentially from BACKOFF_BASE up to BACKOFF_CAP seconds
+BACKOFF_BASE = 1
+BACKOFF_CAP = 30
+
+# How long to wait, in seconds, for a connection to be established and for the
+# server to send data before giving up on a request
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 30
+
+_session = None
+_session_lock = threading.Lock()
+_cache = None
+_rate_limiter = RateLimiter()
+_timeout = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+_deadline = None
+
+
+class DeadlineExceeded(requests.Timeout):
+    """Raised when a request cannot complete before the deadline of the run"""
+
+
+def configure_session(
+    pool_connections=DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize=DEFAULT_POOL_MAXSIZE,
+    pool_block=False,
+):
+    """Create the shared HTTP session that all requests are sent through. The
+    session keeps connections alive in a pool per host, so repeated requests to
+    the same API do not pay for a new TCP+TLS handshake each time. The Action
+    sizes each pool from its max_concurrency and max_concurrency_per_host inputs.
+
+    Args:
+        pool_connections (int, optional): The number of per-host connection pools
+            to cache. Defaults to DEFAULT_POOL_CONNECTIONS.
+        pool_maxsize (int, optional): The maximum number of connections to keep
+            alive in each pool. Defaults to DEFAULT_POOL_MAXSIZE.
+        pool_block (bool, optional): Whether to block and wait for a free
+            connection when a pool is full, rather than opening a throwaway
+            connection. Defaults to False.
+
+    Returns:
+        requests.Session: The newly configured shared session
+    """
+    global _session
+
+    if _session is not None:
+        _session.close()
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    _session = session
+    return _session
+
+
+def get_session():
+    """Return the shared HTTP session, creating it with the default pool settings
+    if it has not been configured yet
+
+    Returns:
+        requests.Session: The shared session
+    """
+    # Lookups run in several threads at once, which must not each create a session
+    with _session_lock:
+        if _session is None:
+            configure_session()
+
+    return _session
+
+
+def configure_cache(cache_dir=None):
+    """Enable or disable the persistent conditional request cache. When enabled,
+    GET requests are sent with the ETag/Last-Modified validators of the last
+    response seen for the same request, and the cached body is reused if the
+    server answers 304 Not Modified.
+
+    Args:
+        cache_dir (str, optional): The directory to store cached responses in.
+            Defaults to None, which disables the cache.
+    """
+    global _cache
+    _cache = HttpCache(cache_dir) if cache_dir else None
+
+
+def set_rate_limit(host, rate):
+    """Limit the number of requests per second sent to a host, for hosts known to
+    limit requests more tightly than their rate limit headers say
+
+    Args:
+        host (str): The host, as it appears in request URLs
+        rate (float): The maximum number of requests per second
+    """
+    _rate_limiter.set_rate(host, rate)
+
+
+def configure_timeouts(
+    connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+    read_timeout=DEFAULT_READ_TIMEOUT,
+    run_deadline=None,
+):
+    """Set the timeouts applied to every request, and the deadline by which the
+    whole run must have finished. Once the deadline has passed, any further
+    request raises DeadlineExceeded instead of being sent.
+
+    Args:
+        connect_timeout (float, optional): Seconds to wait for a connection to be
+            established. Defaults to DEFAULT_CONNECT_TIMEOUT.
+        read_timeout (float, optional): Seconds to wait for the server to send
+            data. Defaults to DEFAULT_READ_TIMEOUT.
+        run_deadline (float, optional): Seconds from now that the run must have
+            finished within. Defaults to None, meaning the run has no deadline.
+    """
+    global _timeout, _deadline
+
+    _timeout = (connect_timeout, read_timeout)
+    _deadline = None if run_deadline is None else time.monotonic() + run_deadline
+
+
+def _check_deadline(delay=0):
+    """Make sure a request can still be sent after waiting for some time without
+    running past the deadline of the run
+
+    Args:
+        delay (float, optional): The number of seconds the request will be held
+            back for before being sent. Defaults to 0.
+
+    Returns:
+        float: The delay, unchanged
+    """
+    if (_deadline is not None) and (time.monotonic() + delay >= _deadline):
+        raise DeadlineExceeded("The deadline for the run has passed")
+
+    return delay
+
+
+def _get_timeout():
+    """Work out the connect and read timeouts of the next request, shortening them
+    so the request cannot outlive the deadline of the run
+
+    Returns:
+        tuple(float, float): The connect and read timeouts in seconds
+    """
+    _check_deadline()
+    if _deadline is None:
+        return _timeout
+
+    remaining = _deadline - time.monotonic()
+    return tuple(min(timeout, remaining) for timeout in _timeout)
+
+
+def _get_backoff(attempt, resp=None):
+    """Calculate how long to wait before retrying a failed request, using
+    exponential backoff with full jitter so that concurrent clients do not retry
+    in lockstep. A Retry-After header sent by the server takes precedence if it
+    asks for a longer wait.
+
+    Args:
+        attempt (int): The number of retries already made
+        resp (requests.Response, optional): The failed response, if any.
+            Defaults to None.
+
+    Returns:
+        float: The number of seconds to wait
+    """
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+
+    return delay
+
+
+def _is_conflict(resp):
+    """Check if a failed response reports that the resource it tried to create or
+    update already exists in the requested state
+
+    Args:
+        resp (requests.Response): The failed response
+
+    Returns:
+        bool: True if the response is a conflict
+    """
+    return (resp.status_code == 409) or (
+        (resp.status_code == 422) and ("already exists" in resp.text)
+    )
+
+
+class _RetryPolicy:
+    """
+    Track the attempts made at sending a single request and decide whether, and
+    after how long, it should be sent again
+    """
+
+    def __init__(self, method, url, retry=None):
+        self.method = method
+        self.url = url
+        self.retry = (method in IDEMPOTENT_METHODS) if retry is None else retry
+        self.attempt = 0
+        self.rate_limit_retries = 0
+
+    def on_error(self, err):
+        """Decide how to handle a request that failed without a response
+
+        Args:
+            err (Exception): The connection or timeout error that was raised
+
+        Returns:
+            float: The number of seconds to wait before retrying the request.
+                The error is re-raised if the request should not be retried.
+        """
+        if (not self.retry) or (self.attempt >= MAX_RETRIES):
+            raise err
+
+        delay = _get_backoff(self.attempt)
+        logger.warning(
+            "{} {} failed, retrying in {:.1f}s: {}", self.method, self.url, delay, err
+        )
+        self.attempt += 1
+        return delay
+
+    def on_response(self, resp):
+        """Decide how to handle the response to a request
+
+        Args:
+            resp (requests.Response): The response received
+
+        Returns:
+            float: The number of seconds to wait before retrying the request, or
+                None if the response is final
+        """
+        if RateLimiter.is_rate_limited(resp) and (
+            self.rate_limit_retries < MAX_RATE_LIMIT_RETRIES
+        ):
+            # The rate limiter holds the next attempt back until the limit lifts
+            self.rate_limit_retries += 1
+            return 0
+
+        if (
+            self.retry
+            and (resp.status_code in RETRY_STATUS_CODES)
+            and (self.attempt < MAX_RETRIES)
+        ):
+            delay = _get_backoff(self.attempt, resp)
+            logger.warning(
+                "{} {} returned {}, retrying in {:.1f}s",
+                self.method,
+                self.url,
+                resp.status_code,
+                delay,
+            )
+            self.attempt += 1
+            return delay
+
+        return None
+
+
+def _get_conditional_headers(method, url, params, headers):
+    """Look up a cached response for a GET request and add the headers needed to
+    revalidate it
+
+    Args:
+        method (str): The HTTP method of the request
+        url (str): The URL the request is sent to
+        params (dict): The parameters sent with the request
+        headers (dict): The headers sent with the request
+
+    Returns:
+        entry (dict): The cache entry for the request, or None
+        send_headers (dict): The headers to send the request with
+    """
+    if (_cache is None) or (method != "GET"):
+        return None, headers
+
+    entry = _cache.load(url, params, headers)
+    if entry is None:
+        return None, headers
+
+    return entry, {**headers, **HttpCache.conditional_headers(entry)}
+
+
+def _handle_response(method, url, params, headers, resp, entry, policy, conflict_ok):
+    """Turn the final response to a request into its result, replaying it from
+    the cache if it was not modified and raising an error if it failed
+
+    Args:
+        method (str): The HTTP method of the request
+        url (str): The URL the request was sent to
+        params (dict): The parameters sent with the request
+        headers (dict): The headers sent with the request
+        resp (requests.Response): The final response
+        entry (dict): The cache entry the request was revalidating, or None
+        policy (_RetryPolicy): The retry policy the request was sent under
+        conflict_ok (bool): Whether a conflict on a retried request is a success
+
+    Returns:
+        requests.Response: The response to the request
+    """
+    if (entry is not None) and (resp.status_code == 304):
+        return HttpCache.replay(entry, resp)
+
+    if conflict_ok and (policy.attempt > 0) and _is_conflict(resp):
+        logger.info(
+            "{} {} reported a conflict after being retried. Assuming an earlier attempt succeeded.",
+            method,
+            url,
+        )
+        return resp
+
+    if resp.status_code >= 400:
+        raise requests.HTTPError(f"{resp.text}\nRequest URL: {url}", response=resp)
+
+    if (_cache is not None) and (method == "GET"):
+        _cache.store(url, params, headers, resp)
+
+    return resp
+
+
+def _send_request(
+    method, url, headers={}, params={}, retry=None, conflict_ok=False, **kwargs
+):
+    """Send a request through the shared session and raise an error if the
+    response was not successful. Requests time out according to
+    configure_timeouts and raise DeadlineExceeded once the run is out of time.
+
+    Args:
+        method (str): The HTTP method to use
+        url (str): The URL to send the request to
+        headers (dict, optional): A dictionary of headers to send with the
+            request. Defaults to an empty dict.
+        params (dict, optional): A dictionary of parameters to send with the
+            request. Defaults to an empty dict.
+        retry (bool, optional): Whether to retry the request if it fails with a
+            transient error. Defaults to None, meaning only idempotent methods are
+            retried.
+        conflict_ok (bool, optional): Whether a conflict reported in response to
+            a retried request should be taken to mean an earlier attempt
+            succeeded, rather than raising an error. Defaults to False.
+        **kwargs: Any other keyword arguments accepted by requests.Session.request
+
+    Returns:
+        requests.Response: The response to the request
+    """
+    entry, send_headers = _get_conditional_headers(method, url, params, headers)
+    policy = _RetryPolicy(method, url, retry=retry)
+
+    while True:
+        delay = _rate_limiter.reserve(url)
+        if delay > 0:
+            _rate_limiter.sleep(_check_deadline(delay))
+
+        timeout = _get_timeout()
+        try:
+            resp = get_session().request(
+                method,
+                url,
+                headers=send_headers,
+                params=params,
+                timeout=timeout,
+                **kwargs,
+            )
+        except (requests.ConnectionError, requests.Timeout) as err:
+            time.sleep(_check_deadline(policy.on_error(err)))
+            continue
+
+        _rate_limiter.update(url, resp)
+
+        delay = policy.on_response(resp)
+        if delay is None:
+            break
+        time.sleep(_check_deadline(delay))
+
+    return _handle_response(
+        method,
+        url,
+        params,
+        headers,
+        resp,
+        entry,
+        policy,
+        conflict_ok,
+    )
 
 
 def get_request(url, headers={}, params={}, output="default"):
@@ -21,10 +432,7 @@ def get_request(url, headers={}, params={}, output="default"):
             % accepted_formats
         )
 
-    resp = requests.get(url, headers=headers, params=params)
-
-    if not resp:
-        raise requests.HTTPError(f"{resp.text}\nRequest URL: {url}")
+    resp = _send_request("GET", url, headers=headers, params=params)
 
     if output == "default":
         return resp
@@ -34,6 +442,83 @@ def get_request(url, headers={}, params={}, output="default"):
         return resp.text
 
 
+def _get_next_page(resp, body, url, params):
+    """Work out where the next page of a paginated listing can be requested from.
+    GitHub and OCI registries advertise the next page in the 'Link' header,
+    Docker Hub returns a 'next' URL in the JSON body and quay.io sets a
+    'has_additional' flag in the JSON body alongside the current 'page' number.
+
+    Args:
+        resp (requests.Response): The response containing the current page
+        body (dict or list): The JSON payload of the current page
+        url (str): The URL the current page was requested from
+        params (dict): The parameters the current page was requested with
+
+    Returns:
+        next_url (str): The URL of the next page, or None if this is the last page
+        next_params (dict): The parameters to request the next page with
+    """
+    if "next" in resp.links:
+        # The URL already carries the query parameters for the next page. OCI
+        # registries give it relative to the current page.
+        return urljoin(str(resp.url), resp.links["next"]["url"]), {}
+
+    if isinstance(body, dict):
+        if body.get("next"):
+            return body["next"], {}
+
+        if body.get("has_additional"):
+            page = body.get("page", params.get("page", 1))
+            return url, {**params, "page": page + 1}
+
+    return None, {}
+
+
+def get_paginated_request(url, headers={}, params={}, items_key=None):
+    """Lazily iterate over the items of a paginated HTTP API listing. Pages are
+    only requested once the items of the previous page have been consumed, so
+    callers can stop iterating as soon as they have found what they need.
+
+    Args:
+        url (str): The URL of the first page of the listing
+        headers (dict, optional): A dictionary of headers to send with each
+            request. Defaults to an empty dict.
+        params (dict, optional): A dictionary of parameters to send with the
+            request for the first page. Defaults to an empty dict.
+        items_key (str, optional): The key of the JSON payload under which the
+            items of each page are stored. Defaults to None, meaning the payload
+            itself is the list of items.
+
+    Yields:
+        The items of each page of the listing, in the order they are returned
+    """
+    while url is not None:
+        resp = get_request(url, headers=headers, params=params)
+        body = resp.json()
+
+        # Registries return null rather than an empty list for a listing
+        # with no items
+        items = (body if items_key is None else body[items_key]) or []
+        yield from items
+
+        url, params = _get_next_page(resp, body, url, params)
+
+
+def head_request(url, headers={}):
+    """Send a HEAD request to an HTTP API endpoint, e.g. to read the headers
+    describing a resource without downloading it
+
+    Args:
+        url (str): The URL to send the request to
+        headers (dict, optional): A dictionary of headers to send with the
+            request. Defaults to an empty dict.
+
+    Returns:
+        requests.Response: The response to the request
+    """
+    return _send_request("HEAD", url, headers=headers)
+
+
 def patch_request(url, headers={}, json={}, return_json=False):
     """Send a PATCH request to an HTTP API endpoint
 
@@ -46,16 +531,15 @@ def patch_request(url, headers={}, json={}, return_json=False):
         return_json (bool, optional): Return the JSON payload response.
             Defaults to False.
     """
-    resp = requests.patch(url, headers=headers, json=json)
-
-    if not resp:
-        raise requests.HTTPError(f"{resp.text}\nRequest URL: {url}")
+    resp = _send_request("PATCH", url, headers=headers, json=json)
 
     if return_json:
         return resp.json()
 
 
-def post_request(url, headers={}, json={}, return_json=False):
+def post_request(
+    url, headers={}, json={}, return_json=False, retry=False, conflict_ok=False
+):
     """Send a POST request to an HTTP API endpoint
 
     Args:
@@ -66,11 +550,39 @@ def post_request(url, headers={}, json={}, return_json=False):
             the request. Defaults to an empty dictionary.
         return_json (bool, optional): Return the JSON payload response.
             Defaults to False.
+        retry (bool, optional): Retry the request if it fails with a transient
+            error. Only set this if sending the request twice is safe. Defaults
+            to False.
+        conflict_ok (bool, optional): If a retried request reports that the
+            resource already exists, assume an earlier attempt created it rather
+            than raising an error. Defaults to False.
     """
-    resp = requests.post(url, headers=headers, json=json)
+    resp = _send_request(
+        "POST", url, headers=headers, json=json, retry=retry, conflict_ok=conflict_ok
+    )
+
+    if return_json:
+        return resp.json()
+
+
+def put_request(url, headers={}, json={}, return_json=False, conflict_ok=False):
+    """Send a PUT request to an HTTP API endpoint
 
-    if not resp:
-        raise requests.HTTPError(f"{resp.text}\nRequest URL: {url}")
+    Args:
+        url (str): The URL to send the request to
+        headers (dict, optional): A dictionary of any headers to send with the
+            request. Defaults to an empty dictionary.
+        json (dict, optional): A dictionary containing JSON payload to send with
+            the request. Defaults to an empty dictionary.
+        return_json (bool, optional): Return the JSON payload response.
+            Defaults to False.
+        conflict_ok (bool, optional): If a retried request reports a conflict,
+            assume an earlier attempt was applied rather than raising an error.
+            Defaults to False.
+    """
+    resp = _send_request(
+        "PUT", url, headers=headers, json=json, conflict_ok=conflict_ok
+    )
 
     if return_json:
         return resp.json()
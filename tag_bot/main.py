@@ -1,12 +1,34 @@
 import base64
 import json
 import os
+import re
 
 from loguru import logger
 
 from .github_api import GitHubAPI
-from .parse_image_tags import ImageTags
-from .utils import read_config_with_yq, update_config_with_yq
+from .http_requests import (
+    DEFAULT_READ_TIMEOUT,
+    DeadlineExceeded,
+    configure_cache,
+    configure_session,
+    configure_timeouts,
+)
+from .parse_image_tags import (
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_CONCURRENCY_PER_HOST,
+    ImageTags,
+)
+from .tag_cache import (
+    DEFAULT_DIGEST_MAX_AGE,
+    configure_digest_store,
+    configure_tag_cache,
+)
+from .tag_filter import SORT_KEYS, TagFilter
+from .utils import (
+    read_config_values,
+    splice_config_values,
+    update_config_values,
+)
 from .yaml_parser import YamlParser
 
 yaml = YamlParser()
@@ -28,6 +50,8 @@ class UpdateImageTags:
         team_reviewers=[],
         push_to_users_fork=None,
         dry_run=False,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        max_concurrency_per_host=DEFAULT_MAX_CONCURRENCY_PER_HOST,
     ):
         self.repository = repository
         self.config_path = config_path
@@ -38,6 +62,13 @@ class UpdateImageTags:
         self.team_reviewers = team_reviewers
         self.push_to_users_fork = push_to_users_fork
         self.dry_run = dry_run
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_host = max_concurrency_per_host
+
+        # The config as it was downloaded, and round-trip loaded if an update
+        # has to be written to it
+        self.config_text = None
+        self.config = None
 
         self.head_branch = "/".join(
             [head_branch, config_path.replace("/", "-").replace(".", "")]
@@ -55,31 +86,81 @@ class UpdateImageTags:
                 encoded in base64
         """
         logger.info("Updating JupyterHub config...")
-        for image in self.images_to_update:
+        updates = {}
+        for key in self.images_to_update:
+            image, _ = key
             logger.info("Updating tag for image: {}", image)
-            value = read_config_with_yq(self.config, self.image_tags[image]["path"])
-
-            if ":" in value:
-                self.config = update_config_with_yq(
-                    self.config,
-                    self.image_tags[image]["path"],
-                    ":".join([image, self.image_tags[image]["latest"]]),
-                )
+            latest = self.image_tags[key]["latest"]
+
+            for path, current in self.image_tags[key]["paths"].items():
+                if current != latest:
+                    updates[path] = (image, latest)
+
+        if self.config is None:
+            logger.info("Loading JupyterHub config...")
+            self.config = yaml.yaml_string_to_object(self.config_text)
+
+        values = read_config_values(self.config, list(updates.keys()))
+
+        new_values = {}
+        for path, (image, latest) in updates.items():
+            if ":" in values[path]:
+                new_values[path] = ":".join([image, latest])
             else:
-                self.config = update_config_with_yq(
-                    self.config,
-                    self.image_tags[image]["path"],
-                    self.image_tags[image]["latest"],
-                )
+                new_values[path] = latest
+
+        # Splice the new tags into the file as it was downloaded, so the diff
+        # only touches the lines holding them. The positions of the tags are
+        # read from the config before it is updated.
+        config_text = self.config_text
+        if config_text is not None:
+            config_text = splice_config_values(config_text, self.config, new_values)
+
+        self.config = update_config_values(self.config, new_values)
+
+        if config_text is None:
+            logger.info(
+                "Could not splice the new tags into the config. Rewriting it..."
+            )
+            config_text = yaml.object_to_yaml_str(self.config)
 
         logger.info("Encoding config in base64...")
-        config = yaml.object_to_yaml_str(self.config).encode("utf-8")
-        config = base64.b64encode(config).decode("utf-8")
+        config = base64.b64encode(config_text.encode("utf-8")).decode("utf-8")
 
         return config
 
+    def _log_partial_report(self):
+        """Report how far the run got before it ran out of time"""
+        image_tags = getattr(self, "image_tags", {})
+        checked = [image for (image, _), tags in image_tags.items() if "latest" in tags]
+        unchecked = [
+            image for (image, _), tags in image_tags.items() if "latest" not in tags
+        ]
+
+        logger.error("The run did not finish before its deadline")
+        logger.error("Images checked for newer tags: {}", checked)
+        logger.error("Images not checked: {}", unchecked)
+
+        images_to_update = getattr(self, "images_to_update", [])
+        if len(images_to_update) > 0:
+            logger.error(
+                "Newer tags were found for the following images, but a Pull Request may not have been opened: {}",
+                [image for image, _ in images_to_update],
+            )
+
     def update(self):
-        """Run the action to check if the docker images are up to date"""
+        """Run the action to check if the docker images are up to date. If the run
+        exceeds its deadline, the remaining work is abandoned and a report of the
+        progress made so far is logged."""
+        try:
+            self._update()
+        except DeadlineExceeded:
+            self._log_partial_report()
+            raise
+
+    def _update(self):
+        """Check if the docker images are up to date and open a Pull Request
+        bumping any that are not"""
         github = GitHubAPI(self)
         github.find_existing_pull_request()
 
@@ -98,13 +179,14 @@ class UpdateImageTags:
         branch = self.head_branch if github.pr_exists else self.base_branch
 
         image_parser = ImageTags(self, url, branch)
+        # Share the tags found so far so they can be reported on if the run
+        # exceeds its deadline
+        self.image_tags = image_parser.image_tags
         image_parser.get_image_tags()
 
+        images = [image for image, _ in self.images_to_update]
         if len(self.images_to_update) > 0 and not self.dry_run:
-            logger.info(
-                "Newer tags are available for the following images: {}",
-                self.images_to_update,
-            )
+            logger.info("Newer tags are available for the following images: {}", images)
 
             if self.push_to_users_fork is not None:
                 if github.fork_exists:
@@ -117,18 +199,20 @@ class UpdateImageTags:
                 github.create_ref(self.head_branch, resp["object"]["sha"])
 
             updated_config = self.update_config()
-            commit_msg = f"Bump images {[image for image in self.images_to_update]} to tags {[self.image_tags[image]['latest'] for image in self.images_to_update]}, respectively"
+            commit_msg = f"Bump images {images} to tags {[self.image_tags[key]['latest'] for key in self.images_to_update]}, respectively"
             github.create_commit(commit_msg, updated_config)
             github.create_update_pull_request()
 
         elif len(self.images_to_update) > 0 and self.dry_run:
             logger.info(
                 "Newer tags are available for the following images: {}. Pull Request will not be opened due to --dry-run flag being set.",
-                self.images_to_update,
+                images,
             )
         else:
             logger.info("All image tags are up-to-date!")
 
+        image_parser.wait_for_revalidation()
+
 
 def split_str_to_list(input_str, split_char=" "):
     """Split a string into a list of elements.
@@ -153,7 +237,10 @@ def split_str_to_list(input_str, split_char=" "):
 def assert_images_info_input(images_info):
     """Assert the user input provided to the images_info variable is as of the expected
     structure. I.e., a list of dictionaries, where each dictionary must have a
-    'values_path' key whose value is a string type.
+    'values_path' key whose value is a string type. The optional 'regexpr' and
+    'prefix' keys must be strings, the optional 'include' and 'exclude' keys must
+    be lists of strings, 'regexpr' must be a valid regular expression, and the
+    optional 'sort' key must be 'time' or 'semver'.
 
     Args:
         images_info (list[dict]): The input list of dictionaries to check
@@ -165,6 +252,25 @@ def assert_images_info_input(images_info):
         assert "values_path" in obj.keys()
         assert isinstance(obj["values_path"], str)
 
+        for key in ["regexpr", "prefix"]:
+            if key in obj.keys():
+                assert isinstance(obj[key], str)
+
+        for key in ["include", "exclude"]:
+            if key in obj.keys():
+                assert isinstance(obj[key], list)
+                assert all(isinstance(pattern, str) for pattern in obj[key])
+
+        if "sort" in obj.keys():
+            assert obj["sort"] in SORT_KEYS.keys()
+
+        # Compile the filter to catch invalid regular expressions before any
+        # requests are made
+        try:
+            TagFilter.from_image_info(obj)
+        except re.error as err:
+            raise AssertionError(f"Invalid regexpr {obj['regexpr']!r}: {err}")
+
 
 def main():
     # Retrieve environment variables
@@ -179,6 +285,15 @@ def main():
     team_reviewers = os.environ.get("INPUT_TEAM_REVIEWERS", [])
     push_to_users_fork = os.environ.get("INPUT_PUSH_TO_USERS_FORK", None)
     dry_run = os.environ.get("INPUT_DRY_RUN", False)
+    cache_dir = os.environ.get("INPUT_CACHE_DIR", None)
+    request_timeout = os.environ.get("INPUT_REQUEST_TIMEOUT", None)
+    run_deadline = os.environ.get("INPUT_RUN_DEADLINE", None)
+    max_concurrency = os.environ.get("INPUT_MAX_CONCURRENCY", None)
+    max_concurrency_per_host = os.environ.get("INPUT_MAX_CONCURRENCY_PER_HOST", None)
+    tag_cache_ttl = os.environ.get("INPUT_TAG_CACHE_TTL", None)
+    tag_cache_stale_ttl = os.environ.get("INPUT_TAG_CACHE_STALE_TTL", None)
+    check_digests = os.environ.get("INPUT_CHECK_DIGESTS", False)
+    check_digests_max_age = os.environ.get("INPUT_CHECK_DIGESTS_MAX_AGE", None)
 
     # Reference dict for required inputs
     required_vars = {
@@ -224,6 +339,59 @@ def main():
             + f"You have provided: {dry_run} ({type(dry_run)})"
         )
 
+    # Check the check_digests variable is properly set
+    if isinstance(check_digests, str) and (check_digests in ["true", "false"]):
+        check_digests = check_digests == "true"
+    elif not isinstance(check_digests, bool):
+        raise ValueError(
+            "CHECK_DIGESTS variable can only take values 'true' or 'false' (either str or bool type). "
+            + f"You have provided: {check_digests} ({type(check_digests)})"
+        )
+
+    # Fall back to the default concurrency if none has been provided
+    max_concurrency = (
+        int(max_concurrency) if max_concurrency else DEFAULT_MAX_CONCURRENCY
+    )
+    max_concurrency_per_host = (
+        int(max_concurrency_per_host)
+        if max_concurrency_per_host
+        else DEFAULT_MAX_CONCURRENCY_PER_HOST
+    )
+
+    # Keep as many connections to each host alive as lookups can run on it at
+    # once, lookups and background revalidations included
+    configure_session(pool_maxsize=min(max_concurrency, max_concurrency_per_host))
+
+    # Limit how long each request, and the run as a whole, may take
+    configure_timeouts(
+        read_timeout=(
+            float(request_timeout) if request_timeout else DEFAULT_READ_TIMEOUT
+        ),
+        run_deadline=float(run_deadline) if run_deadline else None,
+    )
+
+    # Enable the conditional request cache if a directory has been provided
+    if cache_dir:
+        configure_cache(cache_dir)
+
+        # Reuse recently resolved tags if they may be cached for a while
+        configure_tag_cache(
+            os.path.join(cache_dir, "tags"),
+            ttl=float(tag_cache_ttl) if tag_cache_ttl else 0,
+            stale_ttl=float(tag_cache_stale_ttl) if tag_cache_stale_ttl else 0,
+        )
+
+        # Skip listing the tags of images whose manifests have not changed
+        if check_digests:
+            configure_digest_store(
+                os.path.join(cache_dir, "digests"),
+                max_age=(
+                    float(check_digests_max_age)
+                    if check_digests_max_age
+                    else DEFAULT_DIGEST_MAX_AGE
+                ),
+            )
+
     update_image_tags = UpdateImageTags(
         repository,
         github_token,
@@ -236,6 +404,8 @@ def main():
         team_reviewers=team_reviewers,
         push_to_users_fork=push_to_users_fork,
         dry_run=dry_run,
+        max_concurrency=max_concurrency,
+        max_concurrency_per_host=max_concurrency_per_host,
     )
     update_image_tags.update()
 
@@ -0,0 +1,250 @@
+import re
+import time
+
+import requests
+from loguru import logger
+
+from .http_requests import get_paginated_request, get_request, head_request
+
+# The number of tags to request per page of a tag listing
+OCI_PAGE_SIZE = 100
+
+# How long a token is valid for when the token server does not say, as
+# specified by the Docker token authentication spec
+DEFAULT_TOKEN_LIFETIME = 60
+
+# The manifest formats to accept when reading the digest of a tag. Listing
+# every format stops the registry converting the manifest, which would change
+# its digest.
+MANIFEST_MEDIA_TYPES = ", ".join(
+    [
+        "application/vnd.oci.image.index.v1+json",
+        "application/vnd.oci.image.manifest.v1+json",
+        "application/vnd.docker.distribution.manifest.list.v2+json",
+        "application/vnd.docker.distribution.manifest.v2+json",
+    ]
+)
+
+# Hosts serving the registry API over plain HTTP, such as a local registry:2
+# container standing in for a real registry during testing
+INSECURE_HOSTS = {"localhost", "127.0.0.1"}
+
+_registries = {}
+
+
+def is_registry_host(component):
+    """Check if the first component of an image name is the host of a registry,
+    following the same rules as the Docker CLI
+
+    Args:
+        component (str): The first '/'-separated component of an image name
+
+    Returns:
+        bool: True if the component names a registry host
+    """
+    return ("." in component) or (":" in component) or (component == "localhost")
+
+
+def get_registry(host):
+    """Return the client for a registry host, creating it if needed. Clients are
+    shared so that tokens are reused across every image stored on the registry.
+
+    Args:
+        host (str): The host of the registry, optionally including a port
+
+    Returns:
+        OciRegistry: The registry client
+    """
+    if host not in _registries:
+        _registries[host] = OciRegistry(host)
+
+    return _registries[host]
+
+
+def _get_digest(resp):
+    """Read the digest of a manifest from the response to a HEAD request for it
+
+    Args:
+        resp (requests.Response): The response
+
+    Returns:
+        str: The digest, or the ETag if the registry does not send a digest
+    """
+    return resp.headers.get("Docker-Content-Digest", resp.headers.get("ETag"))
+
+
+def _is_not_found(err):
+    """Check if a request failed because the resource does not exist
+
+    Args:
+        err (requests.HTTPError): The error raised by the request
+
+    Returns:
+        bool: True if the registry responded with 404 Not Found
+    """
+    return (err.response is not None) and (err.response.status_code == 404)
+
+
+def _parse_challenge(header):
+    """Parse the parameters of a Bearer challenge from a WWW-Authenticate header,
+    e.g. 'Bearer realm="https://auth.example.com/token",service="example.com"'
+
+    Args:
+        header (str): The WWW-Authenticate header value
+
+    Returns:
+        dict: The challenge parameters, or None if it is not a Bearer challenge
+    """
+    if (header is None) or (not header.lower().startswith("bearer ")):
+        return None
+
+    return dict(re.findall(r'(\w+)="([^"]*)"', header))
+
+
+class OciRegistry:
+    """
+    Look up the tags of images stored on any registry implementing the OCI
+    Distribution v2 API, authenticating with anonymous bearer tokens when the
+    registry asks for them
+    """
+
+    def __init__(self, host):
+        self.host = host
+        scheme = "http" if host.split(":")[0] in INSECURE_HOSTS else "https"
+        self.base_url = f"{scheme}://{host}/v2"
+
+        # None until the registry has been probed, then the Bearer challenge it
+        # sent, or False if it does not require authentication
+        self._challenge = None
+        self._tokens = {}
+
+    def _set_challenge(self, err):
+        """Record the authentication challenge sent in response to a probe of the
+        API root
+
+        Args:
+            err (requests.HTTPError): The error raised by the probe
+        """
+        if (err.response is None) or (err.response.status_code != 401):
+            raise err
+
+        self._challenge = _parse_challenge(err.response.headers.get("WWW-Authenticate"))
+        if self._challenge is None:
+            raise err
+
+    def _get_token_request(self, repository):
+        """Build the request for a token allowing tags to be pulled from a
+        repository
+
+        Args:
+            repository (str): The name of the repository on the registry
+
+        Returns:
+            url (str): The URL of the token server
+            params (dict): The parameters to request the token with
+        """
+        params = {"scope": f"repository:{repository}:pull"}
+        if "service" in self._challenge:
+            params["service"] = self._challenge["service"]
+
+        return self._challenge["realm"], params
+
+    def _store_token(self, repository, body):
+        """Remember a token issued for a repository until it expires
+
+        Args:
+            repository (str): The name of the repository on the registry
+            body (dict): The JSON payload returned by the token server
+
+        Returns:
+            str: The token
+        """
+        token = body.get("token", body.get("access_token"))
+        expires_in = body.get("expires_in", DEFAULT_TOKEN_LIFETIME)
+        self._tokens[repository] = (token, time.monotonic() + expires_in)
+        logger.debug("Obtained a token to pull {} from {}", repository, self.host)
+
+        return token
+
+    def _get_cached_headers(self, repository):
+        """Build the headers to authenticate requests for a repository with, if no
+        new token is needed
+
+        Args:
+            repository (str): The name of the repository on the registry
+
+        Returns:
+            dict: The headers to send, or None if a token must be requested first
+        """
+        if self._challenge is False:
+            return {}
+
+        token, expires_at = self._tokens.get(repository, (None, 0))
+        if (token is None) or (expires_at <= time.monotonic()):
+            return None
+
+        return {"Authorization": f"Bearer {token}"}
+
+    def _get_headers(self, repository):
+        """Build the headers to authenticate requests for a repository with,
+        probing the registry and requesting a token as needed
+
+        Args:
+            repository (str): The name of the repository on the registry
+
+        Returns:
+            dict: The headers to send
+        """
+        if self._challenge is None:
+            try:
+                get_request(f"{self.base_url}/")
+                self._challenge = False
+            except requests.HTTPError as err:
+                self._set_challenge(err)
+
+        headers = self._get_cached_headers(repository)
+        if headers is None:
+            url, params = self._get_token_request(repository)
+            body = get_request(url, params=params, output="json")
+            headers = {"Authorization": f"Bearer {self._store_token(repository, body)}"}
+
+        return headers
+
+    def list_tags(self, repository):
+        """Lazily iterate over the tags of a repository
+
+        Args:
+            repository (str): The name of the repository on the registry
+
+        Yields:
+            str: The name of each tag, in the order the registry lists them
+        """
+        yield from get_paginated_request(
+            f"{self.base_url}/{repository}/tags/list",
+            headers=self._get_headers(repository),
+            params={"n": OCI_PAGE_SIZE},
+            items_key="tags",
+        )
+
+    def get_digest(self, repository, tag):
+        """Read the digest of the manifest a tag points to, without downloading
+        the manifest
+
+        Args:
+            repository (str): The name of the repository on the registry
+            tag (str): The name of the tag
+
+        Returns:
+            str: The digest, or None if the tag does not exist
+        """
+        headers = {**self._get_headers(repository), "Accept": MANIFEST_MEDIA_TYPES}
+        try:
+            resp = head_request(
+                f"{self.base_url}/{repository}/manifests/{tag}", headers=headers
+            )
+        except requests.HTTPError as err:
+            if _is_not_found(err):
+                return None
+            raise
+
+        return _get_digest(resp)
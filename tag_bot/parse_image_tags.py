@@ -1,17 +1,50 @@
-import re
+import json
+import threading
 import warnings
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from itertools import compress
 
-from dateutil.parser import isoparse
+import requests
 from loguru import logger
 
-from .http_requests import get_request
-from .utils import read_config_with_yq
+from .http_requests import DeadlineExceeded, get_request
+from .registries import get_backend_class, get_registry_host
+from .tag_cache import FRESH, STALE, get_digest_store, get_tag_cache
+from .tag_filter import TagFilter
+from .utils import read_config_values, read_yaml_values
 from .yaml_parser import YamlParser
 
 yaml = YamlParser()
 
+# The number of registry lookups to run at once, overall and against any one
+# registry host
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_CONCURRENCY_PER_HOST = 4
+
+# The tag most images move on every release, whose digest reveals whether
+# anything has been pushed since the last run
+SENTINEL_TAG = "latest"
+
+# The parts of a tag filter restricting which tags may be picked, rather than
+# how they are ranked
+FLAVOUR_KEYS = ["regexpr", "include", "exclude", "prefix"]
+
+
+def get_image_key(name, tag_filter):
+    """Build the key an image is looked up under. An image used with different
+    tag filters is looked up once per filter.
+
+    Args:
+        name (str): The name of the image
+        tag_filter (TagFilter): The filter its tag is resolved with, or None
+
+    Returns:
+        tuple(str, str): The name of the image and the serialised filter, or None
+            if the image is not filtered
+    """
+    spec = None if tag_filter is None else json.dumps(tag_filter.spec, sort_keys=True)
+    return name, spec
+
 
 class ImageTags:
     """
@@ -24,6 +57,11 @@ class ImageTags:
         self.branch = branch
         self.github_api_url = github_api_url
         self.image_tags = {}
+        self._revalidations = []
+
+        # The backend looking up each image, and the backend of each registry host
+        self._backends = {}
+        self._host_backends = {}
 
     def _get_config(self, ref):
         """Get the contents of a JupyterHub YAML config file in a GitHub repo over the API
@@ -32,7 +70,7 @@ class ImageTags:
             ref (str): The reference (branch) the file is stored on
 
         Returns:
-            config (dict): The JupyterHub YAML config
+            config (str): The JupyterHub YAML config, as it was downloaded
             sha (str): The SHA of the file
         """
         url = "/".join([self.github_api_url, "contents", self.inputs.config_path])
@@ -45,13 +83,49 @@ class ImageTags:
         sha = resp["sha"]
 
         resp = get_request(download_url, headers=self.inputs.headers, output="text")
-        return yaml.yaml_string_to_object(resp), sha
+        return resp, sha
+
+    def _add_local_image_tag(self, name, tag, path, tag_filter):
+        """Record where an image is used in the config. An image used in several
+        places with the same tag filter is looked up once and bumped in every one
+        of them.
+
+        Args:
+            name (str): The name of the image
+            tag (str): The tag the image currently has at this path
+            path (str): The path in the config holding the tag
+            tag_filter (TagFilter): The filter the tag is resolved with, or None
+        """
+        key = get_image_key(name, tag_filter)
+        if key not in self.image_tags.keys():
+            self.image_tags[key] = {
+                "current": tag,
+                "paths": {},
+                "tag_filter": tag_filter,
+            }
+
+        self.image_tags[key]["paths"][path] = tag
 
     def _get_local_image_tags(self):
         """Read the tags currently stored in a JupyterHub YAML config file"""
         logger.info("Fetching current image tags from config...")
+        var_paths = [
+            image_info["values_path"] for image_info in self.inputs.images_info
+        ]
+
+        values = None
+        if self.inputs.config is None:
+            # Only build the values the paths locate. The whole config is
+            # round-trip loaded once an update has to be written.
+            values = read_yaml_values(self.inputs.config_text, var_paths)
+            if values is None:
+                self.inputs.config = yaml.yaml_string_to_object(self.inputs.config_text)
+        if values is None:
+            values = read_config_values(self.inputs.config, var_paths)
+
         for image_info in self.inputs.images_info:
-            value = read_config_with_yq(self.inputs.config, image_info["values_path"])
+            value = values[image_info["values_path"]]
+            tag_filter = TagFilter.from_image_info(image_info)
 
             if (
                 isinstance(value, dict)
@@ -59,179 +133,442 @@ class ImageTags:
                 and ("tag" in value.keys())
             ):
                 path = image_info["values_path"] + ".tag"
-                self.image_tags[value["name"]] = {
-                    "current": value["tag"],
-                    "path": path,
-                    "regexpr": image_info.get("regexpr", None),
-                }
+                self._add_local_image_tag(value["name"], value["tag"], path, tag_filter)
             elif isinstance(value, str):
-                name, tag = value.split(":")
-                self.image_tags[name] = {
-                    "current": tag,
-                    "path": image_info["values_path"],
-                    "regexpr": image_info.get("regexpr", None),
-                }
+                # Split on the last colon only, as the registry host may carry a port
+                name, _, tag = value.rpartition(":")
+                if (not name) or ("/" in tag):
+                    # Either no colon at all, or the last one belongs to the
+                    # registry host, eg. localhost:5000/image_name
+                    warnings.warn(
+                        f"Image definition has no tag in path. Skipping for now. {image_info['values_path']}"
+                    )
+                    continue
+                self._add_local_image_tag(
+                    name, tag, image_info["values_path"], tag_filter
+                )
             else:
                 warnings.warn(
                     f"Unknown image definition in path. Skipping for now. {image_info['values_path']}"
                 )
                 continue
 
-    def _get_most_recent_image_tag_dockerhub(self, image_name, regexpr=None):
-        """For an image hosted on DockerHub, look up the most recent tag
+    def _get_backend(self, image):
+        """Find the backend looking up the tags of an image. Images on the same
+        registry host share a backend.
 
         Args:
-            image_name (str): The name of the image to look up tags for
-            regexpr (str): A regular expression describing the format of tag to return.
-                Defaults to None.
+            image (str): The name of the image
+
+        Returns:
+            RegistryBackend: The backend, or None if the image is not supported
         """
-        url = "/".join(["https://hub.docker.com/v2/repositories", image_name, "tags"])
-        resp = get_request(url, output="json")
-        tags = resp["results"]
+        if image not in self._backends.keys():
+            host = get_registry_host(image)
+            if host not in self._host_backends.keys():
+                backend_class = get_backend_class(host)
+                # Only backends calling the GitHub API are trusted with the token
+                auth_headers = (
+                    self.inputs.headers if backend_class.uses_github_token else None
+                )
+                self._host_backends[host] = backend_class(
+                    host, auth_headers=auth_headers
+                )
+
+            backend = self._host_backends[host]
+            if not backend.accepts(image):
+                warnings.warn(f"UnknownImage: Cannot recognise image {image}")
+                backend = None
+            self._backends[image] = backend
 
-        # Convert the last updated metadata into a valid datetime object
-        for tag in tags:
-            tag["last_updated"] = isoparse(tag["last_updated"])
+        return self._backends[image]
 
-        # Sort tags by datetime last updated
-        tags = sorted(tags, key=lambda k: k["last_updated"])
+    def _get_most_recent_image_tag(self, key, tag_filter=None):
+        """Look up the most recent tag of an image on the registry it is stored in
 
-        if regexpr is not None:
-            # Filter the names of the tags based on a regular expression
-            regexpr = re.compile(regexpr)
-            tags = [tag for tag in tags if regexpr.match(tag["name"]) is not None]
+        Args:
+            key (tuple): The key of the image to look up tags for
+            tag_filter (TagFilter): The filter describing which tags may be
+                returned. Defaults to None.
+        """
+        name, _ = key
+        self.image_tags[key]["latest"] = self._get_backend(name).get_latest_tag(
+            name, tag_filter=tag_filter
+        )
 
-        # Find the most recent tag
-        if tags[-1]["name"] == "latest":
-            latest_tag = tags[-2]["name"]
-        else:
-            latest_tag = tags[-1]["name"]
+    def _get_lookups(self):
+        """Find the images whose registry is supported
 
-        self.image_tags[image_name]["latest"] = latest_tag
+        Returns:
+            list(tuple): The keys of the images to look up, in the order they
+                appear in the config
+        """
+        return [
+            key
+            for key in self.image_tags.keys()
+            if self._get_backend(key[0]) is not None
+        ]
 
-    def _get_most_recent_image_tag_quayio(self, full_image_name, regexpr=None):
-        """For an image hosted on quay.io, look up the most recent tag
+    def _check_tag_cache(self, lookups):
+        """Fill in the tags of images resolved recently enough to be cached
 
         Args:
-            full_image_name (str): The name of the image to look up tags for. Includes
-                the 'quay.io/' prefix.
-            regexpr (str): A regular expression describing the format of tag to return.
-                Defaults to None.
+            lookups (list(tuple)): The keys of the images to look up
+
+        Returns:
+            to_lookup (list(tuple)): The keys of the images that must be looked
+                up before their tags can be compared
+            to_revalidate (list(tuple)): The keys of the images whose cached tag
+                is stale and should be looked up again in the background
         """
-        # Strip 'quay.io/' from the beginning of the image name
-        image_name = "/".join(full_image_name.split("/")[1:])
+        tag_cache = get_tag_cache()
+        if tag_cache is None:
+            return lookups, []
+
+        to_lookup = []
+        to_revalidate = []
+        for key in lookups:
+            name, _ = key
+            latest, state = tag_cache.load(
+                self._get_backend(name).host,
+                name,
+                self.image_tags[key]["tag_filter"],
+            )
+
+            if state in (FRESH, STALE):
+                logger.info("Using cached tag {} for image: {}", latest, name)
+                self.image_tags[key]["latest"] = latest
+            else:
+                to_lookup.append(key)
 
-        # Construct and make API call to quay.io
-        url = "/".join(["https://quay.io/api/v1/repository", image_name])
-        resp = get_request(url, output="json")
-        tags = [resp["tags"][key] for key in resp["tags"].keys()]
+            if state == STALE:
+                to_revalidate.append(key)
 
-        # Convert the last modified metadata into a valid datetime object
-        for tag in tags:
-            tag["last_modified"] = datetime.strptime(
-                tag["last_modified"], "%a, %d %b %Y %H:%M:%S %z"
+        return to_lookup, to_revalidate
+
+    def _store_tag(self, key, latest):
+        """Store the resolved tag of an image in the tag cache, if it is enabled
+
+        Args:
+            key (tuple): The key of the image
+            latest (str): The latest tag resolved for the image
+        """
+        tag_cache = get_tag_cache()
+        if tag_cache is not None:
+            name, _ = key
+            tag_cache.store(
+                self._get_backend(name).host,
+                name,
+                self.image_tags[key]["tag_filter"],
+                latest,
             )
 
-        tags = sorted(tags, key=lambda k: k["last_modified"])
+    def _revalidate(self, key):
+        """Look up the tag of an image whose cached tag is stale and refresh the
+        cache, without touching the tag the current run is using
 
-        if regexpr is not None:
-            # Filter the names of the tags based on a regular expression
-            regexpr = re.compile(regexpr)
-            tags = [tag for tag in tags if regexpr.match(tag["name"]) is not None]
+        Args:
+            key (tuple): The key of the image
+        """
+        name, _ = key
+        latest = self._get_backend(name).get_latest_tag(
+            name, tag_filter=self.image_tags[key]["tag_filter"]
+        )
+        self._store_tag(key, latest)
 
-        if tags[-1]["name"] == "latest":
-            latest_tag = tags[-2]["name"]
-        else:
-            latest_tag = tags[-1]["name"]
+    def _get_digest_tags(self, key, latest):
+        """List the tags whose digests show whether an image has changed: the tags
+        pinned in the config, the latest tag resolved and the sentinel tag
 
-        self.image_tags[full_image_name]["latest"] = latest_tag
+        Args:
+            key (tuple): The key of the image
+            latest (str): The latest tag resolved for the image, or None
 
-    def _get_most_recent_image_tag_ghcr(self, image_name, regexpr=None):
-        """For an image hosted on GitHub CR, look up the most recent tag
+        Returns:
+            list(str): The names of the tags, sorted
+        """
+        tags = {*self.image_tags[key]["paths"].values(), latest, SENTINEL_TAG}
+        return sorted(tags - {None})
+
+    def _sentinel_tracks_filter(self, key):
+        """Check if the sentinel tag moves whenever a tag the image's filter can
+        pick is pushed. A filter restricting tags to a flavour the sentinel tag
+        does not carry, e.g. an older Python version, makes it no guide.
 
         Args:
-            image_name (str): The name of the image to look up tags for
-            regexpr (str): A regular expression describing the format of tag to return.
-                Defaults to None.
+            key (tuple): The key of the image
+
+        Returns:
+            bool: True if the digest of the sentinel tag shows whether the image
+                has changed
         """
-        _, org, reg_name = image_name.split("/")
-        url = "/".join(
-            [
-                f"https://api.github.com/orgs/{org}/packages/container",
-                reg_name,
-                "versions",
-            ]
+        tag_filter = self.image_tags[key]["tag_filter"]
+        if tag_filter is None:
+            return True
+
+        if all(tag_filter.spec[name] is None for name in FLAVOUR_KEYS):
+            return True
+
+        return tag_filter.matches(SENTINEL_TAG)
+
+    def _load_digests(self, key):
+        """Load the digests recorded when the latest tag of an image was last
+        resolved, if they can show that the image has not changed since
+
+        Args:
+            key (tuple): The key of the image
+
+        Returns:
+            latest (str): The tag that was resolved
+            recorded (dict): The digest of each tag checked, keyed by tag name,
+                or None if the tag listing cannot be skipped
+        """
+        digest_store = get_digest_store()
+        if (digest_store is None) or (not self._sentinel_tracks_filter(key)):
+            return None, None
+
+        name, _ = key
+        latest, recorded = digest_store.load(
+            self._get_backend(name).host,
+            name,
+            self.image_tags[key]["tag_filter"],
         )
-        tags = get_request(url, headers=self.inputs.headers, output="json")
-
-        # Convert the last updated metadata into a valid datetime object
-        for tag in tags:
-            tag["updated_at"] = isoparse(tag["updated_at"])
-
-        # Sort tags by datetime last updated
-        tags = sorted(tags, key=lambda k: k["updated_at"])
-
-        # Make sure we're looking only at versions that have pushed tags
-        tags = [tag for tag in tags if tag["metadata"]["container"]["tags"] is not None]
-
-        if regexpr is not None:
-            # Filter the names of the tags based on a regular expression
-            regexpr = re.compile(regexpr)
-            tags = [
-                tag
-                for tag in tags
-                if regexpr.match(tag["metadata"]["container"]["tags"][0]) is not None
-            ]
-
-        # Find the most recent tag
-        latest_tag = None
-        if tags:
-            if tags[-1]["metadata"]["container"]["tags"][0] == "latest":
-                latest_tag = tags[-2]["metadata"]["container"]["tags"][0]
-            else:
-                latest_tag = tags[-1]["metadata"]["container"]["tags"][0]
 
-        self.image_tags[image_name]["latest"] = latest_tag
+        # Without a sentinel tag, pushing a new tag does not change any digest.
+        # The tags to check also change if a pinned tag has been edited.
+        if (
+            (recorded is None)
+            or (recorded.get(SENTINEL_TAG) is None)
+            or (sorted(recorded.keys()) != self._get_digest_tags(key, latest))
+        ):
+            return None, None
+
+        return latest, recorded
+
+    def _use_recorded_tag(self, key, latest, recorded, digests):
+        """Reuse the latest tag resolved on a previous run if the digests of the
+        image's tags have not changed since
+
+        Args:
+            key (tuple): The key of the image
+            latest (str): The tag resolved on the previous run
+            recorded (dict): The digests recorded on the previous run
+            digests (dict): The digests read on this run
+
+        Returns:
+            bool: True if the recorded tag was used
+        """
+        if digests != recorded:
+            return False
+
+        logger.info("Image {} is unchanged, keeping tag: {}", key[0], latest)
+        self.image_tags[key]["latest"] = latest
+        return True
+
+    def _record_digests(self, key, digests):
+        """Record the digests of an image's tags alongside the latest tag resolved
+
+        Args:
+            key (tuple): The key of the image
+            digests (dict): The digest of each tag checked, keyed by tag name
+        """
+        name, _ = key
+        get_digest_store().store(
+            self._get_backend(name).host,
+            name,
+            self.image_tags[key]["tag_filter"],
+            self.image_tags[key]["latest"],
+            digests,
+        )
+
+    def _get_digests(self, key, tags):
+        """Read the digests of the manifests some tags of an image point to
+
+        Args:
+            key (tuple): The key of the image
+            tags (list(str)): The names of the tags
+
+        Returns:
+            dict: The digest of each tag, or None if it does not exist
+        """
+        name, _ = key
+        backend = self._get_backend(name)
+        return {tag: backend.get_digest(name, tag) for tag in tags}
+
+    def _check_digests(self, key):
+        """Skip listing the tags of an image if the manifests of its tags have not
+        changed since its latest tag was last resolved
+
+        Args:
+            key (tuple): The key of the image
+
+        Returns:
+            skipped (bool): True if the latest tag was filled in without listing
+                tags
+            digests (dict): The digests read while checking, keyed by tag name
+        """
+        latest, recorded = self._load_digests(key)
+        if recorded is None:
+            return False, {}
+
+        # The sentinel tag is the most likely to have moved, so it is checked
+        # before the others
+        tags = [tag for tag in recorded.keys() if tag != SENTINEL_TAG]
+        try:
+            digests = self._get_digests(key, [SENTINEL_TAG])
+            if digests[SENTINEL_TAG] == recorded[SENTINEL_TAG]:
+                digests.update(self._get_digests(key, tags))
+        except DeadlineExceeded:
+            raise
+        except requests.RequestException as err:
+            logger.warning("Could not read digests for image {}: {}", key[0], err)
+            return False, {}
+
+        return self._use_recorded_tag(key, latest, recorded, digests), digests
+
+    def _store_digests(self, key, known=None):
+        """Record the digests of an image's tags after listing them, so the next
+        run can skip the listing if nothing changes. Nothing is recorded for
+        images whose sentinel tag cannot show that they have changed.
+
+        Args:
+            key (tuple): The key of the image
+            known (dict, optional): Digests already read on this run, keyed by
+                tag name, which are not read again. Defaults to None.
+        """
+        if (get_digest_store() is None) or (not self._sentinel_tracks_filter(key)):
+            return
+
+        tags = self._get_digest_tags(key, self.image_tags[key]["latest"])
+        known = {} if known is None else known
+        digests = {tag: known[tag] for tag in tags if tag in known.keys()}
+        try:
+            if SENTINEL_TAG not in digests.keys():
+                digests.update(self._get_digests(key, [SENTINEL_TAG]))
+            if digests[SENTINEL_TAG] is None:
+                return
+            digests.update(
+                self._get_digests(key, [tag for tag in tags if tag not in digests])
+            )
+        except DeadlineExceeded:
+            raise
+        except requests.RequestException as err:
+            logger.warning("Could not read digests for image {}: {}", key[0], err)
+            return
+
+        self._record_digests(key, digests)
+
+    def _get_host_limits(self, lookups):
+        """Create a semaphore per registry host, limiting how many lookups run on
+        it at once to max_concurrency_per_host, or to the backend's own limit if it
+        is lower
+
+        Args:
+            lookups (list(tuple)): The keys of the images to look up
+
+        Returns:
+            dict: The semaphore of each registry host
+        """
+        host_limits = {}
+        for name, _ in lookups:
+            backend = self._get_backend(name)
+            if backend.host not in host_limits.keys():
+                limit = self.inputs.max_concurrency_per_host
+                if backend.max_concurrency is not None:
+                    limit = min(limit, backend.max_concurrency)
+                host_limits[backend.host] = threading.Semaphore(limit)
+
+        return host_limits
 
     def _get_remote_tags(self):
         """
-        Decipher which container registry an image is stored in and find its most
-        recent tags
+        Decipher which container registry each image is stored in and find their
+        most recent tags concurrently. No more than max_concurrency lookups run at
+        once, and no more than max_concurrency_per_host, or the limit declared by
+        the registry's backend, against any one registry.
+        Images with a tag in the tag cache are not looked up, and stale cached tags
+        are refreshed in the background once the other lookups are queued. Tags
+        are not listed for images whose manifest digests are unchanged. Images on
+        registries whose backend skips failed lookups are left as they are if
+        their tags cannot be looked up.
         """
         logger.info("Fetching most recently published image tags...")
-        for image in self.image_tags.keys():
-            if len(image.split("/")) == 2:
-                self._get_most_recent_image_tag_dockerhub(
-                    image, regexpr=self.image_tags[image]["regexpr"]
-                )
-            elif len(image.split("/")) > 2:
-                if image.split("/")[0] == "quay.io":
-                    self._get_most_recent_image_tag_quayio(
-                        image, regexpr=self.image_tags[image]["regexpr"]
-                    )
-                elif image.split("/")[0] == "ghcr.io":
-                    self._get_most_recent_image_tag_ghcr(
-                        image, regexpr=self.image_tags[image]["regexpr"]
-                    )
-                else:
+        keys = self._get_lookups()
+        host_limits = self._get_host_limits(keys)
+        lookups, to_revalidate = self._check_tag_cache(keys)
+
+        def run_lookup(key):
+            name, _ = key
+            backend = self._get_backend(name)
+            with host_limits[backend.host]:
+                try:
+                    skipped, digests = self._check_digests(key)
+                    if not skipped:
+                        self._get_most_recent_image_tag(
+                            key, tag_filter=self.image_tags[key]["tag_filter"]
+                        )
+                        self._store_digests(key, digests)
+                except DeadlineExceeded:
+                    raise
+                except requests.RequestException as err:
+                    if not backend.skip_failed_lookups:
+                        raise
                     warnings.warn(
-                        f"NotImplemented: Cannot currently retrieve images from {image.split('/')[0]}"
+                        f"LookupFailed: Cannot look up tags of image {name}: {err}"
                     )
-                    continue
-            else:
-                warnings.warn(f"UnknownImage: Cannot recognise image {image}")
-                continue
+                    self.image_tags[key]["latest"] = None
+                    return
+            self._store_tag(key, self.image_tags[key]["latest"])
+
+        def run_revalidation(key):
+            with host_limits[self._get_backend(key[0]).host]:
+                self._revalidate(key)
+
+        executor = ThreadPoolExecutor(max_workers=self.inputs.max_concurrency)
+        futures = [executor.submit(run_lookup, key) for key in lookups]
+        self._revalidations = [
+            executor.submit(run_revalidation, key) for key in to_revalidate
+        ]
+        # Let any revalidations finish in the background
+        executor.shutdown(wait=False)
+
+        # Each lookup only writes the entry of its own image, so the results end
+        # up in config order. Errors are raised for the first failing image in
+        # that order too, after cancelling any lookups not yet started.
+        try:
+            for future in futures:
+                future.result()
+        except Exception:
+            for future in futures + self._revalidations:
+                future.cancel()
+            raise
+
+    def wait_for_revalidation(self):
+        """Wait for stale cached tags to be refreshed in the background, so the
+        cache is up to date for the next run. A failed refresh leaves the stale
+        tag in the cache.
+        """
+        for future in self._revalidations:
+            try:
+                future.result()
+            except Exception as err:
+                logger.warning("Could not refresh a cached image tag: {}", err)
+
+        self._revalidations = []
 
     def _compare_image_tags(self):
         """Compare the image tags from the config file to those most recently
         published on the container registry and ascertain if an image can be updated
 
         Returns:
-            images_to_update (list): A list of docker images that need updating
+            images_to_update (list): The keys of the images that need updating
         """
+        # Images without a matching tag on the registry are left as they are. An
+        # image is updated if any of the paths using it is out of date.
         cond = [
-            self.image_tags[image]["current"] != self.image_tags[image]["latest"]
-            for image in self.image_tags.keys()
+            (tags.get("latest") is not None)
+            and any(tag != tags["latest"] for tag in tags["paths"].values())
+            for tags in self.image_tags.values()
         ]
         return list(compress(self.image_tags.keys(), cond))
 
@@ -241,7 +578,8 @@ class ImageTags:
         tag published in a container registry, and compare which images are out of
         date
         """
-        self.inputs.config, self.inputs.sha = self._get_config(self.branch)
+        self.inputs.config_text, self.inputs.sha = self._get_config(self.branch)
+        self.inputs.config = None
         self._get_local_image_tags()
         self._get_remote_tags()
         self.inputs.images_to_update = self._compare_image_tags()
@@ -0,0 +1,265 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from loguru import logger
+
+# Once fewer than this fraction of a host's request budget remains, requests are
+# spread evenly across the time left until the budget is reset
+PACING_THRESHOLD = 0.1
+
+# How long to back off for when a host signals a rate limit without saying when
+# it will be lifted
+DEFAULT_BACKOFF = 60
+
+# The number of times a rate limited request is retried before giving up
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class RateLimitExceeded(requests.HTTPError):
+    """Raised when waiting for a rate limit to reset would take too long"""
+
+
+def _parse_int(value):
+    """Parse the integer at the start of a rate limit header value. Docker Hub
+    suffixes its values with the window they apply to, e.g. '100;w=21600'.
+
+    Args:
+        value (str): The header value
+
+    Returns:
+        int: The parsed value, or None if the header is missing or malformed
+    """
+    if value is None:
+        return None
+
+    try:
+        return int(value.split(";")[0].strip())
+    except ValueError:
+        return None
+
+
+def _parse_window(value):
+    """Parse the window suffix of a Docker Hub rate limit header, e.g. '100;w=21600'
+
+    Args:
+        value (str): The header value
+
+    Returns:
+        int: The length of the window in seconds, or None if there is no window
+    """
+    if value is None:
+        return None
+
+    for part in value.split(";")[1:]:
+        key, _, window = part.partition("=")
+        if key.strip() == "w":
+            return _parse_int(window)
+
+    return None
+
+
+def _parse_retry_after(value, now):
+    """Parse a Retry-After header, which may be given in seconds or as an HTTP date
+
+    Args:
+        value (str): The header value
+        now (float): The current time as a UNIX timestamp
+
+    Returns:
+        float: The UNIX timestamp requests may resume at, or None
+    """
+    if value is None:
+        return None
+
+    seconds = _parse_int(value)
+    if seconds is not None:
+        return now + seconds
+
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class HostState:
+    """The rate limit budget last advertised by a host"""
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.blocked_until = None
+        self.next_slot = 0.0
+        # The minimum number of seconds between requests, if the host is known
+        # to limit requests more tightly than its headers say
+        self.min_interval = 0.0
+
+
+class RateLimiter:
+    """
+    Schedule requests per host according to the rate limit headers each host
+    returns. Requests are paced once a host's budget runs low, and held back until
+    the budget resets when it has been used up, rather than being sent to fail.
+    """
+
+    def __init__(self, max_wait=3600, sleep=time.sleep, clock=time.time):
+        self.max_wait = max_wait
+        self.sleep = sleep
+        self.clock = clock
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _get_host_state(self, url):
+        host = urlparse(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = HostState()
+
+        return self._hosts[host]
+
+    def set_rate(self, host, rate):
+        """Limit the number of requests per second sent to a host, on top of the
+        limits its rate limit headers advertise
+
+        Args:
+            host (str): The host, as it appears in request URLs
+            rate (float): The maximum number of requests per second
+        """
+        with self._lock:
+            self._get_host_state(f"https://{host}").min_interval = 1 / rate
+
+    def _get_delay(self, state, now):
+        """Work out how long to wait before the next request to a host may be sent
+
+        Args:
+            state (HostState): The rate limit state of the host
+            now (float): The current time as a UNIX timestamp
+
+        Returns:
+            float: The number of seconds to wait
+        """
+        if (state.blocked_until is not None) and (state.blocked_until > now):
+            return state.blocked_until - now
+
+        if (state.remaining is None) or (state.reset_at is None):
+            return 0.0
+
+        if state.reset_at <= now:
+            # The budget has been replenished since we last heard from the host
+            state.remaining = None
+            return 0.0
+
+        if state.remaining <= 0:
+            return state.reset_at - now
+
+        if (state.limit is not None) and (
+            state.remaining < state.limit * PACING_THRESHOLD
+        ):
+            interval = (state.reset_at - now) / state.remaining
+            return max(0.0, state.next_slot + interval - now)
+
+        return 0.0
+
+    def reserve(self, url):
+        """Reserve one request from the budget of the host of a URL and work out
+        how long to wait before sending it
+
+        Args:
+            url (str): The URL a request is about to be sent to
+
+        Returns:
+            float: The number of seconds to wait before sending the request
+        """
+        with self._lock:
+            state = self._get_host_state(url)
+            now = self.clock()
+            delay = max(
+                self._get_delay(state, now),
+                state.next_slot + state.min_interval - now,
+            )
+
+            if (self.max_wait is not None) and (delay > self.max_wait):
+                raise RateLimitExceeded(
+                    f"Rate limit for {urlparse(url).netloc} resets in {delay:.0f}s, "
+                    + f"which is longer than the maximum wait of {self.max_wait}s"
+                )
+
+            if state.remaining is not None:
+                state.remaining -= 1
+            state.next_slot = now + delay
+
+        if delay > 0:
+            logger.info(
+                "Waiting {:.1f}s for the rate limit of {} to allow another request",
+                delay,
+                urlparse(url).netloc,
+            )
+
+        return delay
+
+    def update(self, url, resp):
+        """Record the rate limit budget advertised in the headers of a response
+
+        Args:
+            url (str): The URL the request was sent to
+            resp (requests.Response): The response to the request
+        """
+        headers = resp.headers
+        now = self.clock()
+
+        limit_header = headers.get("X-RateLimit-Limit", headers.get("RateLimit-Limit"))
+        remaining_header = headers.get(
+            "X-RateLimit-Remaining", headers.get("RateLimit-Remaining")
+        )
+        remaining = _parse_int(remaining_header)
+        reset_at = _parse_int(headers.get("X-RateLimit-Reset"))
+        if (reset_at is None) and (remaining == 0):
+            # Docker Hub only tells us the length of the window the limit covers,
+            # so assume the worst case of the window having just started. Without
+            # a known reset time, requests are not paced until the budget is spent.
+            window = _parse_window(remaining_header)
+            reset_at = None if window is None else now + window
+
+        with self._lock:
+            state = self._get_host_state(url)
+
+            if remaining is not None:
+                state.limit = _parse_int(limit_header)
+                state.remaining = remaining
+                state.reset_at = reset_at
+
+            if not self.is_rate_limited(resp):
+                return
+
+            blocked_until = _parse_retry_after(headers.get("Retry-After"), now)
+            if blocked_until is None:
+                if (state.remaining == 0) and (state.reset_at is not None):
+                    blocked_until = state.reset_at
+                else:
+                    blocked_until = now + DEFAULT_BACKOFF
+            state.blocked_until = blocked_until
+
+    @staticmethod
+    def is_rate_limited(resp):
+        """Decide whether a failed response was caused by a rate limit, as opposed
+        to, for example, a lack of permissions
+
+        Args:
+            resp (requests.Response): The response to check
+
+        Returns:
+            bool: True if the request should be retried once the limit has reset
+        """
+        if resp.status_code == 429:
+            return True
+
+        if resp.status_code == 403:
+            return (
+                _parse_int(resp.headers.get("X-RateLimit-Remaining")) == 0
+                or ("Retry-After" in resp.headers)
+                or ("rate limit" in resp.text.lower())
+            )
+
+        return False
@@ -0,0 +1,388 @@
+from abc import ABC, abstractmethod
+from importlib.metadata import entry_points
+
+from loguru import logger
+
+from .http_requests import get_paginated_request, set_rate_limit
+from .oci_registry import get_registry, is_registry_host
+from .tag_selector import TagSelector, natural_sort_key
+
+# The entry point group other packages register RegistryBackend subclasses
+# under, to look up images on registries this package does not support
+ENTRY_POINT_GROUP = "tag_bot.registries"
+
+# The registry images without a registry host in their name are stored on
+DEFAULT_HOST = "hub.docker.com"
+
+# The other hosts image names on Docker Hub may be written with
+DOCKERHUB_ALIASES = ("docker.io", "index.docker.io", "registry-1.docker.io")
+
+# The namespace of Docker Hub's official images, which are named without an owner
+DOCKERHUB_LIBRARY = "library"
+
+# Docker Hub serves the registry API for its images from a different host to
+# its tag listings
+DOCKERHUB_REGISTRY_HOST = "registry-1.docker.io"
+
+# The number of tags to request per page from Docker Hub and quay.io. Tags are
+# requested newest first, so the tag we want is usually on the first page.
+# Ranking tags by another key, e.g. semantic version, means reading every page,
+# so the largest pages the registries allow are requested instead.
+DOCKERHUB_PAGE_SIZE = 25
+QUAYIO_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+_backend_classes = None
+
+
+def get_registry_host(image):
+    """Find the host of the container registry an image is stored in
+
+    Args:
+        image (str): The name of the image
+
+    Returns:
+        str: The registry host
+    """
+    component = image.split("/")[0]
+    if (len(image.split("/")) > 1) and is_registry_host(component):
+        return DEFAULT_HOST if component in DOCKERHUB_ALIASES else component
+
+    return DEFAULT_HOST
+
+
+class RegistryBackend(ABC):
+    """
+    Look up the tags of images stored on a container registry. Subclasses name
+    the hosts they serve and implement list_tags. The other methods default to
+    the OCI Distribution API, and can be overridden where a registry differs.
+
+    Other packages can add backends by registering a subclass under the
+    'tag_bot.registries' entry point group. A registered backend replaces any
+    built-in backend for the same host.
+    """
+
+    # The hosts of the registries the backend serves
+    hosts = ()
+
+    # The maximum number of images to look up at once on the registry, or None
+    # to only apply the max_concurrency_per_host input
+    max_concurrency = None
+
+    # The maximum number of requests per second to send to the API listing the
+    # tags, or None to rely on the rate limit headers the API returns
+    rate_limit = None
+
+    # How to rank tags, or None if the registry lists tags newest first
+    sort_key = None
+
+    # Whether an image whose tags cannot be looked up is skipped with a warning,
+    # rather than failing the run
+    skip_failed_lookups = False
+
+    # Whether the backend is given the token the Action was run with. Only set
+    # this for backends sending requests to the GitHub API.
+    uses_github_token = False
+
+    def __init__(self, host, auth_headers=None):
+        """
+        Args:
+            host (str): The host of the registry
+            auth_headers (dict, optional): The headers authenticating requests to
+                the GitHub API with the token the Action was given, for backends
+                that use it. Defaults to None.
+        """
+        self.host = host
+        self.auth_headers = auth_headers or {}
+
+        if self.rate_limit is not None:
+            set_rate_limit(self.api_host, self.rate_limit)
+
+    @property
+    def api_host(self):
+        """str: The host of the API listing the tags"""
+        return self.host
+
+    def accepts(self, image):
+        """Check if the backend can look up the tags of an image
+
+        Args:
+            image (str): The name of the image
+
+        Returns:
+            bool: True if the image can be looked up
+        """
+        return True
+
+    def get_repository(self, image):
+        """Strip the registry host from the name of an image
+
+        Args:
+            image (str): The name of the image
+
+        Returns:
+            str: The name of the repository on the registry
+        """
+        if image.startswith(f"{self.host}/"):
+            return image[len(self.host) + 1 :]
+
+        return image
+
+    def get_manifest_location(self, image):
+        """Find where the manifests of an image can be read over the registry API
+
+        Args:
+            image (str): The name of the image
+
+        Returns:
+            host (str): The host serving the registry API
+            repository (str): The name of the repository on the registry
+        """
+        return self.host, self.get_repository(image)
+
+    @abstractmethod
+    def list_tags(self, image, tag_filter=None):
+        """Lazily iterate over the tags of an image
+
+        Args:
+            image (str): The name of the image
+            tag_filter (TagFilter, optional): The filter describing which tags may
+                be returned, whose prefix hint can be used to shrink the listing.
+                Defaults to None.
+
+        Yields:
+            str: The name of each tag, in the order the registry lists them
+        """
+
+    def get_latest_tag(self, image, tag_filter=None):
+        """Look up the most recent tag of an image
+
+        Args:
+            image (str): The name of the image
+            tag_filter (TagFilter, optional): The filter describing which tags may
+                be returned. Defaults to None.
+
+        Returns:
+            str: The name of the tag, or None if no tag matches
+        """
+        selector = TagSelector(tag_filter, key=self.sort_key)
+        return selector.select(self.list_tags(image, tag_filter=tag_filter))
+
+    def get_digest(self, image, tag):
+        """Read the digest of the manifest a tag of an image points to
+
+        Args:
+            image (str): The name of the image
+            tag (str): The name of the tag
+
+        Returns:
+            str: The digest, or None if the tag does not exist
+        """
+        host, repository = self.get_manifest_location(image)
+        return get_registry(host).get_digest(repository, tag)
+
+
+class DockerHubBackend(RegistryBackend):
+    """Look up the tags of images stored on Docker Hub"""
+
+    hosts = (DEFAULT_HOST,)
+
+    def accepts(self, image):
+        return len(self.get_repository(image).split("/")) == 2
+
+    def get_repository(self, image):
+        """Strip any Docker Hub host from the name of an image, and place
+        official images in the 'library' namespace, as the Docker CLI does
+
+        Args:
+            image (str): The name of the image
+
+        Returns:
+            str: The name of the repository on Docker Hub
+        """
+        host, _, repository = image.partition("/")
+        if host not in (DEFAULT_HOST,) + DOCKERHUB_ALIASES:
+            repository = image
+        if "/" not in repository:
+            repository = "/".join([DOCKERHUB_LIBRARY, repository])
+
+        return repository
+
+    def get_manifest_location(self, image):
+        return DOCKERHUB_REGISTRY_HOST, self.get_repository(image)
+
+    @staticmethod
+    def _get_params(tag_filter=None):
+        """Build the query parameters listing Docker Hub tags newest first. Docker
+        Hub only returns tags containing the 'name' parameter, so the prefix hint
+        of the tag filter is passed along to skip tags that cannot match.
+
+        Args:
+            tag_filter (TagFilter, optional): The filter describing which tags may
+                be returned. Defaults to None.
+
+        Returns:
+            dict: The query parameters
+        """
+        params = {"ordering": "last_updated", "page_size": DOCKERHUB_PAGE_SIZE}
+        if tag_filter is not None:
+            if tag_filter.prefix is not None:
+                params["name"] = tag_filter.prefix
+            if tag_filter.sort_key is not None:
+                params["page_size"] = MAX_PAGE_SIZE
+
+        return params
+
+    def _get_url(self, image):
+        return "/".join(
+            [
+                "https://hub.docker.com/v2/repositories",
+                self.get_repository(image),
+                "tags",
+            ]
+        )
+
+    def list_tags(self, image, tag_filter=None):
+        for tag in get_paginated_request(
+            self._get_url(image),
+            params=self._get_params(tag_filter),
+            items_key="results",
+        ):
+            yield tag["name"]
+
+
+class QuayIoBackend(RegistryBackend):
+    """Look up the tags of images stored on quay.io"""
+
+    hosts = ("quay.io",)
+
+    @staticmethod
+    def _get_params(tag_filter=None):
+        """Build the query parameters listing the active quay.io tags. quay.io
+        lists the most recently pushed tags first, and can filter tags by the
+        prefix hint of the tag filter.
+
+        Args:
+            tag_filter (TagFilter, optional): The filter describing which tags may
+                be returned. Defaults to None.
+
+        Returns:
+            dict: The query parameters
+        """
+        params = {"onlyActiveTags": "true", "limit": QUAYIO_PAGE_SIZE}
+        if tag_filter is not None:
+            if tag_filter.prefix is not None:
+                params["filter_tag_name"] = f"like:{tag_filter.prefix}%"
+            if tag_filter.sort_key is not None:
+                params["limit"] = MAX_PAGE_SIZE
+
+        return params
+
+    def _get_url(self, image):
+        return "/".join(
+            ["https://quay.io/api/v1/repository", self.get_repository(image), "tag/"]
+        )
+
+    def list_tags(self, image, tag_filter=None):
+        for tag in get_paginated_request(
+            self._get_url(image), params=self._get_params(tag_filter), items_key="tags"
+        ):
+            yield tag["name"]
+
+
+class GhcrBackend(RegistryBackend):
+    """
+    Look up the tags of images stored on GitHub CR, through the GitHub API's
+    listing of package versions. The API lists the most recently created versions
+    first, and a version may carry several tags, all of which are considered.
+    Untagged versions are skipped.
+    """
+
+    hosts = ("ghcr.io",)
+    uses_github_token = True
+
+    @property
+    def api_host(self):
+        return "api.github.com"
+
+    def _get_url(self, image):
+        org, reg_name = self.get_repository(image).split("/")
+        return "/".join(
+            [
+                f"https://api.github.com/orgs/{org}/packages/container",
+                reg_name,
+                "versions",
+            ]
+        )
+
+    def list_tags(self, image, tag_filter=None):
+        for version in get_paginated_request(
+            self._get_url(image), headers=self.auth_headers, params={"per_page": 100}
+        ):
+            yield from version["metadata"]["container"]["tags"] or []
+
+
+class OciBackend(RegistryBackend):
+    """
+    Look up the tags of images stored on any other registry implementing the OCI
+    Distribution API. The API does not say when tags were pushed, so tags are
+    ranked by name instead.
+    """
+
+    sort_key = staticmethod(natural_sort_key)
+
+    # Private registries or hosts not serving the API fail to list their tags,
+    # which should not stop the images on other registries being bumped
+    skip_failed_lookups = True
+
+    def list_tags(self, image, tag_filter=None):
+        return get_registry(self.host).list_tags(self.get_repository(image))
+
+
+def _load_backend_classes():
+    """Index the built-in backends, and those registered under the entry point
+    group, by the registry hosts they serve
+
+    Returns:
+        dict: The backend class serving each host
+    """
+    backend_classes = {}
+    for backend_class in [DockerHubBackend, QuayIoBackend, GhcrBackend]:
+        for host in backend_class.hosts:
+            backend_classes[host] = backend_class
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            backend_class = entry_point.load()
+        except Exception as err:
+            logger.warning(
+                "Could not load registry backend {}: {}", entry_point.name, err
+            )
+            continue
+
+        logger.info(
+            "Using registry backend {} for hosts: {}",
+            entry_point.name,
+            list(backend_class.hosts),
+        )
+        for host in backend_class.hosts:
+            backend_classes[host] = backend_class
+
+    return backend_classes
+
+
+def get_backend_class(host):
+    """Find the backend serving a registry host. Hosts without a dedicated
+    backend are assumed to implement the OCI Distribution API.
+
+    Args:
+        host (str): The host of the registry
+
+    Returns:
+        type: The RegistryBackend subclass serving the host
+    """
+    global _backend_classes
+    if _backend_classes is None:
+        _backend_classes = _load_backend_classes()
+
+    return _backend_classes.get(host, OciBackend)
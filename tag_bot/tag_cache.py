@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import time
+
+from .http_cache import load_entry, write_entry
+
+# Whether a cached tag can be used as it is, used while it is refreshed, or
+# must be looked up again
+FRESH = "fresh"
+STALE = "stale"
+EXPIRED = "expired"
+
+# The number of seconds recorded digests are trusted for. Once they are older,
+# the image's tags are listed in full, in case a matching tag was pushed without
+# moving the tags whose digests were recorded.
+DEFAULT_DIGEST_MAX_AGE = 24 * 60 * 60
+
+_tag_cache = None
+_digest_store = None
+
+
+def _get_entry_path(cache_dir, host, image, tag_filter):
+    """Work out where the entry for an image is stored. The tag filter is part of
+    the key, since it changes which tag is resolved.
+
+    Args:
+        cache_dir (str): The directory entries are stored in
+        host (str): The host of the registry the image is stored in
+        image (str): The name of the image
+        tag_filter (TagFilter): The filter the tag is resolved with, or None
+
+    Returns:
+        str: The path of the entry
+    """
+    spec = None if tag_filter is None else tag_filter.spec
+    key = json.dumps([host, image, spec], sort_keys=True)
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"{digest}.json")
+
+
+def configure_tag_cache(cache_dir=None, ttl=0, stale_ttl=0):
+    """Enable or disable the persistent cache of resolved image tags
+
+    Args:
+        cache_dir (str, optional): The directory to store resolved tags in.
+            Defaults to None, which disables the cache.
+        ttl (float, optional): The number of seconds a resolved tag is used for
+            without looking it up again. Defaults to 0, which disables the cache.
+        stale_ttl (float, optional): The number of seconds past the ttl during
+            which a resolved tag is still used while it is looked up again in
+            the background. Defaults to 0.
+    """
+    global _tag_cache
+    _tag_cache = TagCache(cache_dir, ttl, stale_ttl) if (cache_dir and ttl) else None
+
+
+def get_tag_cache():
+    """Return the persistent cache of resolved image tags
+
+    Returns:
+        TagCache: The cache, or None if it is disabled
+    """
+    return _tag_cache
+
+
+def configure_digest_store(store_dir=None, max_age=DEFAULT_DIGEST_MAX_AGE):
+    """Enable or disable the store of manifest digests used to skip listing the
+    tags of images that have not changed since the last run
+
+    Args:
+        store_dir (str, optional): The directory to store digests in. Defaults
+            to None, which disables the store.
+        max_age (float, optional): The number of seconds recorded digests are
+            trusted for. Defaults to DEFAULT_DIGEST_MAX_AGE.
+    """
+    global _digest_store
+    _digest_store = DigestStore(store_dir, max_age) if store_dir else None
+
+
+def get_digest_store():
+    """Return the store of manifest digests
+
+    Returns:
+        DigestStore: The store, or None if it is disabled
+    """
+    return _digest_store
+
+
+class TagCache:
+    """
+    Persist the latest tag resolved for an image on disk, so that runs checking
+    the same images shortly after one another do not repeat the lookup. Once a
+    tag is older than the ttl it is served stale for up to stale_ttl more seconds
+    while a fresh lookup runs in the background.
+    """
+
+    def __init__(self, cache_dir, ttl, stale_ttl=0, clock=time.time):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def load(self, host, image, tag_filter):
+        """Load the resolved tag of an image, if there is one
+
+        Args:
+            host (str): The host of the registry the image is stored in
+            image (str): The name of the image
+            tag_filter (TagFilter): The filter the tag is resolved with, or None
+
+        Returns:
+            latest (str): The resolved tag, or None
+            state (str): FRESH, STALE or EXPIRED
+        """
+        entry = load_entry(_get_entry_path(self.cache_dir, host, image, tag_filter))
+        if entry is None:
+            return None, EXPIRED
+
+        age = self.clock() - entry["resolved_at"]
+        if age < self.ttl:
+            return entry["latest"], FRESH
+        if age < self.ttl + self.stale_ttl:
+            return entry["latest"], STALE
+
+        return None, EXPIRED
+
+    def store(self, host, image, tag_filter, latest):
+        """Store the latest tag resolved for an image
+
+        Args:
+            host (str): The host of the registry the image is stored in
+            image (str): The name of the image
+            tag_filter (TagFilter): The filter the tag was resolved with, or None
+            latest (str): The resolved tag
+        """
+        entry = {"image": image, "latest": latest, "resolved_at": self.clock()}
+        write_entry(_get_entry_path(self.cache_dir, host, image, tag_filter), entry)
+
+
+class DigestStore:
+    """
+    Remember the digests of the manifests an image's tags pointed to when its
+    latest tag was last resolved. If the digests of the pinned tags, of the tag
+    resolved last time and of the 'latest' tag are all unchanged, nothing has been
+    pushed since and the tag listing can be skipped, at the cost of a HEAD request
+    per tag rather than pages of tag JSON. Digests older than max_age are ignored,
+    so the tags are listed in full from time to time.
+    """
+
+    def __init__(self, store_dir, max_age=DEFAULT_DIGEST_MAX_AGE, clock=time.time):
+        self.store_dir = store_dir
+        self.max_age = max_age
+        self.clock = clock
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    def load(self, host, image, tag_filter):
+        """Load the digests recorded when the latest tag of an image was resolved
+
+        Args:
+            host (str): The host of the registry the image is stored in
+            image (str): The name of the image
+            tag_filter (TagFilter): The filter the tag is resolved with, or None
+
+        Returns:
+            latest (str): The tag that was resolved
+            digests (dict): The digest of each tag checked, keyed by tag name, or
+                None if no digests were recorded within max_age
+        """
+        entry = load_entry(_get_entry_path(self.store_dir, host, image, tag_filter))
+        if (entry is None) or ("recorded_at" not in entry.keys()):
+            return None, None
+
+        if self.clock() - entry["recorded_at"] >= self.max_age:
+            return None, None
+
+        return entry["latest"], entry["digests"]
+
+    def store(self, host, image, tag_filter, latest, digests):
+        """Record the digests of the tags of an image after resolving its latest
+        tag
+
+        Args:
+            host (str): The host of the registry the image is stored in
+            image (str): The name of the image
+            tag_filter (TagFilter): The filter the tag was resolved with, or None
+            latest (str): The resolved tag
+            digests (dict): The digest of each tag checked, keyed by tag name
+        """
+        entry = {
+            "image": image,
+            "latest": latest,
+            "digests": digests,
+            "recorded_at": self.clock(),
+        }
+        write_entry(_get_entry_path(self.store_dir, host, image, tag_filter), entry)
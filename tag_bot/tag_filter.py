@@ -0,0 +1,147 @@
+import fnmatch
+import re
+
+from .tag_selector import semver_sort_key
+
+# The keys of an images_info entry that describe which tags may be bumped to
+FILTER_KEYS = ("regexpr", "include", "exclude", "prefix", "sort")
+
+# How the tags of an image can be ranked. 'time' trusts the registry to list
+# the most recently pushed tags first.
+SORT_KEYS = {"time": None, "semver": semver_sort_key}
+
+# Characters with a special meaning in a regular expression, which end the
+# literal prefix of the expression
+REGEX_SPECIAL_CHARS = set(".^$*+?{}[]()|\\")
+
+
+def _compile_globs(patterns):
+    """Compile a list of glob patterns, e.g. 'cuda-*', into one regular expression
+    matching a tag name against any of them
+
+    Args:
+        patterns (list[str]): The glob patterns
+
+    Returns:
+        re.Pattern: The compiled expression, or None if there are no patterns
+    """
+    if not patterns:
+        return None
+
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns))
+
+
+def get_literal_prefix(regexpr):
+    """Find the literal characters every tag matching a regular expression must
+    start with, e.g. 'python-3.' for 'python-3\\.[0-9]+'. The expression is
+    matched from the start of the tag name.
+
+    Args:
+        regexpr (str): The regular expression
+
+    Returns:
+        str: The literal prefix, or None if the expression does not have one
+    """
+    if "|" in regexpr:
+        # Any alternative could match, so no prefix is shared by all matches
+        return None
+
+    prefix = ""
+    i = 1 if regexpr.startswith("^") else 0
+    while i < len(regexpr):
+        char = regexpr[i]
+        if char == "\\":
+            # Escaped punctuation is a literal, but escapes like \d are not
+            char = regexpr[i + 1 : i + 2]
+            if (not char) or char.isalnum():
+                break
+            i += 1
+        elif char in REGEX_SPECIAL_CHARS:
+            break
+
+        quantifier = regexpr[i + 1 : i + 2]
+        if quantifier in ("?", "*", "{"):
+            # The character may not appear at all
+            break
+
+        prefix += char
+        if quantifier == "+":
+            break
+        i += 1
+
+    return prefix or None
+
+
+class TagFilter:
+    """
+    Decide which tags of an image may be bumped to, and how they are ranked, as
+    described by an entry of images_info. The filter is compiled once when the
+    inputs are read, and offers a prefix hint that registries able to filter tags
+    server-side can use to shrink their listings.
+    """
+
+    def __init__(
+        self, regexpr=None, include=None, exclude=None, prefix=None, sort=None
+    ):
+        if (sort is not None) and (sort not in SORT_KEYS.keys()):
+            raise ValueError(
+                f"Invalid sort {sort!r}. Please choose one of: {list(SORT_KEYS)}"
+            )
+
+        # The inputs the filter was compiled from, identifying it in caches
+        self.spec = {
+            "regexpr": regexpr,
+            "include": include,
+            "exclude": exclude,
+            "prefix": prefix,
+            "sort": sort,
+        }
+        self.sort_key = None if sort is None else SORT_KEYS[sort]
+        self.regexpr = None if regexpr is None else re.compile(regexpr)
+        self.include = _compile_globs(include)
+        self.exclude = _compile_globs(exclude)
+        self.prefix = prefix
+
+        # A regular expression starting with literal characters gives a prefix
+        # hint for free
+        if (self.prefix is None) and (regexpr is not None):
+            self.prefix = get_literal_prefix(regexpr)
+
+    @classmethod
+    def from_image_info(cls, image_info):
+        """Compile the filter described by an entry of images_info
+
+        Args:
+            image_info (dict): The entry of images_info
+
+        Returns:
+            TagFilter: The compiled filter, or None if the entry does not filter
+                tags
+        """
+        if not any(key in image_info.keys() for key in FILTER_KEYS):
+            return None
+
+        return cls(**{key: image_info.get(key, None) for key in FILTER_KEYS})
+
+    def matches(self, name):
+        """Check if a tag passes the filter
+
+        Args:
+            name (str): The name of the tag
+
+        Returns:
+            bool: True if the tag may be bumped to
+        """
+        if (self.prefix is not None) and (not name.startswith(self.prefix)):
+            return False
+
+        if (self.regexpr is not None) and (self.regexpr.match(name) is None):
+            return False
+
+        if (self.include is not None) and (self.include.match(name) is None):
+            return False
+
+        if (self.exclude is not None) and (self.exclude.match(name) is not None):
+            return False
+
+        return True
@@ -0,0 +1,133 @@
+import re
+
+
+def natural_sort_key(name):
+    """Build a key that sorts tag names with the numbers they contain compared by
+    value, so that '1.10.0' sorts after '1.9.0'
+
+    Args:
+        name (str): The name of the tag
+
+    Returns:
+        list(tuple): The sort key
+    """
+    return [
+        (1, int(chunk), "") if chunk.isdigit() else (0, 0, chunk)
+        for chunk in re.split(r"(\d+)", name)
+        if chunk
+    ]
+
+
+SEMVER_PATTERN = re.compile(
+    r"^v?(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)"
+    r"(?:-([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?"
+    r"(?:\+[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?$"
+)
+
+
+def semver_sort_key(name):
+    """Build a key that sorts tag names by semantic version precedence, where a
+    pre-release sorts before the release it leads up to. Build metadata is
+    ignored, and an optional leading 'v' is allowed.
+
+    Args:
+        name (str): The name of the tag
+
+    Returns:
+        tuple: The sort key, or None if the tag is not a semantic version
+    """
+    match = SEMVER_PATTERN.match(name)
+    if match is None:
+        return None
+
+    major, minor, patch, prerelease = match.groups()
+    if prerelease is None:
+        # A release ranks above any of its pre-releases
+        return (int(major), int(minor), int(patch), 1, ())
+
+    # Numeric identifiers rank below alphanumeric ones and compare by value
+    identifiers = tuple(
+        (0, int(part), "") if part.isdigit() else (1, 0, part)
+        for part in prerelease.split(".")
+    )
+    return (int(major), int(minor), int(patch), 0, identifiers)
+
+
+class TagSelector:
+    """
+    Select the most recent tag from a stream of tags, one tag at a time, keeping
+    only the best candidate seen so far. Tags can be fed in from any registry
+    backend and across any number of pages without the listing ever being held in
+    memory or sorted.
+
+    Without a key, tags are assumed to arrive newest first, so the first candidate
+    wins and the selector is done. With a key, every tag has to be seen and the
+    candidate with the highest key wins. A sort key set by the tag filter, e.g.
+    for 'sort: semver', takes precedence over the key passed in. Each tag's key is
+    computed once, and only the key of the best candidate is kept.
+    """
+
+    def __init__(self, tag_filter=None, key=None):
+        self.tag_filter = tag_filter
+        self.key = key
+        if (tag_filter is not None) and (tag_filter.sort_key is not None):
+            self.key = tag_filter.sort_key
+        self.best = None
+        self.done = False
+        self._best_key = None
+
+    def is_candidate(self, name):
+        """Check if a tag could be bumped to, i.e. it is not 'latest' and it passes
+        the tag filter of the image
+
+        Args:
+            name (str): The name of the tag
+
+        Returns:
+            bool: True if the tag can be bumped to
+        """
+        return (name != "latest") and (
+            (self.tag_filter is None) or self.tag_filter.matches(name)
+        )
+
+    def feed(self, name):
+        """Consider the next tag of the stream
+
+        Args:
+            name (str): The name of the tag
+
+        Returns:
+            bool: True once no later tag can replace the best candidate
+        """
+        if self.done or not self.is_candidate(name):
+            return self.done
+
+        if self.key is None:
+            self.best = name
+            self.done = True
+        else:
+            key = self.key(name)
+            if key is None:
+                # The tag cannot be ranked, e.g. it is not a semantic version
+                return self.done
+            if (self.best is None) or (key > self._best_key):
+                self.best = name
+                self._best_key = key
+
+        return self.done
+
+    def select(self, tags):
+        """Feed tags to the selector until it is done or the tags run out
+
+        Args:
+            tags (iterable(str)): The names of the tags to consider, in the order
+                listed by the registry
+
+        Returns:
+            str: The name of the selected tag, or None if no tag matches
+        """
+        for tag in tags:
+            if self.feed(tag):
+                break
+
+        return self.best
@@ -1,61 +1,614 @@
-import subprocess
-import tempfile
+import re
 
-from .yaml_parser import YamlParser
+import ruamel.yaml
+from ruamel.yaml.constructor import ConstructorError
+from ruamel.yaml.events import (
+    AliasEvent,
+    CollectionEndEvent,
+    CollectionStartEvent,
+    DocumentStartEvent,
+    MappingEndEvent,
+    MappingStartEvent,
+    ScalarEvent,
+    SequenceEndEvent,
+    SequenceStartEvent,
+    StreamEndEvent,
+)
+from ruamel.yaml.nodes import MappingNode, ScalarNode, SequenceNode
+from ruamel.yaml.scalarstring import ScalarString
 
-yaml = YamlParser()
+# The components of a values_path: a plain key, a double or single quoted key,
+# or a list index, each optionally preceded by a '.' and quoted keys and
+# indices optionally wrapped in brackets
+PATH_TOKEN = re.compile(
+    r"""
+    \.?(?:
+        \[\s*(?P<index>-?\d+)\s*\]
+      | \[\s*"(?P<bracket_double>(?:[^"\\]|\\.)*)"\s*\]
+      | \[\s*'(?P<bracket_single>[^']*)'\s*\]
+      | "(?P<double>(?:[^"\\]|\\.)*)"
+      | (?P<key>[^.\[\]"']+)
+    )
+    """,
+    re.VERBOSE,
+)
 
+# The line breaks the YAML reader counts lines by
+LINE_BREAK = re.compile("\r\n|[\n\r\x85\u2028\u2029]")
 
-def update_config_with_yq(config, var_path, new_var):
-    """Run a yq command to update a variable in a YAML file given the keypath
-    to that variable.
+# A single quoted scalar, in which quotes are escaped by doubling them
+SINGLE_QUOTED_SCALAR = re.compile(r"'((?:[^']|'')*)'")
+
+# Where a plain scalar on a single line ends: at a comment
+PLAIN_SCALAR_END = re.compile(r"[ \t]#")
+
+# Values that can be written as plain scalars, such as image names and tags
+PLAIN_SAFE = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_.:/@+-]*")
+
+# Check how plain scalars would be read back, and walk the event streams of
+# documents read lazily
+_safe_yaml = ruamel.yaml.YAML(typ="safe", pure=True)
+_safe_yaml.allow_duplicate_keys = True
+
+
+def parse_path(var_path):
+    """Split a values_path, e.g. '.singleuser.profileList[0].image', into the keys
+    and list indices leading to the value it locates. Keys containing dots or
+    brackets can be quoted, e.g. '.hub."config.json"' or '.hub["config.json"]'.
+
+    Args:
+        var_path (str): The keypath to the variable
+
+    Returns:
+        list(str or int): The keys and list indices, in order
+    """
+    if not var_path.startswith("."):
+        raise ValueError(f"Invalid path {var_path!r}: paths must start with '.'")
+
+    components = []
+    pos = 0
+    while pos < len(var_path):
+        if var_path[pos:] == ".":
+            # A lone '.' locates the root of the config
+            break
+
+        match = PATH_TOKEN.match(var_path, pos)
+        if (match is None) or (match.end() == pos):
+            raise ValueError(f"Invalid path {var_path!r} at position {pos}")
+
+        if match.group("index") is not None:
+            components.append(int(match.group("index")))
+        elif match.group("key") is not None:
+            components.append(match.group("key"))
+        else:
+            quoted = next(
+                value
+                for value in match.group("bracket_double", "bracket_single", "double")
+                if value is not None
+            )
+            components.append(re.sub(r"\\(.)", r"\1", quoted))
+
+        pos = match.end()
+
+    return components
+
+
+def _get_child(node, component):
+    """Step from a node of the config to one of its children
+
+    Args:
+        node (dict or list): The node
+        component (str or int): The key or list index of the child
+
+    Returns:
+        The child, or None if the node does not have it
+    """
+    if isinstance(component, int):
+        if isinstance(node, list) and (-len(node) <= component < len(node)):
+            return node[component]
+        return None
+
+    if isinstance(node, dict):
+        return node.get(component)
+
+    return None
+
+
+def _build_path_trie(var_paths):
+    """Arrange keypaths into a trie, so that paths sharing a prefix share the
+    nodes of the config it leads through
+
+    Args:
+        var_paths (list[str]): The keypaths
+
+    Returns:
+        tuple: The root node of the trie. Each node is a pair of the keypaths
+            ending at the node and a dict of its children, keyed by key or
+            list index.
+    """
+    root = ([], {})
+    for var_path in var_paths:
+        node = root
+        for component in parse_path(var_path):
+            node = node[1].setdefault(component, ([], {}))
+        node[0].append(var_path)
+
+    return root
+
+
+def read_config_values(config, var_paths):
+    """Read several variables in a YAML config in a single pass over the config
+
+    Args:
+        config (dict): The YAML config to be read
+        var_paths (list[str]): The keypaths to the variables that should be read
+
+    Returns:
+        dict: The value stored at each keypath, or None if there is no value
+            there, keyed by keypath
+    """
+    values = {}
+    _read_path_trie(config, _build_path_trie(var_paths), values)
+    return values
+
+
+def _read_path_trie(config, trie, values):
+    """Read the variables at the keypaths in a trie
+
+    Args:
+        config (dict): The YAML config, or the part of it the trie is rooted at
+        trie (tuple): The node of the keypath trie
+        values (dict): Where to store the value at each keypath
+    """
+    stack = [(config, trie)]
+    while stack:
+        value, (paths, children) = stack.pop()
+        for var_path in paths:
+            values[var_path] = value
+        for component, child in children.items():
+            stack.append((_get_child(value, component), child))
+
+
+class _NotLazy(Exception):
+    """Raised when variables cannot be read from the event stream of a YAML
+    document without loading all of it"""
+
+
+def _skip_node(events, event):
+    """Consume the events of a node that is not needed
+
+    Args:
+        events (iterator): The event stream
+        event (Event): The first event of the node
+    """
+    depth = 1 if isinstance(event, CollectionStartEvent) else 0
+    while depth:
+        event = next(events)
+        if isinstance(event, CollectionStartEvent):
+            depth += 1
+        elif isinstance(event, CollectionEndEvent):
+            depth -= 1
+
+
+def _compose_node(events, event):
+    """Build the node of the representation graph described by the events of a
+    node, resolving the tags of untagged nodes
+
+    Args:
+        events (iterator): The event stream
+        event (Event): The first event of the node
+
+    Returns:
+        Node: The node
+    """
+    if isinstance(event, AliasEvent):
+        # The anchored node may have been skipped
+        raise _NotLazy
+
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if (tag is None) or (tag == "!"):
+            tag = _safe_yaml.resolver.resolve(ScalarNode, event.value, event.implicit)
+        return ScalarNode(tag, event.value, style=event.style)
+
+    node_class = SequenceNode if isinstance(event, SequenceStartEvent) else MappingNode
+    tag = event.tag
+    if (tag is None) or (tag == "!"):
+        tag = _safe_yaml.resolver.resolve(node_class, None, event.implicit)
+
+    flow_style = event.flow_style
+    items = []
+    event = next(events)
+    while not isinstance(event, CollectionEndEvent):
+        if node_class is SequenceNode:
+            items.append(_compose_node(events, event))
+        else:
+            key = _compose_node(events, event)
+            items.append((key, _compose_node(events, next(events))))
+        event = next(events)
+
+    return node_class(tag, items, flow_style=flow_style)
+
+
+def _construct_node(events, event):
+    """Build the value described by the events of a node
+
+    Args:
+        events (iterator): The event stream
+        event (Event): The first event of the node
+
+    Returns:
+        The value
+    """
+    return _safe_yaml.constructor.construct_document(_compose_node(events, event))
+
+
+def _walk_events(events, event, trie, values):
+    """Follow the keypaths in a trie through the events of a node, building the
+    values they locate and skipping everything else
+
+    Args:
+        events (iterator): The event stream
+        event (Event): The first event of the node
+        trie (tuple): The node of the keypath trie matching the node
+        values (dict): Where to store the value at each keypath
+    """
+    paths, children = trie
+    if paths:
+        # The node is needed as a whole, and any keypaths below it are read from
+        # the built value
+        _read_path_trie(_construct_node(events, event), trie, values)
+        return
+
+    if isinstance(event, AliasEvent):
+        raise _NotLazy
+
+    if isinstance(event, MappingStartEvent):
+        seen = set()
+        event = next(events)
+        while not isinstance(event, MappingEndEvent):
+            key = None
+            if isinstance(event, ScalarEvent):
+                if (event.value == "<<") and (event.style is None):
+                    # Merged keys are not followed
+                    raise _NotLazy
+                key = _construct_node(events, event)
+            else:
+                _skip_node(events, event)
+
+            event = next(events)
+            if isinstance(key, str) and (key in children) and (key not in seen):
+                # The first of several duplicate keys is kept, as in a full load
+                seen.add(key)
+                _walk_events(events, event, children[key], values)
+            else:
+                _skip_node(events, event)
+            event = next(events)
+
+    elif isinstance(event, SequenceStartEvent):
+        if any(isinstance(key, int) and (key < 0) for key in children):
+            # Counting from the end needs the length of the sequence
+            raise _NotLazy
+
+        index = 0
+        event = next(events)
+        while not isinstance(event, SequenceEndEvent):
+            if index in children:
+                _walk_events(events, event, children[index], values)
+            else:
+                _skip_node(events, event)
+            index += 1
+            event = next(events)
+
+    else:
+        _skip_node(events, event)
+
+
+def read_yaml_values(text, var_paths):
+    """Read several variables from the text of a YAML document by walking its
+    event stream, only building the values the keypaths locate. This is much
+    cheaper than a round-trip load of the whole document.
+
+    Args:
+        text (str): The YAML document
+        var_paths (list[str]): The keypaths to the variables that should be read
+
+    Returns:
+        dict: The value stored at each keypath, or None if there is no value
+            there, keyed by keypath. None is returned instead if the document
+            has to be loaded in full to read the variables, e.g. because they
+            hold aliases, merged keys or tags the safe loader cannot build.
+    """
+    values = {var_path: None for var_path in var_paths}
+    events = _safe_yaml.parse(text)
+    try:
+        next(events)
+        event = next(events)
+        if isinstance(event, DocumentStartEvent):
+            _walk_events(events, next(events), _build_path_trie(var_paths), values)
+            next(events)
+            if not isinstance(next(events), StreamEndEvent):
+                # A full load rejects streams of several documents
+                raise _NotLazy
+    except (_NotLazy, ConstructorError):
+        return None
+    finally:
+        events.close()
+
+    return values
+
+
+def _first_path(children):
+    """Find a keypath ending below a node of a keypath trie
+
+    Args:
+        children (dict): The children of the node
+
+    Returns:
+        str: The keypath
+    """
+    paths, grandchildren = next(iter(children.values()))
+    return paths[0] if paths else _first_path(grandchildren)
+
+
+def _set_child(node, component, value, var_path):
+    """Set one of the children of a node of the config. A value written in
+    quotes in the config keeps its quotes.
+
+    Args:
+        node (dict or list): The node
+        component (str or int): The key or list index of the child
+        value: The new value of the child
+        var_path (str): The keypath being updated, for error messages
+    """
+    if isinstance(component, int) and not (
+        isinstance(node, list) and (-len(node) <= component < len(node))
+    ):
+        raise IndexError(f"Index {component} of {var_path!r} out of range")
+
+    old_value = _get_child(node, component)
+    if isinstance(old_value, ScalarString):
+        value = type(old_value)(value)
+    node[component] = value
+
+
+def update_config_values(config, new_vars):
+    """Update several variables in a YAML config in a single pass over the
+    config. Missing keys along the paths are created, and a value written in
+    quotes in the config keeps its quotes.
 
     Args:
         config (dict): The dictionary config to be updated
-        var_path (str): The keypath to the variable that should be updated
-        new_var (str): The new value to set the variable to
+        new_vars (dict): The new value of each variable, keyed by the keypath to
+            the variable
 
     Returns:
         updated_config (dict): The updated dictionary config
     """
-    # Construct the yq command to run
-    cmd = ["yq", f'{var_path} = "{new_var}"']
+    root_paths, root_children = _build_path_trie(new_vars.keys())
+    if root_paths:
+        raise ValueError(f"Invalid path {root_paths[0]!r}: cannot replace the config")
 
-    # Use a temporary file for yq to "read"
-    with tempfile.NamedTemporaryFile(mode="r+", suffix=".yaml") as fp:
-        # Dump the config to the temp file
-        yaml.yaml.dump(config, fp)
-        fp.flush()
+    stack = [(config, root_children)]
+    while stack:
+        node, children = stack.pop()
+        for component, (paths, grandchildren) in children.items():
+            for var_path in paths:
+                _set_child(node, component, new_vars[var_path], var_path)
 
-        # Run the yq command and capture the result
-        cmd.append(fp.name)
-        call_output = subprocess.check_output(cmd)
+            if not grandchildren:
+                continue
 
-    # Cleaning up of the yq output, make sure it is dict format!
-    updated_config = yaml.yaml.load(call_output.decode("utf-8").strip("\n"))
+            child = _get_child(node, component)
+            if child is None:
+                var_path = paths[0] if paths else _first_path(grandchildren)
+                if isinstance(component, int):
+                    raise IndexError(f"Index {component} of {var_path!r} out of range")
+                child = [] if all(isinstance(key, int) for key in grandchildren) else {}
+                node[component] = child
+            stack.append((child, grandchildren))
 
-    return updated_config
+    return config
 
 
-def read_config_with_yq(config: dict, var_path: str):
-    """Run a yq command to read a variable in a YAML file given the keypath
-    to that variable.
+def _get_line_offsets(text):
+    """Find where each line of a YAML document starts, counting line breaks the
+    way the YAML reader does
 
     Args:
-        config (dict): The YAML config to be read
-        var_path (str): The keypath to the variable that should be read
+        text (str): The YAML document
 
     Returns:
-        (dict or str): The value stored at the provided keypath..
+        list[int]: The offset of the start of each line
     """
-    cmd = ["yq", var_path]
+    return [0] + [match.end() for match in LINE_BREAK.finditer(text)]
+
+
+def _get_scalar_position(config, var_path):
+    """Find where a scalar value of a round-trip loaded config starts in the
+    document it was loaded from
+
+    Args:
+        config (CommentedMap): The round-trip loaded config
+        var_path (str): The keypath to the value
+
+    Returns:
+        line (int): The line the value starts on, or None if it is not known
+        column (int): The column the value starts at
+        indent (int): The indentation of the collection holding the value, which
+            lines continuing the value would be indented past
+    """
+    components = parse_path(var_path)
+    if not components:
+        return None, None, None
+
+    parent = config
+    for component in components[:-1]:
+        parent = _get_child(parent, component)
+
+    last = components[-1]
+    if not isinstance(_get_child(parent, last), str):
+        return None, None, None
+    if (not hasattr(parent, "lc")) or parent.fa.flow_style():
+        return None, None, None
+
+    try:
+        if isinstance(last, int):
+            line, column = parent.lc.item(last % len(parent))
+            indent = None
+        else:
+            line, column = parent.lc.value(last)
+            indent = parent.lc.key(last)[1]
+    except (KeyError, IndexError, TypeError):
+        return None, None, None
+
+    return line, column, indent
+
+
+def _continues_on_next_line(text, pos, indent):
+    """Check if a plain scalar ending a line may continue onto the lines after it
+
+    Args:
+        text (str): The YAML document
+        pos (int): The offset of the end of the line
+        indent (int): The indentation lines continuing the scalar are indented
+            past
+
+    Returns:
+        bool: True if the next line holding content is indented past indent
+    """
+    for line in LINE_BREAK.split(text[pos:])[1:]:
+        content = line.lstrip(" ")
+        if content.strip(" \t") == "":
+            continue
+        if content.startswith("#"):
+            return False
+        return len(line) - len(content) > indent
+
+    return False
+
+
+def _get_scalar_span(text, start, line_start, indent, value):
+    """Find the end of a single line plain or quoted scalar in a YAML document,
+    checking that it spells out the value it was loaded as
+
+    Args:
+        text (str): The YAML document
+        start (int): The offset the scalar starts at
+        line_start (int): The offset of the start of the line the scalar is on
+        indent (int): The indentation of the collection holding the scalar, or
+            None to use the indentation of the line
+        value (str): The value the scalar was loaded as
+
+    Returns:
+        end (int): The offset just past the end of the scalar, or None if the
+            scalar could not be found
+        style (str): The quote character the scalar is written with, or '' if
+            it is plain
+    """
+    line_end = LINE_BREAK.search(text, start)
+    line_end = line_end.start() if line_end else len(text)
+    line = text[start:line_end]
+
+    if line.startswith('"'):
+        end = line.find('"', 1)
+        if (end == -1) or ("\\" in line[1:end]) or (line[1:end] != value):
+            return None, None
+        return start + end + 1, '"'
+
+    if line.startswith("'"):
+        match = SINGLE_QUOTED_SCALAR.match(line)
+        if (match is None) or (match.group(1).replace("''", "'") != value):
+            return None, None
+        return start + match.end(), "'"
+
+    plain = PLAIN_SCALAR_END.split(line, maxsplit=1)[0].rstrip(" \t")
+    if plain != value:
+        # The scalar starts with an anchor, tag or block indicator
+        return None, None
+
+    if indent is None:
+        full_line = text[line_start:line_end]
+        indent = len(full_line) - len(full_line.lstrip(" "))
+    if (plain == line.rstrip(" \t")) and _continues_on_next_line(
+        text, line_end, indent
+    ):
+        return None, None
+
+    return start + len(plain), ""
+
+
+def _render_scalar(value, style):
+    """Write a string as a YAML scalar in the style of the scalar it replaces. A
+    plain scalar is quoted if the value would not be read back as the same
+    string.
+
+    Args:
+        value (str): The value to write
+        style (str): The quote character of the scalar being replaced, or '' if
+            it is plain
+
+    Returns:
+        str: The scalar
+    """
+    if style == '"' and ('"' not in value) and ("\\" not in value):
+        return f'"{value}"'
+
+    if style == "" and PLAIN_SAFE.fullmatch(value):
+        if _safe_yaml.load(value) == value:
+            return value
+
+    escaped = value.replace("'", "''")
+    return f"'{escaped}'"
+
+
+def splice_config_values(text, config, new_vars):
+    """Write updated variables into the text of a YAML config by replacing only
+    the scalars that change, leaving the rest of the document byte for byte as it
+    was. Positions are read from the config round-trip loaded from the text, and
+    must be looked up before the config is updated.
+
+    Args:
+        text (str): The YAML document the config was loaded from
+        config (CommentedMap): The round-trip loaded config
+        new_vars (dict): The new value of each variable, keyed by the keypath to
+            the variable
+
+    Returns:
+        str: The updated document, or None if a variable could not be located in
+            the document, e.g. because it is missing or written over several lines
+    """
+    line_offsets = _get_line_offsets(text)
+    old_vars = read_config_values(config, list(new_vars.keys()))
+
+    spans = []
+    for var_path, new_var in new_vars.items():
+        line, column, indent = _get_scalar_position(config, var_path)
+        if (line is None) or (line >= len(line_offsets)):
+            return None
+        start = line_offsets[line] + column
+
+        end, style = _get_scalar_span(
+            text,
+            start,
+            line_offsets[line],
+            indent,
+            old_vars[var_path],
+        )
+        if end is None:
+            return None
 
-    with tempfile.NamedTemporaryFile(mode="r+", suffix=".yaml") as fp:
-        yaml.yaml.dump(config, fp)
-        fp.flush()
+        spans.append((start, end, _render_scalar(new_var, style)))
 
-        cmd.append(fp.name)
-        call_output = subprocess.check_output(cmd)
+    spans.sort()
+    pieces = []
+    pos = 0
+    for start, end, scalar in spans:
+        if start < pos:
+            # Two keypaths locate the same scalar
+            return None
+        pieces.extend([text[pos:start], scalar])
+        pos = end
+    pieces.append(text[pos:])
 
-    call_output = call_output.decode("utf-8").strip("\n")
-    return yaml.yaml.load(call_output)
+    return "".join(pieces)
@@ -28,6 +28,7 @@ class TestGitHubAPI(unittest.TestCase):
                 "/".join([pr_url, "labels"]),
                 headers=main.headers,
                 json={"labels": main.labels},
+                retry=True,
             )
 
     def test_assign_reviewers(self):
@@ -48,6 +49,7 @@ class TestGitHubAPI(unittest.TestCase):
                 "/".join([pr_url, "requested_reviewers"]),
                 headers=main.headers,
                 json={"reviewers": main.reviewers},
+                retry=True,
             )
 
     def test_assign_team_reviewers(self):
@@ -68,6 +70,7 @@ class TestGitHubAPI(unittest.TestCase):
                 "/".join([pr_url, "requested_reviewers"]),
                 headers=main.headers,
                 json={"team_reviewers": main.team_reviewers},
+                retry=True,
             )
 
     def test_create_pr_no_labels_no_reviewers(self):
@@ -81,27 +84,28 @@ class TestGitHubAPI(unittest.TestCase):
         github.pr_exists = False
 
         main.image_tags = {
-            "image_owner/image1": {
+            ("image_owner/image1", None): {
                 "current": "old_tag",
                 "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
             },
-            "image_owner/image2": {
+            ("image_owner/image2", None): {
                 "current": "old_tag",
                 "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
             },
         }
-        main.images_to_update = ["image_owner/image1", "image_owner/image2"]
+        main.images_to_update = [
+            ("image_owner/image1", None),
+            ("image_owner/image2", None),
+        ]
 
         expected_pr = {
             "title": "Bumping Docker image tags in JupyterHub config",
             "body": (
                 "This Pull Request is bumping the Docker tags for the following images to the listed versions.\n\n"
-                + "\n".join(
-                    [
-                        f"- `{image}`: `{main.image_tags[image]['current']}` -> `{main.image_tags[image]['latest']}`"
-                        for image in main.images_to_update
-                    ]
-                )
+                + "- `image_owner/image1`: `old_tag` -> `new_tag`\n"
+                + "- `image_owner/image2`: `old_tag` -> `new_tag`"
             ),
             "base": "main",
             "head": "bump-image-tags/config-configyaml",
@@ -130,27 +134,28 @@ class TestGitHubAPI(unittest.TestCase):
         github.pr_exists = False
 
         main.image_tags = {
-            "image_owner/image1": {
+            ("image_owner/image1", None): {
                 "current": "old_tag",
                 "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
             },
-            "image_owner/image2": {
+            ("image_owner/image2", None): {
                 "current": "old_tag",
                 "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
             },
         }
-        main.images_to_update = ["image_owner/image1", "image_owner/image2"]
+        main.images_to_update = [
+            ("image_owner/image1", None),
+            ("image_owner/image2", None),
+        ]
 
         expected_pr = {
             "title": "Bumping Docker image tags in JupyterHub config",
             "body": (
                 "This Pull Request is bumping the Docker tags for the following images to the listed versions.\n\n"
-                + "\n".join(
-                    [
-                        f"- `{image}`: `{main.image_tags[image]['current']}` -> `{main.image_tags[image]['latest']}`"
-                        for image in main.images_to_update
-                    ]
-                )
+                + "- `image_owner/image1`: `old_tag` -> `new_tag`\n"
+                + "- `image_owner/image2`: `old_tag` -> `new_tag`"
             ),
             "base": "main",
             "head": "bump-image-tags/config-configyaml",
@@ -175,6 +180,7 @@ class TestGitHubAPI(unittest.TestCase):
                 "/".join([github.api_url, "issues", "1", "labels"]),
                 headers=main.headers,
                 json={"labels": main.labels},
+                retry=True,
             ),
         ]
 
@@ -203,27 +209,28 @@ class TestGitHubAPI(unittest.TestCase):
         github.pr_exists = False
 
         main.image_tags = {
-            "image_owner/image1": {
+            ("image_owner/image1", None): {
                 "current": "old_tag",
                 "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
             },
-            "image_owner/image2": {
+            ("image_owner/image2", None): {
                 "current": "old_tag",
                 "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
             },
         }
-        main.images_to_update = ["image_owner/image1", "image_owner/image2"]
+        main.images_to_update = [
+            ("image_owner/image1", None),
+            ("image_owner/image2", None),
+        ]
 
         expected_pr = {
             "title": "Bumping Docker image tags in JupyterHub config",
             "body": (
                 "This Pull Request is bumping the Docker tags for the following images to the listed versions.\n\n"
-                + "\n".join(
-                    [
-                        f"- `{image}`: `{main.image_tags[image]['current']}` -> `{main.image_tags[image]['latest']}`"
-                        for image in main.images_to_update
-                    ]
-                )
+                + "- `image_owner/image1`: `old_tag` -> `new_tag`\n"
+                + "- `image_owner/image2`: `old_tag` -> `new_tag`"
             ),
             "base": "main",
             "head": "bump-image-tags/config-configyaml",
@@ -248,6 +255,7 @@ class TestGitHubAPI(unittest.TestCase):
                 "/".join([github.api_url, "pulls", "1", "requested_reviewers"]),
                 headers=main.headers,
                 json={"reviewers": main.reviewers},
+                retry=True,
             ),
         ]
 
@@ -277,27 +285,28 @@ class TestGitHubAPI(unittest.TestCase):
         github.pr_exists = False
 
         main.image_tags = {
-            "image_owner/image1": {
+            ("image_owner/image1", None): {
                 "current": "old_tag",
                 "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
             },
-            "image_owner/image2": {
+            ("image_owner/image2", None): {
                 "current": "old_tag",
                 "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
             },
         }
-        main.images_to_update = ["image_owner/image1", "image_owner/image2"]
+        main.images_to_update = [
+            ("image_owner/image1", None),
+            ("image_owner/image2", None),
+        ]
 
         expected_pr = {
             "title": "Bumping Docker image tags in JupyterHub config",
             "body": (
                 "This Pull Request is bumping the Docker tags for the following images to the listed versions.\n\n"
-                + "\n".join(
-                    [
-                        f"- `{image}`: `{main.image_tags[image]['current']}` -> `{main.image_tags[image]['latest']}`"
-                        for image in main.images_to_update
-                    ]
-                )
+                + "- `image_owner/image1`: `old_tag` -> `new_tag`\n"
+                + "- `image_owner/image2`: `old_tag` -> `new_tag`"
             ),
             "base": "main",
             "head": "bump-image-tags/config-configyaml",
@@ -323,11 +332,13 @@ class TestGitHubAPI(unittest.TestCase):
                 "/".join([github.api_url, "issues", "1", "labels"]),
                 headers=main.headers,
                 json={"labels": main.labels},
+                retry=True,
             ),
             call(
                 "/".join([github.api_url, "pulls", "1", "requested_reviewers"]),
                 headers=main.headers,
                 json={"reviewers": main.reviewers},
+                retry=True,
             ),
         ]
 
@@ -355,27 +366,28 @@ class TestGitHubAPI(unittest.TestCase):
         github.fork_exists = True
 
         main.image_tags = {
-            "image_owner/image1": {
+            ("image_owner/image1", None): {
                 "current": "old_tag",
                 "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
             },
-            "image_owner/image2": {
+            ("image_owner/image2", None): {
                 "current": "old_tag",
                 "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
             },
         }
-        main.images_to_update = ["image_owner/image1", "image_owner/image2"]
+        main.images_to_update = [
+            ("image_owner/image1", None),
+            ("image_owner/image2", None),
+        ]
 
         expected_pr = {
             "title": "Bumping Docker image tags in JupyterHub config",
             "body": (
                 "This Pull Request is bumping the Docker tags for the following images to the listed versions.\n\n"
-                + "\n".join(
-                    [
-                        f"- `{image}`: `{main.image_tags[image]['current']}` -> `{main.image_tags[image]['latest']}`"
-                        for image in main.images_to_update
-                    ]
-                )
+                + "- `image_owner/image1`: `old_tag` -> `new_tag`\n"
+                + "- `image_owner/image2`: `old_tag` -> `new_tag`"
             ),
             "base": main.base_branch,
             "head": ":".join([main.push_to_users_fork, main.head_branch]),
@@ -401,7 +413,7 @@ class TestGitHubAPI(unittest.TestCase):
         )
         github = GitHubAPI(main)
         mock_get = patch(
-            "tag_bot.github_api.get_request",
+            "tag_bot.github_api.get_paginated_request",
             return_value=[
                 {
                     "head": {
@@ -418,8 +430,12 @@ class TestGitHubAPI(unittest.TestCase):
             mock.assert_called_with(
                 "/".join([github.api_url, "pulls"]),
                 headers=main.headers,
-                params={"state": "open", "sort": "created", "direction": "desc"},
-                output="json",
+                params={
+                    "state": "open",
+                    "sort": "created",
+                    "direction": "desc",
+                    "per_page": 100,
+                },
             )
             self.assertFalse(github.pr_exists)
             self.assertTrue(
@@ -441,7 +457,7 @@ class TestGitHubAPI(unittest.TestCase):
         )
         github = GitHubAPI(main)
         mock_get = patch(
-            "tag_bot.github_api.get_request",
+            "tag_bot.github_api.get_paginated_request",
             return_value=[
                 {
                     "head": {
@@ -459,8 +475,12 @@ class TestGitHubAPI(unittest.TestCase):
             mock.assert_called_with(
                 "/".join([github.api_url, "pulls"]),
                 headers=main.headers,
-                params={"state": "open", "sort": "created", "direction": "desc"},
-                output="json",
+                params={
+                    "state": "open",
+                    "sort": "created",
+                    "direction": "desc",
+                    "per_page": 100,
+                },
             )
             self.assertTrue(github.pr_exists)
             self.assertTrue(
@@ -496,7 +516,7 @@ class TestGitHubAPI(unittest.TestCase):
             "branch": main.head_branch,
         }
 
-        with patch("tag_bot.github_api.put") as mock:
+        with patch("tag_bot.github_api.put_request") as mock:
             github.create_commit(
                 commit_msg,
                 contents,
@@ -505,8 +525,9 @@ class TestGitHubAPI(unittest.TestCase):
             self.assertEqual(mock.call_count, 1)
             mock.assert_called_with(
                 "/".join([github.api_url, "contents", main.config_path]),
-                json=body,
                 headers=main.headers,
+                json=body,
+                conflict_ok=True,
             )
 
     def test_create_commit_fork_exists(self):
@@ -537,7 +558,7 @@ class TestGitHubAPI(unittest.TestCase):
             "branch": main.head_branch,
         }
 
-        with patch("tag_bot.github_api.put") as mock:
+        with patch("tag_bot.github_api.put_request") as mock:
             github.create_commit(
                 commit_msg,
                 contents,
@@ -546,8 +567,9 @@ class TestGitHubAPI(unittest.TestCase):
             self.assertEqual(mock.call_count, 1)
             mock.assert_called_with(
                 "/".join([github.fork_api_url, "contents", main.config_path]),
-                json=body,
                 headers=main.headers,
+                json=body,
+                conflict_ok=True,
             )
 
     def test_create_ref(self):
@@ -571,6 +593,8 @@ class TestGitHubAPI(unittest.TestCase):
                 "/".join([github.api_url, "git", "refs"]),
                 headers=main.headers,
                 json=test_body,
+                retry=True,
+                conflict_ok=True,
             )
 
     def test_create_ref_fork_exists(self):
@@ -599,6 +623,8 @@ class TestGitHubAPI(unittest.TestCase):
                 "/".join([github.fork_api_url, "git", "refs"]),
                 headers=main.headers,
                 json=test_body,
+                retry=True,
+                conflict_ok=True,
             )
 
     def test_get_ref(self):
@@ -667,7 +693,7 @@ class TestGitHubAPI(unittest.TestCase):
         main.push_to_users_fork = "user1/octocat"
 
         mock_get = patch(
-            "tag_bot.github_api.get_request",
+            "tag_bot.github_api.get_paginated_request",
             return_value=[{"full_name": "user1/octocat"}],
         )
 
@@ -678,7 +704,7 @@ class TestGitHubAPI(unittest.TestCase):
             mock.assert_called_with(
                 "/".join([github.api_url, "forks"]),
                 headers=main.headers,
-                output="json",
+                params={"per_page": 100},
             )
 
     def test_check_fork_exists_false(self):
@@ -692,7 +718,7 @@ class TestGitHubAPI(unittest.TestCase):
         main.push_to_users_fork = "user1/octocat"
 
         mock_get = patch(
-            "tag_bot.github_api.get_request",
+            "tag_bot.github_api.get_paginated_request",
             return_value=[{"full_name": "user2/octocat"}],
         )
 
@@ -703,7 +729,7 @@ class TestGitHubAPI(unittest.TestCase):
             mock.assert_called_with(
                 "/".join([github.api_url, "forks"]),
                 headers=main.headers,
-                output="json",
+                params={"per_page": 100},
             )
 
     def test_create_fork(self):
@@ -724,6 +750,7 @@ class TestGitHubAPI(unittest.TestCase):
             mock.assert_called_with(
                 "/".join([github.api_url, "forks"]),
                 headers=main.headers,
+                retry=True,
             )
 
     def test_merge_upstream(self):
@@ -747,6 +774,7 @@ class TestGitHubAPI(unittest.TestCase):
                 "/".join([github.fork_api_url, "merge-upstream"]),
                 headers=main.headers,
                 json={"branch": main.base_branch},
+                retry=True,
             )
 
     def test_update_existing_pr(self):
@@ -759,19 +787,20 @@ class TestGitHubAPI(unittest.TestCase):
         github = GitHubAPI(main)
         github.pr_exists = True
         github.pr_number = 1
-        main.image_tags = {"image": {"current": "old_tag", "latest": "new_tag"}}
-        main.images_to_update = ["image"]
+        main.image_tags = {
+            ("image", None): {
+                "current": "old_tag",
+                "latest": "new_tag",
+                "paths": {".singleuser.image": "old_tag"},
+            }
+        }
+        main.images_to_update = [("image", None)]
 
         expected_pr = {
             "title": "Bumping Docker image tags in JupyterHub config",
             "body": (
                 "This Pull Request is bumping the Docker tags for the following images to the listed versions.\n\n"
-                + "\n".join(
-                    [
-                        f"- `{image}`: `{main.image_tags[image]['current']}` -> `{main.image_tags[image]['latest']}`"
-                        for image in main.images_to_update
-                    ]
-                )
+                + "- `image`: `old_tag` -> `new_tag`"
             ),
             "base": main.base_branch,
             "state": "open",
@@ -792,6 +821,41 @@ class TestGitHubAPI(unittest.TestCase):
             )
             self.assertEqual(mock.return_value, {"number": 1})
 
+    def test_build_pull_request_lists_each_tag_filter(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [".singleuser.image"],
+        )
+        github = GitHubAPI(main)
+        github.pr_exists = True
+        main.image_tags = {
+            ("image", None): {
+                "current": "1.0",
+                "latest": "2.0",
+                "paths": {".a": "1.0", ".b": "1.1", ".c": "1.0", ".d": "2.0"},
+            },
+            ("image", '{"regexpr": "python-.*"}'): {
+                "current": "python-3.9",
+                "latest": "python-3.12",
+                "paths": {".e": "python-3.9"},
+            },
+        }
+        main.images_to_update = [
+            ("image", None),
+            ("image", '{"regexpr": "python-.*"}'),
+        ]
+
+        pr = github._build_pull_request()
+
+        self.assertEqual(
+            pr["body"],
+            "This Pull Request is bumping the Docker tags for the following images to the listed versions.\n\n"
+            + "- `image`: `1.0`, `1.1` -> `2.0`\n"
+            + "- `image`: `python-3.9` -> `python-3.12`",
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,95 @@
+import tempfile
+
+import responses
+
+from tag_bot.http_cache import HttpCache
+from tag_bot.http_requests import configure_cache, get_request
+
+test_url = "http://jsonplaceholder.typicode.com/"
+test_header = {"Authorization": "token ThIs_Is_A_ToKeN"}
+
+
+@responses.activate
+def test_get_request_replays_cache_on_not_modified():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        configure_cache(cache_dir)
+
+        responses.add(
+            responses.GET,
+            test_url,
+            json={"Response": "OK"},
+            headers={"ETag": '"abc123"'},
+            status=200,
+        )
+        first = get_request(test_url, headers=test_header, output="json")
+
+        responses.replace(responses.GET, test_url, status=304)
+        second = get_request(test_url, headers=test_header, output="json")
+
+        configure_cache()
+
+    assert first == second == {"Response": "OK"}
+    assert len(responses.calls) == 2
+    assert "If-None-Match" not in responses.calls[0].request.headers
+    assert responses.calls[1].request.headers["If-None-Match"] == '"abc123"'
+
+
+@responses.activate
+def test_get_request_updates_cache_when_modified():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        configure_cache(cache_dir)
+
+        responses.add(
+            responses.GET,
+            test_url,
+            json={"Response": "Old"},
+            headers={"Last-Modified": "Mon, 27 Sep 2021 16:00:00 GMT"},
+            status=200,
+        )
+        get_request(test_url, headers=test_header)
+
+        responses.replace(
+            responses.GET,
+            test_url,
+            json={"Response": "New"},
+            headers={"Last-Modified": "Tue, 28 Sep 2021 16:00:00 GMT"},
+            status=200,
+        )
+        resp = get_request(test_url, headers=test_header, output="json")
+
+        entry = HttpCache(cache_dir).load(test_url, {}, test_header)
+        configure_cache()
+
+    assert resp == {"Response": "New"}
+    assert (
+        responses.calls[1].request.headers["If-Modified-Since"]
+        == "Mon, 27 Sep 2021 16:00:00 GMT"
+    )
+    assert entry["last_modified"] == "Tue, 28 Sep 2021 16:00:00 GMT"
+
+
+def test_cache_key_depends_on_credentials():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = HttpCache(cache_dir)
+
+        key1 = cache._get_key(test_url, {"page": 1}, test_header)
+        key2 = cache._get_key(test_url, {"page": 1}, {"Authorization": "other"})
+        key3 = cache._get_key(test_url, {"page": 2}, test_header)
+
+    assert len({key1, key2, key3}) == 3
+
+
+@responses.activate
+def test_get_request_without_validators_is_not_cached():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        configure_cache(cache_dir)
+
+        responses.add(responses.GET, test_url, json={"Response": "OK"}, status=200)
+        get_request(test_url)
+        get_request(test_url)
+
+        entry = HttpCache(cache_dir).load(test_url, {}, {})
+        configure_cache()
+
+    assert entry is None
+    assert "If-None-Match" not in responses.calls[1].request.headers
@@ -1,14 +1,52 @@
+import time
+from unittest.mock import patch
+
 import pytest
 import requests
 import responses
 
-from tag_bot.http_requests import get_request, patch_request, post_request
+from tag_bot.http_requests import (
+    MAX_RETRIES,
+    DeadlineExceeded,
+    configure_session,
+    get_paginated_request,
+    get_request,
+    get_session,
+    patch_request,
+    post_request,
+    put_request,
+)
 
 test_url = "http://jsonplaceholder.typicode.com/"
 test_header = {"Authorization": "token ThIs_Is_A_ToKeN"}
 test_body = {"Payload": "Send this with the request"}
 
 
+def test_configure_session():
+    session = configure_session(pool_connections=2, pool_maxsize=5)
+    adapter = session.get_adapter(test_url)
+
+    assert get_session() is session
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 5
+    assert session.get_adapter("https://api.github.com") is adapter
+
+    configure_session()
+
+
+@responses.activate
+def test_requests_share_session():
+    responses.add(responses.GET, test_url, status=200)
+    responses.add(responses.POST, test_url, status=200)
+
+    session = get_session()
+    get_request(test_url)
+    post_request(test_url)
+
+    assert get_session() is session
+    assert len(responses.calls) == 2
+
+
 @responses.activate
 def test_get_request():
     responses.add(responses.GET, test_url, status=200)
@@ -58,6 +96,87 @@ def test_get_request_url_exception():
     assert responses.calls[0].request.url == test_url
 
 
+@responses.activate
+def test_get_paginated_request_link_header():
+    next_url = test_url + "?page=2"
+    responses.add(
+        responses.GET,
+        test_url,
+        json=[1, 2],
+        headers={"Link": f'<{next_url}>; rel="next", <{next_url}>; rel="last"'},
+        status=200,
+    )
+    responses.add(responses.GET, next_url, json=[3], status=200)
+
+    items = list(get_paginated_request(test_url, headers=test_header))
+
+    assert items == [1, 2, 3]
+    assert len(responses.calls) == 2
+    assert responses.calls[1].request.url == next_url
+
+
+@responses.activate
+def test_get_paginated_request_next_field():
+    next_url = test_url + "?page=2"
+    responses.add(
+        responses.GET,
+        test_url,
+        json={"results": [1, 2], "next": next_url},
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        next_url,
+        json={"results": [3], "next": None},
+        status=200,
+    )
+
+    items = list(get_paginated_request(test_url, items_key="results"))
+
+    assert items == [1, 2, 3]
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_get_paginated_request_has_additional():
+    responses.add(
+        responses.GET,
+        test_url + "?limit=2&page=2",
+        json={"tags": [3], "page": 2, "has_additional": False},
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        test_url + "?limit=2",
+        json={"tags": [1, 2], "page": 1, "has_additional": True},
+        status=200,
+    )
+
+    items = list(get_paginated_request(test_url, params={"limit": 2}, items_key="tags"))
+
+    assert items == [1, 2, 3]
+    assert len(responses.calls) == 2
+    assert responses.calls[1].request.url == test_url + "?limit=2&page=2"
+
+
+@responses.activate
+def test_get_paginated_request_stops_early():
+    next_url = test_url + "?page=2"
+    responses.add(
+        responses.GET,
+        test_url,
+        json=[1, 2],
+        headers={"Link": f'<{next_url}>; rel="next"'},
+        status=200,
+    )
+    responses.add(responses.GET, next_url, json=[3], status=200)
+
+    item = next(item for item in get_paginated_request(test_url) if item == 2)
+
+    assert item == 2
+    assert len(responses.calls) == 1
+
+
 @responses.activate
 def test_post_request():
     responses.add(responses.POST, test_url, status=200)
@@ -122,3 +241,165 @@ def test_patch_request_exception():
 
     assert len(responses.calls) == 1
     assert responses.calls[0].request.url == test_url
+
+
+@responses.activate
+def test_put_request():
+    responses.add(responses.PUT, test_url, status=200)
+
+    put_request(test_url, headers=test_header, json=test_body)
+
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.url == test_url
+
+
+@responses.activate
+def test_put_request_return_json():
+    responses.add(responses.PUT, test_url, json={"Request": "Sent"}, status=200)
+
+    resp = put_request(test_url, headers=test_header, json=test_body, return_json=True)
+
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.url == test_url
+    assert resp == {"Request": "Sent"}
+
+
+@responses.activate
+def test_put_request_exception():
+    responses.add(responses.PUT, test_url, status=500)
+
+    with pytest.raises(requests.HTTPError):
+        put_request(test_url, headers=test_header, json=test_body)
+
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.url == test_url
+
+
+@responses.activate
+@patch("tag_bot.http_requests.time.sleep")
+def test_get_request_retries_transient_error(mock_sleep):
+    responses.add(responses.GET, test_url, status=502)
+    responses.add(responses.GET, test_url, json={"Response": "OK"}, status=200)
+
+    resp = get_request(test_url, headers=test_header, output="json")
+
+    assert resp == {"Response": "OK"}
+    assert len(responses.calls) == 2
+    assert mock_sleep.call_count == 1
+
+
+@responses.activate
+@patch("tag_bot.http_requests.time.sleep")
+def test_get_request_retries_connection_error(mock_sleep):
+    responses.add(responses.GET, test_url, body=requests.ConnectionError("reset"))
+    responses.add(responses.GET, test_url, json={"Response": "OK"}, status=200)
+
+    resp = get_request(test_url, headers=test_header, output="json")
+
+    assert resp == {"Response": "OK"}
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+@patch("tag_bot.http_requests.time.sleep")
+def test_get_request_gives_up_after_max_retries(mock_sleep):
+    responses.add(responses.GET, test_url, status=503)
+
+    with pytest.raises(requests.HTTPError):
+        get_request(test_url, headers=test_header)
+
+    assert len(responses.calls) == MAX_RETRIES + 1
+    assert mock_sleep.call_count == MAX_RETRIES
+
+
+@responses.activate
+@patch("tag_bot.http_requests.time.sleep")
+def test_post_request_not_retried_by_default(mock_sleep):
+    responses.add(responses.POST, test_url, status=502)
+
+    with pytest.raises(requests.HTTPError):
+        post_request(test_url, headers=test_header, json=test_body)
+
+    assert len(responses.calls) == 1
+    mock_sleep.assert_not_called()
+
+
+@responses.activate
+@patch("tag_bot.http_requests.time.sleep")
+def test_post_request_retry_conflict_ok(mock_sleep):
+    responses.add(responses.POST, test_url, status=502)
+    responses.add(
+        responses.POST,
+        test_url,
+        json={"message": "Reference already exists"},
+        status=422,
+    )
+
+    post_request(
+        test_url, headers=test_header, json=test_body, retry=True, conflict_ok=True
+    )
+
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_post_request_conflict_on_first_attempt():
+    responses.add(
+        responses.POST,
+        test_url,
+        json={"message": "Reference already exists"},
+        status=422,
+    )
+
+    with pytest.raises(requests.HTTPError):
+        post_request(
+            test_url, headers=test_header, json=test_body, retry=True, conflict_ok=True
+        )
+
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_get_request_sends_timeout():
+    responses.add(responses.GET, test_url, json={"Response": "OK"}, status=200)
+
+    with patch("tag_bot.http_requests._timeout", (5, 15)):
+        get_request(test_url, headers=test_header)
+
+    assert responses.calls[0].request.req_kwargs["timeout"] == (5, 15)
+
+
+@responses.activate
+def test_get_request_timeout_capped_by_deadline():
+    responses.add(responses.GET, test_url, json={"Response": "OK"}, status=200)
+
+    with patch("tag_bot.http_requests._deadline", time.monotonic() + 2):
+        get_request(test_url, headers=test_header)
+
+    connect_timeout, read_timeout = responses.calls[0].request.req_kwargs["timeout"]
+    assert connect_timeout <= 2
+    assert read_timeout <= 2
+
+
+@responses.activate
+def test_get_request_deadline_exceeded():
+    responses.add(responses.GET, test_url, json={"Response": "OK"}, status=200)
+
+    with patch("tag_bot.http_requests._deadline", time.monotonic() - 1):
+        with pytest.raises(DeadlineExceeded):
+            get_request(test_url, headers=test_header)
+
+    assert len(responses.calls) == 0
+
+
+@responses.activate
+@patch("tag_bot.http_requests.time.sleep")
+def test_get_request_retry_abandoned_at_deadline(mock_sleep):
+    responses.add(responses.GET, test_url, status=503, headers={"Retry-After": "60"})
+
+    with patch("tag_bot.http_requests._deadline", time.monotonic() + 30):
+        with pytest.raises(DeadlineExceeded):
+            get_request(test_url, headers=test_header)
+
+    assert len(responses.calls) == 1
+    mock_sleep.assert_not_called()
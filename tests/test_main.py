@@ -1,8 +1,10 @@
 import base64
 import unittest
+from unittest.mock import patch
 
 import pytest
 
+from tag_bot.http_requests import DeadlineExceeded
 from tag_bot.main import UpdateImageTags, assert_images_info_input, split_str_to_list
 from tag_bot.yaml_parser import YamlParser
 
@@ -22,12 +24,12 @@ class TestUpdateImageTags(unittest.TestCase):
                 "image": {"name": "image_owner/image_name", "tag": "image_tag"}
             }
         }
-        update_images.images_to_update = ["image_owner/image_name"]
+        update_images.images_to_update = [("image_owner/image_name", None)]
         update_images.image_tags = {
-            "image_owner/image_name": {
+            ("image_owner/image_name", None): {
                 "current": "image_tag",
                 "latest": "new_image_tag",
-                "path": ".singleuser.image.tag",
+                "paths": {".singleuser.image.tag": "image_tag"},
             }
         }
 
@@ -61,12 +63,14 @@ class TestUpdateImageTags(unittest.TestCase):
                 ]
             }
         }
-        update_images.images_to_update = ["image_owner/image_name"]
+        update_images.images_to_update = [("image_owner/image_name", None)]
         update_images.image_tags = {
-            "image_owner/image_name": {
+            ("image_owner/image_name", None): {
                 "current": "image_tag",
                 "latest": "new_image_tag",
-                "path": ".singleuser.profileList[0].kubespawner_override.image",
+                "paths": {
+                    ".singleuser.profileList[0].kubespawner_override.image": "image_tag"
+                },
             }
         }
 
@@ -111,19 +115,21 @@ class TestUpdateImageTags(unittest.TestCase):
             }
         }
         update_images.images_to_update = [
-            "image_owner/image_name1",
-            "image_owner/image_name2",
+            ("image_owner/image_name1", None),
+            ("image_owner/image_name2", None),
         ]
         update_images.image_tags = {
-            "image_owner/image_name1": {
+            ("image_owner/image_name1", None): {
                 "current": "image_tag1",
                 "latest": "new_image_tag1",
-                "path": ".singleuser.image.tag",
+                "paths": {".singleuser.image.tag": "image_tag1"},
             },
-            "image_owner/image_name2": {
+            ("image_owner/image_name2", None): {
                 "current": "image_tag2",
                 "latest": "new_image_tag2",
-                "path": ".singleuser.profileList[0].kubespawner_override.image",
+                "paths": {
+                    ".singleuser.profileList[0].kubespawner_override.image": "image_tag2"
+                },
             },
         }
 
@@ -146,6 +152,192 @@ class TestUpdateImageTags(unittest.TestCase):
 
         self.assertEqual(result, expected_output)
 
+    def test_update_config_splices_tags(self):
+        update_images = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [".singleuser.image", ".singleuser.profileList[0].image"],
+        )
+        update_images.config_text = (
+            "singleuser:\n"
+            "    image:\n"
+            "        name:   image_owner/image_name\n"
+            '        tag: "image_tag"   # pinned\n'
+            "    profileList:\n"
+            "    -   image: image_owner/image_name:image_tag\n"
+        )
+        update_images.images_to_update = [("image_owner/image_name", None)]
+        update_images.image_tags = {
+            ("image_owner/image_name", None): {
+                "current": "image_tag",
+                "latest": "new_image_tag",
+                "paths": {
+                    ".singleuser.image.tag": "image_tag",
+                    ".singleuser.profileList[0].image": "image_tag",
+                },
+            }
+        }
+
+        # Only the tags change, and the formatting of the file is left alone
+        expected_output = (
+            "singleuser:\n"
+            "    image:\n"
+            "        name:   image_owner/image_name\n"
+            '        tag: "new_image_tag"   # pinned\n'
+            "    profileList:\n"
+            "    -   image: image_owner/image_name:new_image_tag\n"
+        ).encode("utf-8")
+        expected_output = base64.b64encode(expected_output).decode("utf-8")
+
+        result = update_images.update_config()
+
+        self.assertEqual(result, expected_output)
+        self.assertEqual(
+            update_images.config["singleuser"]["image"]["tag"], "new_image_tag"
+        )
+
+    def test_update_config_shared_image(self):
+        update_images = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [
+                {"values_path": ".singleuser.image"},
+                {
+                    "values_path": ".singleuser.profileList[0].kubespawner_override.image"
+                },
+                {
+                    "values_path": ".singleuser.profileList[1].kubespawner_override.image"
+                },
+            ],
+        )
+        update_images.config = {}
+        update_images.images_to_update = [("image_owner/image_name", None)]
+        update_images.image_tags = {
+            ("image_owner/image_name", None): {
+                "current": "image_tag",
+                "latest": "new_image_tag",
+                "paths": {
+                    ".singleuser.image.tag": "image_tag",
+                    ".singleuser.profileList[0].kubespawner_override.image": "image_tag",
+                    ".singleuser.profileList[1].kubespawner_override.image": "new_image_tag",
+                },
+            }
+        }
+
+        with patch(
+            "tag_bot.main.read_config_values",
+            return_value={
+                ".singleuser.image.tag": "image_tag",
+                ".singleuser.profileList[0].kubespawner_override.image": "image_owner/image_name:image_tag",
+            },
+        ) as mock_read, patch(
+            "tag_bot.main.update_config_values", return_value={}
+        ) as mock_update:
+            update_images.update_config()
+
+        # Every out of date path is read and updated in one pass, and up to date
+        # paths are left alone
+        mock_read.assert_called_once_with(
+            {},
+            [
+                ".singleuser.image.tag",
+                ".singleuser.profileList[0].kubespawner_override.image",
+            ],
+        )
+        mock_update.assert_called_once_with(
+            {},
+            {
+                ".singleuser.image.tag": "new_image_tag",
+                ".singleuser.profileList[0].kubespawner_override.image": "image_owner/image_name:new_image_tag",
+            },
+        )
+
+    def test_update_config_shared_image_different_filters(self):
+        update_images = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [
+                {"values_path": ".singleuser.image"},
+                {
+                    "values_path": ".singleuser.profileList[0].kubespawner_override.image",
+                    "regexpr": "python-.*",
+                },
+            ],
+        )
+        update_images.config = {
+            "singleuser": {
+                "image": {"name": "image_owner/image_name", "tag": "image_tag"},
+                "profileList": [
+                    {
+                        "kubespawner_override": {
+                            "image": "image_owner/image_name:python-3.9"
+                        }
+                    }
+                ],
+            }
+        }
+        update_images.images_to_update = [
+            ("image_owner/image_name", None),
+            ("image_owner/image_name", '{"regexpr": "python-.*"}'),
+        ]
+        update_images.image_tags = {
+            ("image_owner/image_name", None): {
+                "current": "image_tag",
+                "latest": "new_image_tag",
+                "paths": {".singleuser.image.tag": "image_tag"},
+            },
+            ("image_owner/image_name", '{"regexpr": "python-.*"}'): {
+                "current": "python-3.9",
+                "latest": "python-3.12",
+                "paths": {
+                    ".singleuser.profileList[0].kubespawner_override.image": "python-3.9"
+                },
+            },
+        }
+
+        update_images.update_config()
+
+        # Each path is bumped to the tag its own filter resolved
+        self.assertEqual(
+            update_images.config["singleuser"]["image"]["tag"], "new_image_tag"
+        )
+        self.assertEqual(
+            update_images.config["singleuser"]["profileList"][0][
+                "kubespawner_override"
+            ]["image"],
+            "image_owner/image_name:python-3.12",
+        )
+
+    def test_update_deadline_exceeded(self):
+        update_images = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+
+        with patch("tag_bot.main.GitHubAPI"), patch(
+            "tag_bot.main.ImageTags"
+        ) as mock_parser, patch("tag_bot.main.logger") as mock_logger:
+            mock_parser.return_value.image_tags = {
+                ("image_owner/image1", None): {"current": "tag", "latest": "new_tag"},
+                ("image_owner/image2", None): {"current": "tag"},
+            }
+            mock_parser.return_value.get_image_tags.side_effect = DeadlineExceeded
+
+            with pytest.raises(DeadlineExceeded):
+                update_images.update()
+
+            mock_logger.error.assert_any_call(
+                "Images checked for newer tags: {}", ["image_owner/image1"]
+            )
+            mock_logger.error.assert_any_call(
+                "Images not checked: {}", ["image_owner/image2"]
+            )
+
 
 def test_split_str_to_list_simple():
     test_str1 = "label1,label2"
@@ -208,5 +400,40 @@ def test_assert_images_info_input_fail_4():
         assert_images_info_input(images_info)
 
 
+def test_assert_images_info_input_filter_pass():
+    images_info = [
+        {
+            "values_path": ".singleuser.image",
+            "regexpr": "python-3\\.[0-9]+",
+            "include": ["python-*"],
+            "exclude": ["*-rc*"],
+            "prefix": "python-",
+            "sort": "semver",
+        }
+    ]
+    assert_images_info_input(images_info)
+
+
+def test_assert_images_info_input_fail_invalid_regexpr():
+    images_info = [{"values_path": ".singleuser.image", "regexpr": "[0-9"}]
+
+    with pytest.raises(AssertionError):
+        assert_images_info_input(images_info)
+
+
+def test_assert_images_info_input_fail_invalid_sort():
+    images_info = [{"values_path": ".singleuser.image", "sort": "alphabetical"}]
+
+    with pytest.raises(AssertionError):
+        assert_images_info_input(images_info)
+
+
+def test_assert_images_info_input_fail_include_not_list():
+    images_info = [{"values_path": ".singleuser.image", "include": "python-*"}]
+
+    with pytest.raises(AssertionError):
+        assert_images_info_input(images_info)
+
+
 if __name__ == "__main__":
     unittest.main()
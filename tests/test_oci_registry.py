@@ -0,0 +1,159 @@
+import unittest
+from unittest.mock import patch
+
+import pytest
+import requests
+import responses
+
+from tag_bot.oci_registry import OciRegistry, get_registry, is_registry_host
+
+registry_url = "https://registry.example.com/v2"
+token_url = "https://auth.example.com/token"
+challenge = {
+    "WWW-Authenticate": f'Bearer realm="{token_url}",service="registry.example.com"'
+}
+
+
+def test_is_registry_host():
+    assert is_registry_host("registry.example.com")
+    assert is_registry_host("localhost:5000")
+    assert is_registry_host("localhost")
+    assert not is_registry_host("jupyter")
+
+
+def test_get_registry_is_shared():
+    with patch("tag_bot.oci_registry._registries", {}):
+        assert get_registry("registry.example.com") is get_registry(
+            "registry.example.com"
+        )
+
+
+def test_local_registry_uses_http():
+    assert OciRegistry("localhost:5000").base_url == "http://localhost:5000/v2"
+    assert OciRegistry("registry.example.com").base_url == registry_url
+
+
+class TestOciRegistry(unittest.TestCase):
+    @responses.activate
+    def test_list_tags_anonymous(self):
+        responses.add(responses.GET, f"{registry_url}/", json={}, status=200)
+        responses.add(
+            responses.GET,
+            f"{registry_url}/owner/image/tags/list",
+            json={"name": "owner/image", "tags": ["1.0", "1.1"]},
+            status=200,
+        )
+        registry = OciRegistry("registry.example.com")
+
+        tags = list(registry.list_tags("owner/image"))
+
+        self.assertEqual(tags, ["1.0", "1.1"])
+        self.assertNotIn("Authorization", responses.calls[1].request.headers)
+
+    @responses.activate
+    def test_list_tags_paginated(self):
+        next_url = f"{registry_url}/owner/image/tags/list?last=1.0&n=100"
+        responses.add(responses.GET, f"{registry_url}/", json={}, status=200)
+        responses.add(
+            responses.GET,
+            f"{registry_url}/owner/image/tags/list",
+            json={"name": "owner/image", "tags": ["1.0"]},
+            headers={"Link": '</v2/owner/image/tags/list?last=1.0&n=100>; rel="next"'},
+            status=200,
+        )
+        responses.add(
+            responses.GET,
+            next_url,
+            json={"name": "owner/image", "tags": ["1.1"]},
+            status=200,
+        )
+        registry = OciRegistry("registry.example.com")
+
+        tags = list(registry.list_tags("owner/image"))
+
+        self.assertEqual(tags, ["1.0", "1.1"])
+        self.assertEqual(responses.calls[2].request.url, next_url)
+
+    @responses.activate
+    def test_list_tags_bearer_challenge(self):
+        responses.add(responses.GET, f"{registry_url}/", status=401, headers=challenge)
+        responses.add(
+            responses.GET, token_url, json={"token": "t0k3n", "expires_in": 300}
+        )
+        responses.add(
+            responses.GET,
+            f"{registry_url}/owner/image/tags/list",
+            json={"name": "owner/image", "tags": ["1.0"]},
+            status=200,
+        )
+        registry = OciRegistry("registry.example.com")
+
+        tags = list(registry.list_tags("owner/image"))
+        list(registry.list_tags("owner/image"))
+
+        self.assertEqual(tags, ["1.0"])
+        # The registry is probed and the token requested only once
+        self.assertEqual(len(responses.calls), 4)
+        self.assertIn(
+            "scope=repository%3Aowner%2Fimage%3Apull", responses.calls[1].request.url
+        )
+        self.assertIn("service=registry.example.com", responses.calls[1].request.url)
+        self.assertEqual(
+            responses.calls[3].request.headers["Authorization"], "Bearer t0k3n"
+        )
+
+    @responses.activate
+    def test_list_tags_expired_token_renewed(self):
+        responses.add(responses.GET, f"{registry_url}/", status=401, headers=challenge)
+        responses.add(
+            responses.GET, token_url, json={"token": "t0k3n", "expires_in": 0}
+        )
+        responses.add(
+            responses.GET,
+            f"{registry_url}/owner/image/tags/list",
+            json={"name": "owner/image", "tags": None},
+            status=200,
+        )
+        registry = OciRegistry("registry.example.com")
+
+        self.assertEqual(list(registry.list_tags("owner/image")), [])
+        list(registry.list_tags("owner/image"))
+
+        token_calls = [
+            call for call in responses.calls if call.request.url.startswith(token_url)
+        ]
+        self.assertEqual(len(token_calls), 2)
+
+    @responses.activate
+    def test_list_tags_unsupported_challenge(self):
+        responses.add(
+            responses.GET,
+            f"{registry_url}/",
+            status=401,
+            headers={"WWW-Authenticate": 'Basic realm="registry"'},
+        )
+        registry = OciRegistry("registry.example.com")
+
+        with pytest.raises(requests.HTTPError):
+            list(registry.list_tags("owner/image"))
+
+    @responses.activate
+    def test_get_digest(self):
+        responses.add(responses.GET, f"{registry_url}/", json={}, status=200)
+        responses.add(
+            responses.HEAD,
+            f"{registry_url}/owner/image/manifests/1.0",
+            headers={"Docker-Content-Digest": "sha256:abc123"},
+            status=200,
+        )
+        responses.add(
+            responses.HEAD, f"{registry_url}/owner/image/manifests/2.0", status=404
+        )
+        registry = OciRegistry("registry.example.com")
+
+        self.assertEqual(registry.get_digest("owner/image", "1.0"), "sha256:abc123")
+        self.assertIsNone(registry.get_digest("owner/image", "2.0"))
+        self.assertIn(
+            "application/vnd.oci.image.index.v1+json",
+            responses.calls[1].request.headers["Accept"],
+        )
@@ -1,8 +1,16 @@
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch
 
+import requests
+
 from tag_bot.main import UpdateImageTags
-from tag_bot.parse_image_tags import ImageTags
+from tag_bot.parse_image_tags import ImageTags, get_image_key
+from tag_bot.registries import DockerHubBackend
+from tag_bot.tag_cache import FRESH, DigestStore, TagCache
+from tag_bot.tag_filter import TagFilter
 
 
 class TestImageTags(unittest.TestCase):
@@ -24,16 +32,92 @@ class TestImageTags(unittest.TestCase):
         }
 
         expected_image_tags = {
-            "image_owner/image_name": {
+            ("image_owner/image_name", None): {
+                "current": "image_tag",
+                "paths": {".singleuser.image.tag": "image_tag"},
+                "tag_filter": None,
+            }
+        }
+
+        image_parser._get_local_image_tags()
+
+        self.assertDictEqual(image_parser.image_tags, expected_image_tags)
+
+    def test_get_local_image_tags_lazily(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [
+                {"values_path": ".singleuser.image"},
+                {
+                    "values_path": ".singleuser.profileList[1].kubespawner_override.image"
+                },
+            ],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.inputs.config_text = (
+            "singleuser:\n"
+            "  image:\n"
+            "    name: image_owner/image_name\n"
+            "    tag: image_tag\n"
+            "  profileList:\n"
+            "    - display_name: default\n"
+            "    - kubespawner_override:\n"
+            "        image: image_owner/other_image:other_tag\n"
+        )
+
+        expected_image_tags = {
+            ("image_owner/image_name", None): {
+                "current": "image_tag",
+                "paths": {".singleuser.image.tag": "image_tag"},
+                "tag_filter": None,
+            },
+            ("image_owner/other_image", None): {
+                "current": "other_tag",
+                "paths": {
+                    ".singleuser.profileList[1].kubespawner_override.image": "other_tag"
+                },
+                "tag_filter": None,
+            },
+        }
+
+        image_parser._get_local_image_tags()
+
+        self.assertDictEqual(image_parser.image_tags, expected_image_tags)
+        # The whole config is not loaded until an update has to be written
+        self.assertIsNone(main.config)
+
+    def test_get_local_image_tags_lazily_alias(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.inputs.config_text = (
+            "images:\n"
+            "  default: &default\n"
+            "    name: image_owner/image_name\n"
+            "    tag: image_tag\n"
+            "singleuser:\n"
+            "  image: *default\n"
+        )
+
+        expected_image_tags = {
+            ("image_owner/image_name", None): {
                 "current": "image_tag",
-                "path": ".singleuser.image.tag",
-                "regexpr": None,
+                "paths": {".singleuser.image.tag": "image_tag"},
+                "tag_filter": None,
             }
         }
 
         image_parser._get_local_image_tags()
 
+        # The alias cannot be followed without loading the whole config
         self.assertDictEqual(image_parser.image_tags, expected_image_tags)
+        self.assertIsNotNone(main.config)
 
     def test_get_deployed_image_tags_profileList(self):
         main = UpdateImageTags(
@@ -56,10 +140,12 @@ class TestImageTags(unittest.TestCase):
         }
 
         expected_image_tags = {
-            "image_owner/image_name": {
+            ("image_owner/image_name", None): {
                 "current": "image_tag",
-                "path": ".singleuser.profileList[0].kubespawner_override.image",
-                "regexpr": None,
+                "paths": {
+                    ".singleuser.profileList[0].kubespawner_override.image": "image_tag"
+                },
+                "tag_filter": None,
             },
         }
 
@@ -67,6 +153,142 @@ class TestImageTags(unittest.TestCase):
 
         self.assertDictEqual(image_parser.image_tags, expected_image_tags)
 
+    def test_get_local_image_tags_shared_image(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [
+                {"values_path": ".singleuser.image"},
+                {
+                    "values_path": ".singleuser.profileList[0].kubespawner_override.image"
+                },
+                {
+                    "values_path": ".singleuser.profileList[1].kubespawner_override.image"
+                },
+            ],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.inputs.config = {
+            "singleuser": {
+                "image": {"name": "image_owner/image_name", "tag": "image_tag"},
+                "profileList": [
+                    {
+                        "kubespawner_override": {
+                            "image": "image_owner/image_name:image_tag"
+                        }
+                    },
+                    {
+                        "kubespawner_override": {
+                            "image": "image_owner/image_name:old_tag"
+                        }
+                    },
+                ],
+            }
+        }
+
+        expected_image_tags = {
+            ("image_owner/image_name", None): {
+                "current": "image_tag",
+                "paths": {
+                    ".singleuser.image.tag": "image_tag",
+                    ".singleuser.profileList[0].kubespawner_override.image": "image_tag",
+                    ".singleuser.profileList[1].kubespawner_override.image": "old_tag",
+                },
+                "tag_filter": None,
+            }
+        }
+
+        image_parser._get_local_image_tags()
+
+        self.assertDictEqual(image_parser.image_tags, expected_image_tags)
+
+    def test_get_local_image_tags_shared_image_different_filter(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [
+                {"values_path": ".singleuser.image"},
+                {
+                    "values_path": ".singleuser.profileList[0].kubespawner_override.image",
+                    "regexpr": "python-.*",
+                },
+            ],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.inputs.config = {
+            "singleuser": {
+                "image": {"name": "image_owner/image_name", "tag": "image_tag"},
+                "profileList": [
+                    {
+                        "kubespawner_override": {
+                            "image": "image_owner/image_name:python-3.9"
+                        }
+                    }
+                ],
+            }
+        }
+
+        image_parser._get_local_image_tags()
+
+        # Each tag filter is looked up and bumped separately
+        key = get_image_key("image_owner/image_name", TagFilter(regexpr="python-.*"))
+        self.assertEqual(
+            list(image_parser.image_tags.keys()),
+            [("image_owner/image_name", None), key],
+        )
+        self.assertEqual(
+            image_parser.image_tags[("image_owner/image_name", None)]["paths"],
+            {".singleuser.image.tag": "image_tag"},
+        )
+        self.assertEqual(
+            image_parser.image_tags[key]["paths"],
+            {".singleuser.profileList[0].kubespawner_override.image": "python-3.9"},
+        )
+
+    def test_get_local_image_tags_registry_port(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.inputs.config = {
+            "singleuser": {"image": "localhost:5000/image_name:image_tag"}
+        }
+
+        image_parser._get_local_image_tags()
+
+        self.assertDictEqual(
+            image_parser.image_tags,
+            {
+                ("localhost:5000/image_name", None): {
+                    "current": "image_tag",
+                    "paths": {".singleuser.image": "image_tag"},
+                    "tag_filter": None,
+                }
+            },
+        )
+
+    def test_get_local_image_tags_no_tag(self):
+        for value in ["jupyter/base-notebook", "localhost:5000/image_name"]:
+            with self.subTest(value=value):
+                main = UpdateImageTags(
+                    "octocat/octocat",
+                    "ThIs_Is_A_t0k3n",
+                    "config/config.yaml",
+                    [{"values_path": ".singleuser.image"}],
+                )
+                image_parser = ImageTags(main, "octocat/octocat", "main")
+                image_parser.inputs.config = {"singleuser": {"image": value}}
+
+                with self.assertWarns(UserWarning):
+                    image_parser._get_local_image_tags()
+
+                self.assertDictEqual(image_parser.image_tags, {})
+
     def test_get_most_recent_image_tags_dockerhub(self):
         main = UpdateImageTags(
             "octocat/octocat",
@@ -75,43 +297,44 @@ class TestImageTags(unittest.TestCase):
             [{"values_path": ".singleuser.image"}],
         )
         image_parser = ImageTags(main, "octocat/octocat", "main")
-        image_parser.image_tags = {"image_owner/image_name": {"current": "image_tag"}}
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {"current": "image_tag"}
+        }
         image = "image_owner/image_name"
 
         expected_image_tags = {
-            "image_owner/image_name": {
+            ("image_owner/image_name", None): {
                 "current": "image_tag",
                 "latest": "new_image_tag",
             }
         }
 
         mock_get = patch(
-            "tag_bot.parse_image_tags.get_request",
-            return_value={
-                "results": [
-                    {
-                        "last_updated": "2021-09-27T16:00:00.000000Z",
-                        "name": "latest",
-                    },
-                    {
-                        "last_updated": "2021-09-27T15:59:00.000000Z",
-                        "name": "new_image_tag",
-                    },
-                    {
-                        "last_updated": "2021-08-27T16:00:00.000000Z",
-                        "name": "some_other_tag",
-                    },
-                ]
-            },
+            "tag_bot.registries.get_paginated_request",
+            return_value=[
+                {
+                    "last_updated": "2021-09-27T16:00:00.000000Z",
+                    "name": "latest",
+                },
+                {
+                    "last_updated": "2021-09-27T15:59:00.000000Z",
+                    "name": "new_image_tag",
+                },
+                {
+                    "last_updated": "2021-08-27T16:00:00.000000Z",
+                    "name": "some_other_tag",
+                },
+            ],
         )
 
         with mock_get as mock:
-            image_parser._get_most_recent_image_tag_dockerhub(image)
+            image_parser._get_most_recent_image_tag((image, None))
 
             self.assertEqual(mock.call_count, 1)
             mock.assert_called_with(
                 "/".join(["https://hub.docker.com/v2/repositories", image, "tags"]),
-                output="json",
+                params={"ordering": "last_updated", "page_size": 25},
+                items_key="results",
             )
             self.assertDictEqual(image_parser.image_tags, expected_image_tags)
 
@@ -128,48 +351,174 @@ class TestImageTags(unittest.TestCase):
             ],
         )
         image_parser = ImageTags(main, "octocat/octocat", "main")
-        image_parser.image_tags = {"image_owner/image_name": {"current": "image_tag"}}
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {"current": "image_tag"}
+        }
         image = "image_owner/image_name"
 
         expected_image_tags = {
-            "image_owner/image_name": {
+            ("image_owner/image_name", None): {
                 "current": "image_tag",
                 "latest": "2022.06.09",
             }
         }
 
         mock_get = patch(
-            "tag_bot.parse_image_tags.get_request",
-            return_value={
-                "results": [
-                    {
-                        "last_updated": "2021-09-27T16:00:00.000000Z",
-                        "name": "latest",
-                    },
-                    {
-                        "last_updated": "2021-09-27T15:59:00.000000Z",
-                        "name": "2022.06.09",
-                    },
-                    {
-                        "last_updated": "2021-08-27T16:00:00.000000Z",
-                        "name": "some_other_tag",
-                    },
-                ]
-            },
+            "tag_bot.registries.get_paginated_request",
+            return_value=[
+                {
+                    "last_updated": "2021-09-27T16:00:00.000000Z",
+                    "name": "latest",
+                },
+                {
+                    "last_updated": "2021-09-27T15:59:00.000000Z",
+                    "name": "2022.06.09",
+                },
+                {
+                    "last_updated": "2021-08-27T16:00:00.000000Z",
+                    "name": "some_other_tag",
+                },
+            ],
         )
 
         with mock_get as mock:
-            image_parser._get_most_recent_image_tag_dockerhub(
-                image, regexpr="[0-9]{4}.[0-9]{2}.[0-9]{2}"
+            image_parser._get_most_recent_image_tag(
+                (image, None),
+                tag_filter=TagFilter(regexpr="[0-9]{4}.[0-9]{2}.[0-9]{2}"),
             )
 
             self.assertEqual(mock.call_count, 1)
             mock.assert_called_with(
                 "/".join(["https://hub.docker.com/v2/repositories", image, "tags"]),
-                output="json",
+                params={"ordering": "last_updated", "page_size": 25},
+                items_key="results",
             )
             self.assertDictEqual(image_parser.image_tags, expected_image_tags)
 
+    def test_get_most_recent_image_tags_dockerhub_stops_at_first_match(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {"current": "image_tag"}
+        }
+        image = "image_owner/image_name"
+        consumed = []
+
+        def tags():
+            for name in ["latest", "2022.06.09", "some_other_tag"]:
+                consumed.append(name)
+                yield {"name": name}
+
+        with patch("tag_bot.registries.get_paginated_request", return_value=tags()):
+            image_parser._get_most_recent_image_tag(
+                (image, None),
+                tag_filter=TagFilter(regexpr="[0-9]{4}.[0-9]{2}.[0-9]{2}"),
+            )
+
+        self.assertEqual(image_parser.image_tags[(image, None)]["latest"], "2022.06.09")
+        self.assertEqual(consumed, ["latest", "2022.06.09"])
+
+    def test_get_most_recent_image_tags_dockerhub_prefix_hint(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {"current": "image_tag"}
+        }
+        image = "image_owner/image_name"
+
+        with patch(
+            "tag_bot.registries.get_paginated_request",
+            return_value=[{"name": "python-3.11"}, {"name": "python-3.10"}],
+        ) as mock:
+            image_parser._get_most_recent_image_tag(
+                (image, None), tag_filter=TagFilter(regexpr="python-3\\.[0-9]+")
+            )
+
+            mock.assert_called_with(
+                "/".join(["https://hub.docker.com/v2/repositories", image, "tags"]),
+                params={
+                    "ordering": "last_updated",
+                    "page_size": 25,
+                    "name": "python-3.",
+                },
+                items_key="results",
+            )
+            self.assertEqual(
+                image_parser.image_tags[(image, None)]["latest"], "python-3.11"
+            )
+
+    def test_get_most_recent_image_tags_dockerhub_semver(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {
+                "current": "1.3.0",
+                "paths": {".singleuser.image.tag": "1.3.0"},
+            }
+        }
+        image = "image_owner/image_name"
+
+        with patch(
+            "tag_bot.registries.get_paginated_request",
+            return_value=[
+                {"name": "latest"},
+                {"name": "1.2.4"},
+                {"name": "1.3.0"},
+                {"name": "1.2.3"},
+            ],
+        ) as mock:
+            image_parser._get_most_recent_image_tag(
+                (image, None), tag_filter=TagFilter(sort="semver")
+            )
+
+            mock.assert_called_with(
+                "/".join(["https://hub.docker.com/v2/repositories", image, "tags"]),
+                params={"ordering": "last_updated", "page_size": 100},
+                items_key="results",
+            )
+            self.assertEqual(image_parser.image_tags[(image, None)]["latest"], "1.3.0")
+            self.assertEqual(image_parser._compare_image_tags(), [])
+
+    def test_get_most_recent_image_tags_dockerhub_no_match(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {"current": "image_tag"}
+        }
+        image = "image_owner/image_name"
+
+        with patch(
+            "tag_bot.registries.get_paginated_request",
+            return_value=[{"name": "latest"}, {"name": "some_other_tag"}],
+        ):
+            image_parser._get_most_recent_image_tag(
+                (image, None),
+                tag_filter=TagFilter(regexpr="[0-9]{4}.[0-9]{2}.[0-9]{2}"),
+            )
+
+        self.assertIsNone(image_parser.image_tags[(image, None)]["latest"])
+        self.assertEqual(image_parser._compare_image_tags(), [])
+
     def test_get_most_recent_image_tags_quayio(self):
         main = UpdateImageTags(
             "octocat/octocat",
@@ -179,39 +528,37 @@ class TestImageTags(unittest.TestCase):
         )
         image_parser = ImageTags(main, "octocat/octocat", "main")
         image_parser.image_tags = {
-            "quay.io/image_owner/image_name": {"current": "image_tag"}
+            ("quay.io/image_owner/image_name", None): {"current": "image_tag"}
         }
         image = "quay.io/image_owner/image_name"
 
         expected_image_tags = {
-            "quay.io/image_owner/image_name": {
+            ("quay.io/image_owner/image_name", None): {
                 "current": "image_tag",
                 "latest": "new_image_tag",
             }
         }
 
         mock_get = patch(
-            "tag_bot.parse_image_tags.get_request",
-            return_value={
-                "tags": {
-                    "latest": {
-                        "last_modified": "Mon, 27 Sep 2021 16:00:00 -0000",
-                        "name": "latest",
-                    },
-                    "new_image_tag": {
-                        "last_modified": "Mon, 27 Sep 2021 15:59:00 -0000",
-                        "name": "new_image_tag",
-                    },
-                    "some_other_tag": {
-                        "last_modified": "Fri, 27 Aug 2021 16:00:00 -0000",
-                        "name": "some_other_tag",
-                    },
-                }
-            },
+            "tag_bot.registries.get_paginated_request",
+            return_value=[
+                {
+                    "last_modified": "Mon, 27 Sep 2021 16:00:00 -0000",
+                    "name": "latest",
+                },
+                {
+                    "last_modified": "Mon, 27 Sep 2021 15:59:00 -0000",
+                    "name": "new_image_tag",
+                },
+                {
+                    "last_modified": "Fri, 27 Aug 2021 16:00:00 -0000",
+                    "name": "some_other_tag",
+                },
+            ],
         )
 
         with mock_get as mock:
-            image_parser._get_most_recent_image_tag_quayio(image)
+            image_parser._get_most_recent_image_tag((image, None))
 
             self.assertEqual(mock.call_count, 1)
             mock.assert_called_with(
@@ -219,9 +566,11 @@ class TestImageTags(unittest.TestCase):
                     [
                         "https://quay.io/api/v1/repository",
                         "/".join(image.split("/")[1:]),
+                        "tag/",
                     ]
                 ),
-                output="json",
+                params={"onlyActiveTags": "true", "limit": 25},
+                items_key="tags",
             )
             self.assertDictEqual(image_parser.image_tags, expected_image_tags)
 
@@ -239,40 +588,39 @@ class TestImageTags(unittest.TestCase):
         )
         image_parser = ImageTags(main, "octocat/octocat", "main")
         image_parser.image_tags = {
-            "quay.io/image_owner/image_name": {"current": "image_tag"}
+            ("quay.io/image_owner/image_name", None): {"current": "image_tag"}
         }
         image = "quay.io/image_owner/image_name"
 
         expected_image_tags = {
-            "quay.io/image_owner/image_name": {
+            ("quay.io/image_owner/image_name", None): {
                 "current": "image_tag",
                 "latest": "2022.06.09",
             }
         }
 
         mock_get = patch(
-            "tag_bot.parse_image_tags.get_request",
-            return_value={
-                "tags": {
-                    "latest": {
-                        "last_modified": "Mon, 27 Sep 2021 16:00:00 -0000",
-                        "name": "latest",
-                    },
-                    "new_image_tag": {
-                        "last_modified": "Mon, 27 Sep 2021 15:59:00 -0000",
-                        "name": "2022.06.09",
-                    },
-                    "some_other_tag": {
-                        "last_modified": "Fri, 27 Aug 2021 16:00:00 -0000",
-                        "name": "some_other_tag",
-                    },
-                }
-            },
+            "tag_bot.registries.get_paginated_request",
+            return_value=[
+                {
+                    "last_modified": "Mon, 27 Sep 2021 16:00:00 -0000",
+                    "name": "latest",
+                },
+                {
+                    "last_modified": "Mon, 27 Sep 2021 15:59:00 -0000",
+                    "name": "2022.06.09",
+                },
+                {
+                    "last_modified": "Fri, 27 Aug 2021 16:00:00 -0000",
+                    "name": "some_other_tag",
+                },
+            ],
         )
 
         with mock_get as mock:
-            image_parser._get_most_recent_image_tag_quayio(
-                image, regexpr="[0-9]{4}.[0-9]{2}.[0-9]{2}"
+            image_parser._get_most_recent_image_tag(
+                (image, None),
+                tag_filter=TagFilter(regexpr="[0-9]{4}.[0-9]{2}.[0-9]{2}"),
             )
 
             self.assertEqual(mock.call_count, 1)
@@ -281,9 +629,11 @@ class TestImageTags(unittest.TestCase):
                     [
                         "https://quay.io/api/v1/repository",
                         "/".join(image.split("/")[1:]),
+                        "tag/",
                     ]
                 ),
-                output="json",
+                params={"onlyActiveTags": "true", "limit": 25},
+                items_key="tags",
             )
             self.assertDictEqual(image_parser.image_tags, expected_image_tags)
 
@@ -296,19 +646,19 @@ class TestImageTags(unittest.TestCase):
         )
         image_parser = ImageTags(main, "octocat/octocat", "main")
         image_parser.image_tags = {
-            "ghcr.io/image_owner/image_name": {"current": "image_tag"}
+            ("ghcr.io/image_owner/image_name", None): {"current": "image_tag"}
         }
         image = "ghcr.io/image_owner/image_name"
 
         expected_image_tags = {
-            "ghcr.io/image_owner/image_name": {
+            ("ghcr.io/image_owner/image_name", None): {
                 "current": "image_tag",
                 "latest": "new_image_tag",
             }
         }
 
         mock_get = patch(
-            "tag_bot.parse_image_tags.get_request",
+            "tag_bot.registries.get_paginated_request",
             return_value=[
                 {
                     "updated_at": "2022-10-29T15:42:12Z",
@@ -338,7 +688,7 @@ class TestImageTags(unittest.TestCase):
         )
 
         with mock_get as mock:
-            image_parser._get_most_recent_image_tag_ghcr(image)
+            image_parser._get_most_recent_image_tag((image, None))
             _, org, img_name = image.split("/")
             self.assertEqual(mock.call_count, 1)
             mock.assert_called_with(
@@ -347,7 +697,7 @@ class TestImageTags(unittest.TestCase):
                     "Accept": "application/vnd.github.v3+json",
                     "Authorization": "token ThIs_Is_A_t0k3n",
                 },
-                output="json",
+                params={"per_page": 100},
             )
 
             self.assertDictEqual(image_parser.image_tags, expected_image_tags)
@@ -366,19 +716,19 @@ class TestImageTags(unittest.TestCase):
         )
         image_parser = ImageTags(main, "octocat/octocat", "main")
         image_parser.image_tags = {
-            "ghcr.io/image_owner/image_name": {"current": "image_tag"}
+            ("ghcr.io/image_owner/image_name", None): {"current": "image_tag"}
         }
         image = "ghcr.io/image_owner/image_name"
 
         expected_image_tags = {
-            "ghcr.io/image_owner/image_name": {
+            ("ghcr.io/image_owner/image_name", None): {
                 "current": "image_tag",
                 "latest": "2022.06.09",
             }
         }
 
         mock_get = patch(
-            "tag_bot.parse_image_tags.get_request",
+            "tag_bot.registries.get_paginated_request",
             return_value=[
                 {
                     "updated_at": "2022-10-29T15:42:12Z",
@@ -408,8 +758,9 @@ class TestImageTags(unittest.TestCase):
         )
 
         with mock_get as mock:
-            image_parser._get_most_recent_image_tag_ghcr(
-                image, regexpr="[0-9]{4}.[0-9]{2}.[0-9]{2}"
+            image_parser._get_most_recent_image_tag(
+                (image, None),
+                tag_filter=TagFilter(regexpr="[0-9]{4}.[0-9]{2}.[0-9]{2}"),
             )
             self.assertEqual(mock.call_count, 1)
 
@@ -420,10 +771,70 @@ class TestImageTags(unittest.TestCase):
                     "Accept": "application/vnd.github.v3+json",
                     "Authorization": "token ThIs_Is_A_t0k3n",
                 },
-                output="json",
+                params={"per_page": 100},
             )
             self.assertDictEqual(image_parser.image_tags, expected_image_tags)
 
+    def test_get_most_recent_image_tags_ghcr_skips_untagged_versions(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("ghcr.io/image_owner/image_name", None): {"current": "image_tag"}
+        }
+        image = "ghcr.io/image_owner/image_name"
+        consumed = []
+
+        def versions():
+            for tags in [[], None, ["latest", "sha-1a2b3c", "2022.06.09"], ["old"]]:
+                consumed.append(tags)
+                yield {
+                    "metadata": {
+                        "package_type": "container",
+                        "container": {"tags": tags},
+                    }
+                }
+
+        with patch("tag_bot.registries.get_paginated_request", return_value=versions()):
+            image_parser._get_most_recent_image_tag(
+                (image, None),
+                tag_filter=TagFilter(regexpr="[0-9]{4}.[0-9]{2}.[0-9]{2}"),
+            )
+
+        self.assertEqual(image_parser.image_tags[(image, None)]["latest"], "2022.06.09")
+        self.assertEqual(len(consumed), 3)
+
+    def test_get_most_recent_image_tags_oci(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("localhost:5000/image_owner/image_name", None): {"current": "image_tag"}
+        }
+        image = "localhost:5000/image_owner/image_name"
+
+        with patch("tag_bot.registries.get_registry") as mock_registry:
+            mock_registry.return_value.list_tags.return_value = iter(
+                ["1.9.0", "latest", "1.10.0", "1.2.0", "sha-1a2b3c"]
+            )
+            image_parser._get_most_recent_image_tag(
+                (image, None), tag_filter=TagFilter(regexpr="[0-9]+.[0-9]+.[0-9]+")
+            )
+
+            mock_registry.assert_called_with("localhost:5000")
+            mock_registry.return_value.list_tags.assert_called_with(
+                "image_owner/image_name"
+            )
+            self.assertEqual(image_parser.image_tags[(image, None)]["latest"], "1.10.0")
+
     def test_compare_image_tags_match(self):
         main = UpdateImageTags(
             "octocat/octocat",
@@ -436,6 +847,7 @@ class TestImageTags(unittest.TestCase):
             "image_name": {
                 "current": "image_name",
                 "latest": "image_name",
+                "paths": {".singleuser.image.tag": "image_name"},
             }
         }
 
@@ -457,6 +869,7 @@ class TestImageTags(unittest.TestCase):
             "image_name": {
                 "current": "image_name",
                 "latest": "new_image_name",
+                "paths": {".singleuser.image.tag": "image_name"},
             }
         }
 
@@ -466,6 +879,29 @@ class TestImageTags(unittest.TestCase):
 
         self.assertEqual(result, expected)
 
+    def test_compare_image_tags_any_path_out_of_date(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            "image_name": {
+                "current": "new_image_name",
+                "latest": "new_image_name",
+                "paths": {
+                    ".singleuser.image.tag": "new_image_name",
+                    ".singleuser.profileList[0].kubespawner_override.image": "image_name",
+                },
+            }
+        }
+
+        result = image_parser._compare_image_tags()
+
+        self.assertEqual(result, ["image_name"])
+
     @patch("tag_bot.parse_image_tags.get_request")
     def test_get_config(self, mock_get):
         main = UpdateImageTags(
@@ -484,14 +920,482 @@ class TestImageTags(unittest.TestCase):
             "hello: world",
         ]
 
-        expected_config = {"hello": "world"}
+        expected_config = "hello: world"
         expected_sha = "123456789"
 
         config, sha = image_parser._get_config(main.base_branch)
 
-        self.assertDictEqual(config, expected_config)
+        self.assertEqual(config, expected_config)
         self.assertEqual(sha, expected_sha)
 
+    def test_get_remote_tags_concurrently_across_hosts(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+            max_concurrency_per_host=1,
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {"current": "tag", "tag_filter": None},
+            ("quay.io/image_owner/image_name", None): {
+                "current": "tag",
+                "tag_filter": None,
+            },
+        }
+        # Both lookups must be running at the same time to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def lookup(key, tag_filter=None):
+            barrier.wait()
+            image_parser.image_tags[key]["latest"] = "new_tag"
+
+        with patch.object(
+            image_parser, "_get_most_recent_image_tag", side_effect=lookup
+        ):
+            image_parser._get_remote_tags()
+
+        self.assertEqual(
+            list(image_parser.image_tags.keys()),
+            [
+                ("image_owner/image_name", None),
+                ("quay.io/image_owner/image_name", None),
+            ],
+        )
+        for tags in image_parser.image_tags.values():
+            self.assertEqual(tags["latest"], "new_tag")
+
+    def test_get_remote_tags_limits_concurrency_per_host(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+            max_concurrency_per_host=2,
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            (f"image_owner/image{i}", None): {"current": "tag", "tag_filter": None}
+            for i in range(6)
+        }
+        lock = threading.Lock()
+        running = []
+        max_running = []
+
+        def lookup(key, tag_filter=None):
+            with lock:
+                running.append(key)
+                max_running.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(key)
+            image_parser.image_tags[key]["latest"] = "new_tag"
+
+        with patch.object(
+            image_parser, "_get_most_recent_image_tag", side_effect=lookup
+        ) as mock:
+            image_parser._get_remote_tags()
+
+        self.assertEqual(mock.call_count, 6)
+        self.assertLessEqual(max(max_running), 2)
+
+    def test_get_remote_tags_raises_lookup_error(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {"current": "tag", "tag_filter": None},
+        }
+
+        with patch.object(
+            image_parser,
+            "_get_most_recent_image_tag",
+            side_effect=ValueError("lookup failed"),
+        ):
+            self.assertRaises(ValueError, image_parser._get_remote_tags)
+
+    def test_get_remote_tags_skips_failed_oci_lookup(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("registry.example.com/private/image", None): {
+                "current": "tag",
+                "tag_filter": None,
+            },
+            ("image_owner/image_name", None): {"current": "tag", "tag_filter": None},
+        }
+
+        def lookup(key, tag_filter=None):
+            if key[0].startswith("registry.example.com/"):
+                raise requests.HTTPError("401 Client Error: Unauthorized")
+            image_parser.image_tags[key]["latest"] = "new_tag"
+
+        with patch.object(
+            image_parser, "_get_most_recent_image_tag", side_effect=lookup
+        ):
+            self.assertWarns(UserWarning, image_parser._get_remote_tags)
+
+        self.assertIsNone(
+            image_parser.image_tags[("registry.example.com/private/image", None)][
+                "latest"
+            ]
+        )
+        self.assertEqual(
+            image_parser.image_tags[("image_owner/image_name", None)]["latest"],
+            "new_tag",
+        )
+
+    def test_get_remote_tags_raises_failed_dockerhub_lookup(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {"current": "tag", "tag_filter": None},
+        }
+
+        with patch.object(
+            image_parser,
+            "_get_most_recent_image_tag",
+            side_effect=requests.HTTPError("404 Client Error: Not Found"),
+        ):
+            self.assertRaises(requests.HTTPError, image_parser._get_remote_tags)
+
+    def test_get_remote_tags_uses_fresh_cached_tag(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {"current": "tag", "tag_filter": None},
+        }
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            tag_cache = TagCache(cache_dir, ttl=60)
+            tag_cache.store(
+                "hub.docker.com", "image_owner/image_name", None, "cached_tag"
+            )
+
+            with patch(
+                "tag_bot.parse_image_tags.get_tag_cache", return_value=tag_cache
+            ), patch.object(image_parser, "_get_most_recent_image_tag") as mock:
+                image_parser._get_remote_tags()
+                image_parser.wait_for_revalidation()
+
+        mock.assert_not_called()
+        self.assertEqual(
+            image_parser.image_tags[("image_owner/image_name", None)]["latest"],
+            "cached_tag",
+        )
+
+    def test_get_remote_tags_revalidates_stale_cached_tag(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image_parser.image_tags = {
+            ("image_owner/image_name", None): {"current": "tag", "tag_filter": None},
+        }
+        image = "image_owner/image_name"
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            clock = [1000.0]
+            tag_cache = TagCache(
+                cache_dir, ttl=60, stale_ttl=60, clock=lambda: clock[0]
+            )
+            tag_cache.store("hub.docker.com", image, None, "cached_tag")
+            clock[0] += 90
+
+            with patch(
+                "tag_bot.parse_image_tags.get_tag_cache", return_value=tag_cache
+            ), patch.object(DockerHubBackend, "get_latest_tag", return_value="new_tag"):
+                image_parser._get_remote_tags()
+                image_parser.wait_for_revalidation()
+
+            cached = tag_cache.load("hub.docker.com", image, None)
+
+        # The stale tag is used for this run, and the refreshed one for the next
+        self.assertEqual(image_parser.image_tags[(image, None)]["latest"], "cached_tag")
+        self.assertEqual(cached, ("new_tag", FRESH))
+
+    def test_get_remote_tags_stores_looked_up_tag(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        tag_filter = TagFilter(regexpr="[0-9]+")
+        image = "quay.io/image_owner/image_name"
+        image_parser.image_tags = {
+            (image, None): {"current": "tag", "tag_filter": tag_filter}
+        }
+
+        def lookup(key, tag_filter=None):
+            image_parser.image_tags[key]["latest"] = "new_tag"
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            tag_cache = TagCache(cache_dir, ttl=60)
+
+            with patch(
+                "tag_bot.parse_image_tags.get_tag_cache", return_value=tag_cache
+            ), patch.object(
+                image_parser, "_get_most_recent_image_tag", side_effect=lookup
+            ):
+                image_parser._get_remote_tags()
+
+            cached = tag_cache.load("quay.io", image, TagFilter(regexpr="[0-9]+"))
+
+        self.assertEqual(cached, ("new_tag", FRESH))
+
+    def test_get_remote_tags_skips_listing_unchanged_image(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image = "quay.io/image_owner/image_name"
+        image_parser.image_tags = {
+            (image, None): {
+                "current": "1.0",
+                "paths": {".image": "1.0"},
+                "tag_filter": None,
+            }
+        }
+        digests = {"1.0": "sha256:a", "1.1": "sha256:b", "latest": "sha256:b"}
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            digest_store = DigestStore(cache_dir)
+            digest_store.store("quay.io", image, None, "1.1", digests)
+
+            with patch(
+                "tag_bot.parse_image_tags.get_digest_store", return_value=digest_store
+            ), patch("tag_bot.registries.get_registry") as mock_registry, patch.object(
+                image_parser, "_get_most_recent_image_tag"
+            ) as mock_lookup:
+                mock_registry.return_value.get_digest.side_effect = (
+                    lambda repository, tag: digests[tag]
+                )
+                image_parser._get_remote_tags()
+
+        mock_registry.assert_called_with("quay.io")
+        mock_lookup.assert_not_called()
+        self.assertEqual(image_parser.image_tags[(image, None)]["latest"], "1.1")
+
+    def test_get_remote_tags_lists_changed_image(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image = "image_owner/image_name"
+        image_parser.image_tags = {
+            (image, None): {
+                "current": "1.0",
+                "paths": {".image": "1.0"},
+                "tag_filter": None,
+            }
+        }
+        digests = {"1.0": "sha256:a", "1.2": "sha256:c", "latest": "sha256:c"}
+
+        def lookup(key, tag_filter=None):
+            image_parser.image_tags[key]["latest"] = "1.2"
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            digest_store = DigestStore(cache_dir)
+            digest_store.store(
+                "hub.docker.com",
+                image,
+                None,
+                "1.1",
+                {"1.0": "sha256:a", "1.1": "sha256:b", "latest": "sha256:b"},
+            )
+
+            with patch(
+                "tag_bot.parse_image_tags.get_digest_store", return_value=digest_store
+            ), patch("tag_bot.registries.get_registry") as mock_registry, patch.object(
+                image_parser, "_get_most_recent_image_tag", side_effect=lookup
+            ) as mock_lookup:
+                mock_registry.return_value.get_digest.side_effect = (
+                    lambda repository, tag: digests.get(tag, "sha256:b")
+                )
+                image_parser._get_remote_tags()
+
+            recorded = digest_store.load("hub.docker.com", image, None)
+
+        # Docker Hub serves manifests from its registry host
+        mock_registry.assert_called_with("registry-1.docker.io")
+        mock_lookup.assert_called_once()
+        # The moved sentinel tag is only read once
+        tags_read = [
+            call.args[1]
+            for call in mock_registry.return_value.get_digest.call_args_list
+        ]
+        self.assertEqual(tags_read.count("latest"), 1)
+        self.assertEqual(image_parser.image_tags[(image, None)]["latest"], "1.2")
+        self.assertEqual(recorded, ("1.2", digests))
+
+    def test_get_remote_tags_lists_image_when_digests_unreadable(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image = "quay.io/image_owner/image_name"
+        image_parser.image_tags = {
+            (image, None): {
+                "current": "1.0",
+                "paths": {".image": "1.0"},
+                "tag_filter": None,
+            }
+        }
+
+        def lookup(key, tag_filter=None):
+            image_parser.image_tags[key]["latest"] = "1.1"
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            digest_store = DigestStore(cache_dir)
+            digest_store.store(
+                "quay.io",
+                image,
+                None,
+                "1.0",
+                {"1.0": "sha256:a", "latest": "sha256:a"},
+            )
+
+            with patch(
+                "tag_bot.parse_image_tags.get_digest_store", return_value=digest_store
+            ), patch("tag_bot.registries.get_registry") as mock_registry, patch.object(
+                image_parser, "_get_most_recent_image_tag", side_effect=lookup
+            ) as mock_lookup:
+                mock_registry.return_value.get_digest.side_effect = (
+                    requests.ConnectionError("Connection refused")
+                )
+                image_parser._get_remote_tags()
+
+        # The shortcut is dropped and the tags are listed as usual
+        mock_lookup.assert_called_once()
+        self.assertEqual(image_parser.image_tags[(image, None)]["latest"], "1.1")
+
+    def test_get_remote_tags_lists_image_without_sentinel_tag(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image = "quay.io/image_owner/image_name"
+        image_parser.image_tags = {
+            (image, None): {
+                "current": "1.0",
+                "paths": {".image": "1.0"},
+                "tag_filter": None,
+            }
+        }
+
+        def lookup(key, tag_filter=None):
+            image_parser.image_tags[key]["latest"] = "1.0"
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            digest_store = DigestStore(cache_dir)
+            digest_store.store(
+                "quay.io", image, None, "1.0", {"1.0": "sha256:a", "latest": None}
+            )
+
+            with patch(
+                "tag_bot.parse_image_tags.get_digest_store", return_value=digest_store
+            ), patch("tag_bot.registries.get_registry") as mock_registry, patch.object(
+                image_parser, "_get_most_recent_image_tag", side_effect=lookup
+            ) as mock_lookup:
+                mock_registry.return_value.get_digest.side_effect = (
+                    lambda repository, tag: (None if tag == "latest" else "sha256:a")
+                )
+                image_parser._get_remote_tags()
+
+            recorded = digest_store.load("quay.io", image, None)
+
+        # Only the missing sentinel tag is read, and no new digests are recorded
+        mock_lookup.assert_called_once()
+        mock_registry.return_value.get_digest.assert_called_once_with(
+            "image_owner/image_name", "latest"
+        )
+        self.assertEqual(recorded, ("1.0", {"1.0": "sha256:a", "latest": None}))
+
+    def test_get_remote_tags_lists_image_filtered_away_from_sentinel_tag(self):
+        main = UpdateImageTags(
+            "octocat/octocat",
+            "ThIs_Is_A_t0k3n",
+            "config/config.yaml",
+            [{"values_path": ".singleuser.image"}],
+        )
+        image_parser = ImageTags(main, "octocat/octocat", "main")
+        image = "quay.io/image_owner/image_name"
+        tag_filter = TagFilter(regexpr="python-3\\.10-.*")
+        image_parser.image_tags = {
+            (image, None): {
+                "current": "python-3.10-a",
+                "paths": {".image": "python-3.10-a"},
+                "tag_filter": tag_filter,
+            }
+        }
+        digests = {
+            "latest": "sha256:c",
+            "python-3.10-a": "sha256:a",
+            "python-3.10-b": "sha256:b",
+        }
+
+        def lookup(key, tag_filter=None):
+            image_parser.image_tags[key]["latest"] = "python-3.10-c"
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            digest_store = DigestStore(cache_dir)
+            digest_store.store("quay.io", image, tag_filter, "python-3.10-b", digests)
+
+            with patch(
+                "tag_bot.parse_image_tags.get_digest_store", return_value=digest_store
+            ), patch("tag_bot.registries.get_registry") as mock_registry, patch.object(
+                image_parser, "_get_most_recent_image_tag", side_effect=lookup
+            ) as mock_lookup:
+                mock_registry.return_value.get_digest.side_effect = (
+                    lambda repository, tag: digests.get(tag)
+                )
+                image_parser._get_remote_tags()
+
+        # The latest tag does not follow the filtered flavour, so its unchanged
+        # digest cannot show that no matching tag has been pushed
+        mock_lookup.assert_called_once()
+        mock_registry.return_value.get_digest.assert_not_called()
+        self.assertEqual(
+            image_parser.image_tags[(image, None)]["latest"], "python-3.10-c"
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
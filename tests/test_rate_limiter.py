@@ -0,0 +1,138 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+import responses
+
+from tag_bot.http_requests import get_request
+from tag_bot.rate_limiter import RateLimiter, RateLimitExceeded
+
+test_url = "https://api.github.com/repos/octocat/octocat"
+
+
+def make_response(status_code=200, headers={}, text=""):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers.update(headers)
+    resp._content = text.encode("utf-8")
+    return resp
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.limiter = RateLimiter(clock=lambda: self.now)
+
+    def test_no_wait_without_headers(self):
+        self.limiter.update(test_url, make_response())
+
+        self.assertEqual(self.limiter.reserve(test_url), 0)
+
+    def test_no_wait_with_plenty_of_budget(self):
+        headers = {
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": "4000",
+            "X-RateLimit-Reset": "4600",
+        }
+        self.limiter.update(test_url, make_response(headers=headers))
+
+        self.assertEqual(self.limiter.reserve(test_url), 0)
+
+    def test_wait_for_configured_rate(self):
+        self.limiter.set_rate("api.github.com", 2)
+
+        self.assertEqual(self.limiter.reserve(test_url), 0)
+        self.assertEqual(self.limiter.reserve(test_url), 0.5)
+
+    def test_wait_until_reset_when_exhausted(self):
+        headers = {
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": "1030",
+        }
+        self.limiter.update(test_url, make_response(headers=headers))
+
+        self.assertEqual(self.limiter.reserve(test_url), 30.0)
+
+    def test_pace_when_budget_is_low(self):
+        headers = {
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": "10",
+            "X-RateLimit-Reset": "1100",
+        }
+        self.limiter.update(test_url, make_response(headers=headers))
+        self.assertEqual(self.limiter.reserve(test_url), 0)
+
+        # 100s left to spend 10 requests, then 9 requests
+        self.assertEqual(self.limiter.reserve(test_url), pytest.approx(100 / 9))
+
+    def test_hosts_are_limited_independently(self):
+        headers = {
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": "1030",
+        }
+        self.limiter.update(test_url, make_response(headers=headers))
+
+        self.assertEqual(self.limiter.reserve("https://quay.io/api/v1/repository"), 0)
+
+    def test_retry_after_seconds(self):
+        resp = make_response(status_code=429, headers={"Retry-After": "12"})
+        self.limiter.update(test_url, resp)
+
+        self.assertTrue(RateLimiter.is_rate_limited(resp))
+        self.assertEqual(self.limiter.reserve(test_url), 12.0)
+
+    def test_dockerhub_window_headers(self):
+        headers = {"RateLimit-Limit": "100;w=21600", "RateLimit-Remaining": "0;w=60"}
+        resp = make_response(status_code=429, headers=headers)
+        self.limiter.update(test_url, resp)
+
+        self.assertEqual(self.limiter.reserve(test_url), 60.0)
+
+    def test_forbidden_is_not_always_rate_limited(self):
+        resp = make_response(status_code=403, text="Resource not accessible")
+        self.limiter.update(test_url, resp)
+
+        self.assertFalse(RateLimiter.is_rate_limited(resp))
+        self.assertEqual(self.limiter.reserve(test_url), 0)
+
+    def test_secondary_rate_limit(self):
+        resp = make_response(
+            status_code=403, text="You have exceeded a secondary rate limit"
+        )
+        self.limiter.update(test_url, resp)
+
+        self.assertTrue(RateLimiter.is_rate_limited(resp))
+        self.assertEqual(self.limiter.reserve(test_url), 60.0)
+
+    def test_wait_longer_than_max_wait(self):
+        headers = {
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": "9000",
+        }
+        self.limiter.update(test_url, make_response(headers=headers))
+
+        with pytest.raises(RateLimitExceeded):
+            self.limiter.reserve(test_url)
+
+
+@responses.activate
+def test_get_request_retries_rate_limited_request():
+    sleep = MagicMock()
+    responses.add(responses.GET, test_url, status=429, headers={"Retry-After": "5"})
+    responses.add(responses.GET, test_url, json={"Response": "OK"}, status=200)
+
+    with patch("tag_bot.http_requests._rate_limiter", RateLimiter(sleep=sleep)):
+        resp = get_request(test_url, output="json")
+
+    assert resp == {"Response": "OK"}
+    assert len(responses.calls) == 2
+    sleep.assert_called_once()
+    assert sleep.call_args[0][0] == pytest.approx(5, abs=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
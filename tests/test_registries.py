@@ -0,0 +1,185 @@
+import threading
+import time
+from importlib.metadata import EntryPoint
+from unittest.mock import patch
+
+import pytest
+
+from tag_bot.main import UpdateImageTags
+from tag_bot.parse_image_tags import ImageTags
+from tag_bot.registries import (
+    DockerHubBackend,
+    GhcrBackend,
+    OciBackend,
+    QuayIoBackend,
+    RegistryBackend,
+    _load_backend_classes,
+    get_backend_class,
+    get_registry_host,
+)
+
+
+class InternalBackend(RegistryBackend):
+    hosts = ("registry.internal", "quay.io")
+    max_concurrency = 1
+
+    def list_tags(self, image, tag_filter=None):
+        yield from ["latest", "2.0", "1.0"]
+
+
+def make_entry_point(value):
+    return EntryPoint(name="internal", value=value, group="tag_bot.registries")
+
+
+def test_get_registry_host():
+    assert get_registry_host("image_owner/image_name") == "hub.docker.com"
+    assert get_registry_host("quay.io/image_owner/image_name") == "quay.io"
+    assert get_registry_host("localhost:5000/image_name") == "localhost:5000"
+    assert get_registry_host("docker.io/image_owner/image_name") == "hub.docker.com"
+    assert get_registry_host("index.docker.io/image_name") == "hub.docker.com"
+
+
+def test_get_backend_class_builtin():
+    with patch("tag_bot.registries._backend_classes", None), patch(
+        "tag_bot.registries.entry_points", return_value=[]
+    ):
+        assert get_backend_class("hub.docker.com") is DockerHubBackend
+        assert get_backend_class("quay.io") is QuayIoBackend
+        assert get_backend_class("ghcr.io") is GhcrBackend
+        assert get_backend_class("registry.example.com") is OciBackend
+
+
+def test_load_backend_classes_from_entry_points():
+    entry_point = make_entry_point(f"{__name__}:InternalBackend")
+
+    with patch("tag_bot.registries.entry_points", return_value=[entry_point]):
+        backend_classes = _load_backend_classes()
+
+    # Registered backends replace the built-in backend of the same host
+    assert backend_classes["registry.internal"] is InternalBackend
+    assert backend_classes["quay.io"] is InternalBackend
+    assert backend_classes["ghcr.io"] is GhcrBackend
+
+
+def test_load_backend_classes_skips_broken_entry_point():
+    entry_point = make_entry_point(f"{__name__}:MissingBackend")
+
+    with patch("tag_bot.registries.entry_points", return_value=[entry_point]):
+        backend_classes = _load_backend_classes()
+
+    assert backend_classes["quay.io"] is QuayIoBackend
+
+
+def test_get_repository_and_manifest_location():
+    dockerhub = DockerHubBackend("hub.docker.com")
+    oci = OciBackend("localhost:5000")
+
+    assert dockerhub.get_repository("owner/image") == "owner/image"
+    assert dockerhub.get_manifest_location("owner/image") == (
+        "registry-1.docker.io",
+        "owner/image",
+    )
+    assert oci.get_repository("localhost:5000/owner/image") == "owner/image"
+    assert oci.get_manifest_location("localhost:5000/owner/image") == (
+        "localhost:5000",
+        "owner/image",
+    )
+
+
+def test_dockerhub_accepts_owner_and_name_only():
+    dockerhub = DockerHubBackend("hub.docker.com")
+
+    assert dockerhub.accepts("owner/image")
+    assert dockerhub.accepts("docker.io/owner/image")
+    assert not dockerhub.accepts("owner/group/image")
+
+
+def test_dockerhub_get_repository_normalises_name():
+    dockerhub = DockerHubBackend("hub.docker.com")
+
+    assert dockerhub.get_repository("docker.io/owner/image") == "owner/image"
+    assert dockerhub.get_repository("registry-1.docker.io/owner/image") == (
+        "owner/image"
+    )
+    assert dockerhub.get_repository("index.docker.io/image") == "library/image"
+    assert dockerhub.get_repository("image") == "library/image"
+    assert dockerhub._get_url("docker.io/image") == (
+        "https://hub.docker.com/v2/repositories/library/image/tags"
+    )
+
+
+def test_backend_rate_limit_is_applied():
+    class LimitedBackend(InternalBackend):
+        rate_limit = 5
+
+    with patch("tag_bot.registries.set_rate_limit") as mock_set_rate_limit:
+        LimitedBackend("registry.internal")
+
+    mock_set_rate_limit.assert_called_once_with("registry.internal", 5)
+
+
+def test_get_remote_tags_respects_backend_concurrency():
+    main = UpdateImageTags(
+        "octocat/octocat",
+        "ThIs_Is_A_t0k3n",
+        "config/config.yaml",
+        [{"values_path": ".singleuser.image"}],
+        max_concurrency_per_host=4,
+    )
+    image_parser = ImageTags(main, "octocat/octocat", "main")
+    image_parser.image_tags = {
+        (f"registry.internal/owner/image{i}", None): {
+            "current": "1.0",
+            "tag_filter": None,
+        }
+        for i in range(4)
+    }
+    lock = threading.Lock()
+    running = []
+    max_running = []
+
+    def list_tags(self, image, tag_filter=None):
+        with lock:
+            running.append(image)
+            max_running.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(image)
+        return ["2.0"]
+
+    with patch(
+        "tag_bot.parse_image_tags.get_backend_class", return_value=InternalBackend
+    ), patch.object(InternalBackend, "list_tags", new=list_tags):
+        image_parser._get_remote_tags()
+
+    assert max(max_running) == 1
+    for tags in image_parser.image_tags.values():
+        assert tags["latest"] == "2.0"
+
+
+def test_registry_backend_requires_list_tags():
+    class IncompleteBackend(RegistryBackend):
+        hosts = ("registry.internal",)
+
+    with pytest.raises(TypeError):
+        IncompleteBackend("registry.internal")
+
+
+def test_github_token_only_given_to_backends_using_it():
+    main = UpdateImageTags(
+        "octocat/octocat",
+        "ThIs_Is_A_t0k3n",
+        "config/config.yaml",
+        [{"values_path": ".singleuser.image"}],
+    )
+    image_parser = ImageTags(main, "octocat/octocat", "main")
+
+    with patch("tag_bot.registries._backend_classes", None), patch(
+        "tag_bot.registries.entry_points",
+        return_value=[make_entry_point(f"{__name__}:InternalBackend")],
+    ):
+        ghcr = image_parser._get_backend("ghcr.io/owner/image")
+        internal = image_parser._get_backend("registry.internal/owner/image")
+
+    assert ghcr.auth_headers == main.headers
+    assert internal.auth_headers == {}
@@ -0,0 +1,109 @@
+import os
+import tempfile
+
+from tag_bot.tag_cache import (
+    EXPIRED,
+    FRESH,
+    STALE,
+    DigestStore,
+    TagCache,
+    configure_tag_cache,
+    get_tag_cache,
+)
+from tag_bot.tag_filter import TagFilter
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_load_missing_entry_is_expired():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tag_cache = TagCache(cache_dir, ttl=60)
+
+        assert tag_cache.load("hub.docker.com", "owner/image", None) == (None, EXPIRED)
+
+
+def test_load_fresh_stale_and_expired():
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tag_cache = TagCache(cache_dir, ttl=60, stale_ttl=30, clock=clock)
+        tag_cache.store("hub.docker.com", "owner/image", None, "1.0")
+
+        clock.now += 59
+        assert tag_cache.load("hub.docker.com", "owner/image", None) == ("1.0", FRESH)
+
+        clock.now += 30
+        assert tag_cache.load("hub.docker.com", "owner/image", None) == ("1.0", STALE)
+
+        clock.now += 1
+        assert tag_cache.load("hub.docker.com", "owner/image", None) == (None, EXPIRED)
+
+
+def test_key_depends_on_host_image_and_filter():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tag_cache = TagCache(cache_dir, ttl=60)
+        tag_cache.store(
+            "hub.docker.com", "owner/image", TagFilter(regexpr="1.*"), "1.9"
+        )
+
+        def state(host, tag_filter):
+            return tag_cache.load(host, "owner/image", tag_filter)[1]
+
+        assert state("hub.docker.com", TagFilter(regexpr="1.*")) == FRESH
+        assert state("hub.docker.com", TagFilter(regexpr="2.*")) == EXPIRED
+        assert state("hub.docker.com", None) == EXPIRED
+        assert state("quay.io", TagFilter(regexpr="1.*")) == EXPIRED
+
+
+def test_store_leaves_no_temporary_files():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tag_cache = TagCache(cache_dir, ttl=60)
+        tag_cache.store("hub.docker.com", "owner/image", None, "1.0")
+        tag_cache.store("hub.docker.com", "owner/image", None, "1.1")
+
+        assert len(os.listdir(cache_dir)) == 1
+        assert tag_cache.load("hub.docker.com", "owner/image", None) == ("1.1", FRESH)
+
+
+def test_configure_tag_cache_requires_ttl():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        configure_tag_cache(cache_dir, ttl=0)
+        assert get_tag_cache() is None
+
+        configure_tag_cache(cache_dir, ttl=60)
+        assert isinstance(get_tag_cache(), TagCache)
+
+        configure_tag_cache()
+        assert get_tag_cache() is None
+
+
+def test_digest_store_round_trip():
+    digests = {"1.0": "sha256:abc", "latest": "sha256:def"}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        digest_store = DigestStore(cache_dir)
+
+        assert digest_store.load("quay.io", "owner/image", None) == (None, None)
+
+        digest_store.store("quay.io", "owner/image", None, "1.0", digests)
+
+        assert digest_store.load("quay.io", "owner/image", None) == ("1.0", digests)
+        assert digest_store.load("quay.io", "owner/other", None) == (None, None)
+
+
+def test_digest_store_ignores_old_digests():
+    digests = {"1.0": "sha256:abc", "latest": "sha256:def"}
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        digest_store = DigestStore(cache_dir, max_age=60, clock=clock)
+        digest_store.store("quay.io", "owner/image", None, "1.0", digests)
+
+        clock.now += 59
+        assert digest_store.load("quay.io", "owner/image", None) == ("1.0", digests)
+
+        clock.now += 1
+        assert digest_store.load("quay.io", "owner/image", None) == (None, None)
@@ -0,0 +1,58 @@
+import pytest
+
+from tag_bot.tag_filter import TagFilter, get_literal_prefix
+
+
+@pytest.mark.parametrize(
+    "regexpr, prefix",
+    [
+        ("python-3\\.[0-9]+", "python-3."),
+        ("^cuda-[0-9]+", "cuda-"),
+        ("[0-9]{4}.[0-9]{2}.[0-9]{2}", None),
+        ("py3?-x", "py"),
+        ("ab+c", "ab"),
+        ("a|b", None),
+        ("v\\d+", "v"),
+    ],
+)
+def test_get_literal_prefix(regexpr, prefix):
+    assert get_literal_prefix(regexpr) == prefix
+
+
+def test_from_image_info_without_filter():
+    assert TagFilter.from_image_info({"values_path": ".singleuser.image"}) is None
+
+
+def test_from_image_info():
+    tag_filter = TagFilter.from_image_info(
+        {
+            "values_path": ".singleuser.image",
+            "regexpr": "python-3\\.[0-9]+",
+            "exclude": ["*-rc*"],
+        }
+    )
+
+    assert tag_filter.prefix == "python-3."
+    assert tag_filter.matches("python-3.11")
+    assert not tag_filter.matches("python-3.12-rc1")
+    assert not tag_filter.matches("cuda-12")
+
+
+def test_matches_include():
+    tag_filter = TagFilter(include=["python-*", "r-*"])
+
+    assert tag_filter.matches("python-3.11")
+    assert tag_filter.matches("r-4.3")
+    assert not tag_filter.matches("cuda-12")
+
+
+def test_matches_prefix():
+    tag_filter = TagFilter(prefix="cuda-")
+
+    assert tag_filter.matches("cuda-12")
+    assert not tag_filter.matches("python-cuda-12")
+
+
+def test_invalid_sort():
+    with pytest.raises(ValueError):
+        TagFilter(sort="alphabetical")
@@ -0,0 +1,101 @@
+from tag_bot.tag_filter import TagFilter
+from tag_bot.tag_selector import TagSelector, natural_sort_key, semver_sort_key
+
+
+def test_natural_sort_key():
+    tags = ["1.10.0", "1.9.0", "1.2.0", "2022.06.09"]
+
+    assert sorted(tags, key=natural_sort_key) == [
+        "1.2.0",
+        "1.9.0",
+        "1.10.0",
+        "2022.06.09",
+    ]
+
+
+def test_select_newest_first_stops_at_first_candidate():
+    consumed = []
+
+    def tags():
+        for name in ["latest", "new_tag", "old_tag"]:
+            consumed.append(name)
+            yield name
+
+    selector = TagSelector()
+
+    assert selector.select(tags()) == "new_tag"
+    assert selector.done
+    assert consumed == ["latest", "new_tag"]
+
+
+def test_select_with_filter():
+    selector = TagSelector(TagFilter(regexpr="[0-9]{4}.[0-9]{2}.[0-9]{2}"))
+
+    assert selector.select(["latest", "sha-1a2b3c", "2022.06.09"]) == "2022.06.09"
+
+
+def test_select_single_candidate():
+    assert TagSelector().select(["latest", "only_tag"]) == "only_tag"
+
+
+def test_select_no_candidates():
+    assert TagSelector().select([]) is None
+    assert TagSelector().select(["latest"]) is None
+    assert TagSelector(TagFilter(regexpr="[0-9]+")).select(["latest", "main"]) is None
+
+
+def test_select_with_key_reads_every_tag():
+    selector = TagSelector(key=natural_sort_key)
+
+    assert selector.select(["1.9.0", "latest", "1.10.0", "1.2.0"]) == "1.10.0"
+    assert not selector.done
+
+
+def test_feed_across_pages():
+    selector = TagSelector(TagFilter(regexpr="[0-9.]+$"), key=natural_sort_key)
+
+    for page in [["0.1", "main"], ["0.3", "latest"], ["0.2"]]:
+        for name in page:
+            selector.feed(name)
+
+    assert selector.best == "0.3"
+
+
+def test_semver_sort_key():
+    tags = ["1.10.0", "v1.9.0", "1.10.0-rc.1", "1.10.0-beta", "1.10.0-rc.10", "0.9.9"]
+
+    assert sorted(tags, key=semver_sort_key) == [
+        "0.9.9",
+        "v1.9.0",
+        "1.10.0-beta",
+        "1.10.0-rc.1",
+        "1.10.0-rc.10",
+        "1.10.0",
+    ]
+
+
+def test_semver_sort_key_not_semver():
+    assert semver_sort_key("latest") is None
+    assert semver_sort_key("2022.06.09-1") is None
+    assert semver_sort_key("1.2") is None
+
+
+def test_select_semver_ignores_push_order():
+    # An older patch release re-pushed most recently is not selected
+    selector = TagSelector(TagFilter(sort="semver"))
+
+    assert (
+        selector.select(["1.2.3", "latest", "1.3.1", "sha-1a2b3c", "1.3.0"]) == "1.3.1"
+    )
+
+
+def test_select_semver_with_regexpr():
+    selector = TagSelector(TagFilter(regexpr="1\\.2\\.", sort="semver"))
+
+    assert selector.select(["1.3.0", "1.2.10", "1.2.9"]) == "1.2.10"
+
+
+def test_select_semver_overrides_default_key():
+    selector = TagSelector(TagFilter(sort="semver"), key=natural_sort_key)
+
+    assert selector.select(["1.0.0-rc.1", "1.0.0", "main"]) == "1.0.0"
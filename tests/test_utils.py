@@ -1,20 +1,29 @@
 import unittest
 
-from tag_bot.utils import read_config_with_yq, update_config_with_yq
+from ruamel.yaml.scalarstring import DoubleQuotedScalarString
+
+from tag_bot.utils import (
+    parse_path,
+    read_config_values,
+    read_yaml_values,
+    splice_config_values,
+    update_config_values,
+)
+from tag_bot.yaml_parser import YamlParser
 
 
 class TestUtilityFunctions(unittest.TestCase):
-    def test_read_config_with_yq_singleuser(self):
+    def test_read_config_values_singleuser(self):
         var_path = ".singleuser.image"
         config = {"singleuser": {"image": {"name": "my_image", "tag": "my_tag"}}}
 
         expected_value = {"name": "my_image", "tag": "my_tag"}
 
-        value = read_config_with_yq(config, var_path)
+        value = read_config_values(config, [var_path])[var_path]
 
         self.assertDictEqual(value, expected_value)
 
-    def test_read_config_with_yq_profileList(self):
+    def test_read_config_values_profileList(self):
         var_path = ".singleuser.profileList[0].kubespawner_override.image"
         config = {
             "singleuser": {
@@ -24,11 +33,11 @@ class TestUtilityFunctions(unittest.TestCase):
 
         expected_value = "owner/name:tag"
 
-        value = read_config_with_yq(config, var_path)
+        value = read_config_values(config, [var_path])[var_path]
 
         self.assertEqual(value, expected_value)
 
-    def test_update_config_with_yq_singleuser(self):
+    def test_update_config_values_singleuser(self):
         test_config = {
             "singleuser": {"image": {"name": "image_name", "tag": "old_tag"}}
         }
@@ -36,14 +45,16 @@ class TestUtilityFunctions(unittest.TestCase):
             "image_name": {
                 "current": "old_tag",
                 "latest": "new_tag",
-                "path": ".singleuser.image.tag",
+                "paths": {".singleuser.image.tag": "old_tag"},
             }
         }
 
-        new_config = update_config_with_yq(
+        new_config = update_config_values(
             test_config,
-            test_image_tags["image_name"]["path"],
-            test_image_tags["image_name"]["latest"],
+            {
+                path: test_image_tags["image_name"]["latest"]
+                for path in test_image_tags["image_name"]["paths"].keys()
+            },
         )
 
         expected_output = {
@@ -52,7 +63,7 @@ class TestUtilityFunctions(unittest.TestCase):
 
         self.assertDictEqual(new_config, expected_output)
 
-    def test_update_config_with_yq_profileList(self):
+    def test_update_config_values_profileList(self):
         test_config = {
             "singleuser": {
                 "profileList": [
@@ -64,13 +75,16 @@ class TestUtilityFunctions(unittest.TestCase):
             "image_name": {
                 "current": "old_tag",
                 "latest": "new_tag",
-                "path": ".singleuser.profileList[0].kubespawner_override.image",
+                "paths": {
+                    ".singleuser.profileList[0].kubespawner_override.image": "old_tag"
+                },
             }
         }
 
         new_tag = ":".join(["image_name", test_image_tags["image_name"]["latest"]])
-        new_config = update_config_with_yq(
-            test_config, test_image_tags["image_name"]["path"], new_tag
+        new_config = update_config_values(
+            test_config,
+            {path: new_tag for path in test_image_tags["image_name"]["paths"].keys()},
         )
 
         expected_output = {
@@ -83,6 +97,269 @@ class TestUtilityFunctions(unittest.TestCase):
 
         self.assertDictEqual(new_config, expected_output)
 
+    def test_parse_path(self):
+        self.assertEqual(parse_path("."), [])
+        self.assertEqual(parse_path(".singleuser.image"), ["singleuser", "image"])
+        self.assertEqual(
+            parse_path(".singleuser.profileList[0].kubespawner_override.image"),
+            ["singleuser", "profileList", 0, "kubespawner_override", "image"],
+        )
+        self.assertEqual(parse_path(".images[-1]"), ["images", -1])
+        self.assertEqual(
+            parse_path('.hub."config.json".image'), ["hub", "config.json", "image"]
+        )
+        self.assertEqual(parse_path('.hub["config.json"]'), ["hub", "config.json"])
+        self.assertEqual(parse_path(".hub['config.json']"), ["hub", "config.json"])
+
+    def test_parse_path_invalid(self):
+        for var_path in [
+            "singleuser.image",
+            ".singleuser..image",
+            ".images[x]",
+            '.hub."x',
+        ]:
+            with self.subTest(var_path=var_path):
+                self.assertRaises(ValueError, parse_path, var_path)
+
+    def test_read_config_values_missing(self):
+        config = {"singleuser": {"profileList": [{"image": "owner/name:tag"}]}}
+        var_paths = [
+            ".hub.image",
+            ".singleuser.profileList[1].image",
+            ".singleuser.profileList.image",
+        ]
+
+        values = read_config_values(config, var_paths)
+
+        self.assertDictEqual(values, {var_path: None for var_path in var_paths})
+
+    def test_read_config_values(self):
+        config = {
+            "singleuser": {
+                "image": {"name": "owner/name", "tag": "tag"},
+                "profileList": [
+                    {"kubespawner_override": {"image": "owner/name1:tag1"}},
+                    {"kubespawner_override": {"image": "owner/name2:tag2"}},
+                ],
+            }
+        }
+        var_paths = [
+            ".singleuser.image",
+            ".singleuser.image.tag",
+            ".singleuser.profileList[0].kubespawner_override.image",
+            ".singleuser.profileList[1].kubespawner_override.image",
+            ".singleuser.profileList[2].kubespawner_override.image",
+        ]
+
+        values = read_config_values(config, var_paths)
+
+        self.assertDictEqual(
+            values,
+            {
+                ".singleuser.image": {"name": "owner/name", "tag": "tag"},
+                ".singleuser.image.tag": "tag",
+                ".singleuser.profileList[0].kubespawner_override.image": "owner/name1:tag1",
+                ".singleuser.profileList[1].kubespawner_override.image": "owner/name2:tag2",
+                ".singleuser.profileList[2].kubespawner_override.image": None,
+            },
+        )
+
+    def test_read_yaml_values(self):
+        text = (
+            "singleuser:\n"
+            "  image: {name: owner/name, tag: '1.0'}  # comment\n"
+            "  profileList:\n"
+            "    - kubespawner_override:\n"
+            "        image: owner/name1:tag1\n"
+            "    - [unrelated, list]\n"
+            "  other: {a: [1, 2]}\n"
+            "hub:\n"
+            "  image:\n"
+            "    tag: 2023\n"
+            "hub:\n"
+            "  ignored: duplicate\n"
+        )
+        var_paths = [
+            ".singleuser.image",
+            ".singleuser.image.tag",
+            ".singleuser.profileList[0].kubespawner_override.image",
+            ".singleuser.profileList[2].kubespawner_override.image",
+            ".hub.image.tag",
+            ".hub.ignored",
+            ".missing.image",
+        ]
+
+        values = read_yaml_values(text, var_paths)
+
+        # The values match those read from the whole config
+        self.assertDictEqual(
+            values,
+            read_config_values(YamlParser().yaml_string_to_object(text), var_paths),
+        )
+        self.assertDictEqual(
+            values,
+            {
+                ".singleuser.image": {"name": "owner/name", "tag": "1.0"},
+                ".singleuser.image.tag": "1.0",
+                ".singleuser.profileList[0].kubespawner_override.image": "owner/name1:tag1",
+                ".singleuser.profileList[2].kubespawner_override.image": None,
+                ".hub.image.tag": 2023,
+                ".hub.ignored": None,
+                ".missing.image": None,
+            },
+        )
+
+    def test_read_yaml_values_not_lazy(self):
+        for text, var_path in [
+            ("a: &a {tag: x}\nb: *a\n", ".b.tag"),
+            ("a: &a {tag: x}\nb:\n  <<: *a\n", ".b.tag"),
+            ("a: [x, y]\n", ".a[-1]"),
+            ("image: !custom foo:1\n", ".image"),
+        ]:
+            with self.subTest(text=text):
+                self.assertIsNone(read_yaml_values(text, [var_path]))
+
+    def test_update_config_values_creates_missing_keys(self):
+        config = {"singleuser": {}}
+
+        new_config = update_config_values(config, {".singleuser.image.tag": "new_tag"})
+
+        self.assertDictEqual(new_config, {"singleuser": {"image": {"tag": "new_tag"}}})
+
+    def test_update_config_values_index_past_end(self):
+        config = {"singleuser": {"profileList": [{"image": "owner/name:tag"}]}}
+
+        self.assertRaises(
+            IndexError,
+            update_config_values,
+            config,
+            {".singleuser.profileList[1].image": "owner/name:new_tag"},
+        )
+
+    def test_update_config_values(self):
+        yaml = YamlParser()
+        config = yaml.yaml_string_to_object(
+            "singleuser:\n"
+            "  image:\n"
+            "    name: owner/name\n"
+            "    tag: 'old_tag'\n"
+            "  profileList:\n"
+            "    - kubespawner_override:\n"
+            "        image: owner/name1:old_tag1  # comment\n"
+            "    - kubespawner_override:\n"
+            "        image: owner/name2:old_tag2\n"
+        )
+
+        new_config = update_config_values(
+            config,
+            {
+                ".singleuser.image.tag": "new_tag",
+                ".singleuser.profileList[0].kubespawner_override.image": "owner/name1:new_tag1",
+                ".singleuser.profileList[1].kubespawner_override.image": "owner/name2:new_tag2",
+            },
+        )
+
+        self.assertEqual(
+            yaml.object_to_yaml_str(new_config),
+            "singleuser:\n"
+            "  image:\n"
+            "    name: owner/name\n"
+            "    tag: 'new_tag'\n"
+            "  profileList:\n"
+            "    - kubespawner_override:\n"
+            "        image: owner/name1:new_tag1  # comment\n"
+            "    - kubespawner_override:\n"
+            "        image: owner/name2:new_tag2\n",
+        )
+
+    def test_update_config_values_index_out_of_range(self):
+        config = {"singleuser": {"profileList": []}}
+
+        self.assertRaises(
+            IndexError,
+            update_config_values,
+            config,
+            {".singleuser.profileList[0].kubespawner_override.image": "owner/name:tag"},
+        )
+
+    def test_splice_config_values(self):
+        yaml = YamlParser()
+        text = (
+            "# JupyterHub config\n"
+            "singleuser:\n"
+            "    image:\n"
+            "        name: owner/name  # the image\n"
+            '        tag: "old_tag"\n'
+            "    profileList:\n"
+            "      - kubespawner_override:\n"
+            "          image: 'owner/name1:old_tag1'\n"
+            "      - owner/name2:old_tag2\n"
+        )
+        config = yaml.yaml_string_to_object(text)
+
+        new_text = splice_config_values(
+            text,
+            config,
+            {
+                ".singleuser.image.tag": "new_tag",
+                ".singleuser.profileList[0].kubespawner_override.image": "owner/name1:new_tag1",
+                ".singleuser.profileList[1]": "2024",
+            },
+        )
+
+        self.assertEqual(
+            new_text,
+            "# JupyterHub config\n"
+            "singleuser:\n"
+            "    image:\n"
+            "        name: owner/name  # the image\n"
+            '        tag: "new_tag"\n'
+            "    profileList:\n"
+            "      - kubespawner_override:\n"
+            "          image: 'owner/name1:new_tag1'\n"
+            # A plain scalar that would be read back as a number is quoted
+            "      - '2024'\n",
+        )
+
+    def test_splice_config_values_not_located(self):
+        yaml = YamlParser()
+        text = (
+            "singleuser:\n"
+            "  image: {name: owner/name, tag: old_tag}\n"
+            "  profileList:\n"
+            "    - image: &image owner/name:old_tag\n"
+            "    - image: owner/name\n"
+            "        :old_tag\n"
+        )
+        config = yaml.yaml_string_to_object(text)
+
+        for var_path in [
+            ".singleuser.image.tag",
+            ".singleuser.profileList[0].image",
+            ".singleuser.profileList[1].image",
+            ".singleuser.profileList[2].image",
+        ]:
+            with self.subTest(var_path=var_path):
+                self.assertIsNone(
+                    splice_config_values(text, config, {var_path: "new_tag"})
+                )
+
+    def test_update_config_values_keeps_quotes(self):
+        yaml = YamlParser()
+        config = yaml.yaml_string_to_object(
+            'singleuser:\n  image:\n    name: owner/name\n    tag: "old_tag"  # pinned\n'
+        )
+
+        new_config = update_config_values(config, {".singleuser.image.tag": "new_tag"})
+
+        self.assertIsInstance(
+            new_config["singleuser"]["image"]["tag"], DoubleQuotedScalarString
+        )
+        self.assertEqual(
+            yaml.object_to_yaml_str(new_config),
+            'singleuser:\n  image:\n    name: owner/name\n    tag: "new_tag"  # pinned\n',
+        )
+
 
 if __name__ == "__main__":
     unittest.main()